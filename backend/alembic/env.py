@@ -11,7 +11,7 @@ import sys
 from app.core.config import settings
 from app.core.database import Base
 # Import all models to ensure they are registered with Base.metadata
-from app.models import user_pref_model, notes_model, chat_model, token_usage_model
+from app.models import user_pref_model, notes_model, chat_model, token_usage_model, generation_job_model
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,37 @@
+"""Add notes snippet and keyset index
+
+Revision ID: 7b2e4d9c1a05
+Revises: 3f86a13c48f1
+Create Date: 2026-10-19 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7b2e4d9c1a05'
+down_revision: Union[str, Sequence[str], None] = '3f86a13c48f1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column('notes_snippet', sa.String(length=200), nullable=True))
+    # Backfill previews for existing rows once, instead of on every list request
+    op.execute("UPDATE notes SET notes_snippet = substr(notes, 1, 200)")
+    op.create_index(
+        'ix_notes_user_created',
+        'notes',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_notes_user_created', table_name='notes')
+    op.drop_column('notes', 'notes_snippet')
@@ -0,0 +1,124 @@
+"""Move transcripts to compressed table
+
+Revision ID: a4c81f3e9d27
+Revises: 7b2e4d9c1a05
+Create Date: 2026-10-19 11:03:17.550912
+
+"""
+from typing import Sequence, Union
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c81f3e9d27'
+down_revision: Union[str, Sequence[str], None] = '7b2e4d9c1a05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+
+def _compress(text: str) -> tuple[str, bytes]:
+    raw = text.encode("utf-8")
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def _decompress(codec: str, payload: bytes) -> str:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(payload).decode("utf-8")
+    return zlib.decompress(payload).decode("utf-8")
+
+
+def _restore_keyset_index() -> None:
+    """Batch mode recreates ix_notes_user_created on SQLite without its DESC columns."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_notes_user_created")
+    op.create_index(
+        'ix_notes_user_created',
+        'notes',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_transcripts',
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('codec', sa.String(length=10), nullable=False),
+    sa.Column('raw_length', sa.Integer(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('note_id')
+    )
+
+    # Backfill in keyset batches so large tables are never loaded at once
+    connection = op.get_bind()
+    transcripts = sa.table(
+        'note_transcripts',
+        sa.column('note_id', sa.Integer),
+        sa.column('codec', sa.String),
+        sa.column('raw_length', sa.Integer),
+        sa.column('data', sa.LargeBinary),
+    )
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text(
+                "SELECT id, transcript FROM notes "
+                "WHERE id > :last_id AND transcript IS NOT NULL AND transcript != '' "
+                "ORDER BY id LIMIT :batch_size"
+            ),
+            {"last_id": last_id, "batch_size": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        batch = []
+        for note_id, transcript in rows:
+            codec, payload = _compress(transcript)
+            batch.append({"note_id": note_id, "codec": codec, "raw_length": len(transcript), "data": payload})
+        op.bulk_insert(transcripts, batch)
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.drop_column('transcript')
+    _restore_keyset_index()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.add_column(sa.Column('transcript', sa.String(), nullable=True))
+    _restore_keyset_index()
+
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.text(
+                "SELECT note_id, codec, data FROM note_transcripts "
+                "WHERE note_id > :last_id ORDER BY note_id LIMIT :batch_size"
+            ),
+            {"last_id": last_id, "batch_size": BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        for note_id, codec, payload in rows:
+            connection.execute(
+                sa.text("UPDATE notes SET transcript = :transcript WHERE id = :note_id"),
+                {"transcript": _decompress(codec, payload), "note_id": note_id}
+            )
+        last_id = rows[-1][0]
+
+    op.drop_table('note_transcripts')
@@ -0,0 +1,69 @@
+"""Add notes full text search
+
+Revision ID: c9d35e7f2b14
+Revises: a4c81f3e9d27
+Create Date: 2026-10-19 12:41:05.207733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d35e7f2b14'
+down_revision: Union[str, Sequence[str], None] = 'a4c81f3e9d27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("""
+            ALTER TABLE notes ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(notes, '')), 'B')
+            ) STORED
+        """)
+        op.execute("CREATE INDEX ix_notes_search_vector ON notes USING GIN (search_vector)")
+        return
+
+    op.execute("""
+        CREATE VIRTUAL TABLE notes_fts USING fts5(
+            title, notes, content='notes', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    op.execute("""
+        CREATE TRIGGER notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER notes_fts_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, title, notes) VALUES ('delete', old.id, old.title, old.notes);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER notes_fts_au AFTER UPDATE OF title, notes ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, title, notes) VALUES ('delete', old.id, old.title, old.notes);
+            INSERT INTO notes_fts(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+        END
+    """)
+    # Index the notes that already exist
+    op.execute("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_notes_search_vector")
+        op.execute("ALTER TABLE notes DROP COLUMN IF EXISTS search_vector")
+        return
+
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_au")
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_ad")
+    op.execute("DROP TRIGGER IF EXISTS notes_fts_ai")
+    op.execute("DROP TABLE IF EXISTS notes_fts")
@@ -0,0 +1,73 @@
+"""Make notes.created_at not null
+
+Revision ID: d2a7c4e91b36
+Revises: b6d1f0a2c847
+Create Date: 2026-10-19 19:42:17.604938
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a7c4e91b36'
+down_revision: Union[str, Sequence[str], None] = 'b6d1f0a2c847'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _restore_keyset_index() -> None:
+    """Batch mode recreates ix_notes_user_created on SQLite without its DESC columns."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("DROP INDEX IF EXISTS ix_notes_user_created")
+    op.create_index(
+        'ix_notes_user_created',
+        'notes',
+        ['user_id', sa.text('created_at DESC'), sa.text('id DESC')],
+        unique=False
+    )
+
+
+def _restore_search_triggers() -> None:
+    """Batch mode rebuilds notes on SQLite, which drops the full-text search triggers."""
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+            INSERT INTO notes_fts(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, title, notes) VALUES ('delete', old.id, old.title, old.notes);
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF title, notes ON notes BEGIN
+            INSERT INTO notes_fts(notes_fts, rowid, title, notes) VALUES ('delete', old.id, old.title, old.notes);
+            INSERT INTO notes_fts(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+        END
+    """)
+    # Catch up on anything written while the triggers were missing
+    op.execute("INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Keyset pagination compares on created_at, so rows without one would be skipped
+    op.execute("UPDATE notes SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP) WHERE created_at IS NULL")
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+    _restore_keyset_index()
+    _restore_search_triggers()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('notes') as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+    _restore_keyset_index()
+    _restore_search_triggers()
@@ -2,12 +2,14 @@ from datetime import timedelta, date
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
-import traceback
 from app.core.database import get_db
 from app.core.auth import create_access_token, create_refresh_token, verify_token, get_current_user
 from app.core.config import settings
 from app.models.user_pref_model import UserCreate, UserResponse, UserLogin, Token, TokenData, User
 from app.services.user_service import UserService
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
 
 router = APIRouter()
 
@@ -31,8 +33,7 @@ async def register_user(
     except HTTPException:
         raise
     except Exception as e:
-        print(f"ERROR registering user: {e}")
-        traceback.print_exc()
+        logger.exception("Error registering user")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to create user: {str(e)}"
@@ -226,15 +227,10 @@ async def get_token_usage(
     """
     Get current user's token usage for today.
     """
-    from app.models.token_usage_model import TokenUsage
+    from app.core.limits import tokens_used as get_tokens_used
     
     today = date.today()
-    usage = db.query(TokenUsage).filter(
-        TokenUsage.user_id == current_user.id,
-        TokenUsage.date == today
-    ).first()
-    
-    tokens_used = usage.tokens_used if usage else 0
+    tokens_used = get_tokens_used(current_user.id, db)
     tokens_remaining = settings.DAILY_TOKEN_LIMIT - tokens_used
     
     return {
@@ -1,73 +1,155 @@
-from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from app.core.database import get_db
-from app.models.notes_model import NoteRequest, NoteResponse, NoteSummary, Notes
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from sqlalchemy.orm import Session, undefer, joinedload
+from app.core.database import get_db, SessionLocal
+from app.models.notes_model import NoteRequest, NoteBatchRequest, NoteBulkRequest, NoteResponse, NoteSummary, NoteSearchResult, NoteSemanticResult, NoteUpdate, Notes
 from app.services.youtube_service import YouTubeService
-from app.services.llm_service import LLMService
+from app.services.llm_service import LLMService, get_llm_service
 from datetime import datetime
 
 router = APIRouter()
-llm_service = LLMService()
 
-from typing import List
+from typing import List, Literal, Optional
 from app.core.auth import get_current_user
 # from app.services.user_service import get_user_by_id
 from app.models.user_pref_model import User
 
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from app.models.token_usage_model import TokenUsage
-from datetime import date
 from app.core.config import settings
+from app.services.export_service import ExportService, EXPORT_FORMATS
+from app.services.search_service import SearchService
+from app.utils.http_cache import make_etag, cache_headers, is_not_modified
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.core.metrics import CACHE_HITS, CACHE_MISSES, GENERATION_TTFB_SECONDS, GENERATION_SECONDS
+from app.core.tracing import span, set_attributes
+from app.core.limits import Reservation, reserve_tokens, record_tokens
+from app.core.budget import budget_scope
+from app.models.generation_job_model import GenerationJob, GenerationJobResponse, JOB_ACTIVE_STATUSES
+from app.services.job_service import GenerationJobService, Job, JobQueueFull
+from app.services.stream_service import ResumableStream, ReplayExpired, StreamRegistry
+from app.services.bulk_service import BulkPipeline, BulkRegistry, PipelineItem, SkipItem, Stage
+from app.utils.sse import SSE_MEDIA_TYPE, SSE_HEADERS, wants_sse, last_event_id, format_event, format_comment
 
-def check_token_limit(user_id: int, db: Session):
-    today = date.today()
-    usage = db.query(TokenUsage).filter(
-        TokenUsage.user_id == user_id,
-        TokenUsage.date == today
-    ).first()
-    
-    if usage and usage.tokens_used >= settings.DAILY_TOKEN_LIMIT:
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+import asyncio
+import json
+import time
+import uuid
+from contextlib import aclosing
+from functools import partial
+
+def check_token_limit(user_id: int, db: Session, tokens: int = 0) -> Reservation:
+    """Reserve the estimated input `tokens` against the daily limit (just check it, for 0)."""
+    reservation = reserve_tokens(user_id, tokens, db)
+    if reservation is None:
         raise HTTPException(
             status_code=429, 
             detail=f"Daily token limit ({settings.DAILY_TOKEN_LIMIT}) exceeded. Try again tomorrow."
         )
-    return usage
+    return reservation
 
-def update_token_usage(user_id: int, tokens: int, db: Session):
-    today = date.today()
-    usage = db.query(TokenUsage).filter(
-        TokenUsage.user_id == user_id,
-        TokenUsage.date == today
-    ).first()
-    
-    if usage:
-        usage.tokens_used += tokens
+def update_token_usage(user_id: int, tokens: int, db: Session, reservation: Optional[Reservation] = None):
+    if reservation is not None:
+        reservation.settle(tokens, db)
     else:
-        usage = TokenUsage(
-            user_id=user_id,
-            date=today,
-            tokens_used=tokens
-        )
-        db.add(usage)
-    db.commit()
+        record_tokens(user_id, tokens, db)
+
+def charge_partial(user_id: int, input_tokens: int, output: str, db: Session, reservation: Optional[Reservation] = None):
+    """
+    Charge work that was cancelled, timed out or failed part-way: the input and
+    the output streamed so far were still spent. With no output yet, a
+    reservation is given back instead.
+    """
+    try:
+        if output:
+            update_token_usage(user_id, input_tokens + len(output) // 4, db, reservation)
+        elif reservation is not None:
+            reservation.release(db)
+    except Exception:
+        logger.exception("Error updating token usage", extra={"user_id": user_id})
 
 class ChatRequest(BaseModel):
     message: str
 
+def save_generated_note(
+    db: Session,
+    user_id: int,
+    video_id: str,
+    content: str,
+    transcript: str | None,
+    language: str,
+    style: str,
+    input_tokens: int,
+    reservation: Optional[Reservation] = None
+) -> int | None:
+    """Persist freshly generated notes, schedule their embeddings and record token usage."""
+    note_id = None
+    try:
+        with span("notes.save", {"notes.output_tokens": len(content) // 4}):
+            # Extract title from content (first line starting with #)
+            import re
+            title_match = re.search(r'^#\s+(.+)$', content, re.MULTILINE)
+            ai_title = title_match.group(1).strip() if title_match else f"Notes for {video_id}"
+
+            new_note = Notes(
+                video_id=video_id, 
+                title=ai_title, 
+                notes=content,
+                transcript=transcript,
+                language=language,
+                style=style,
+                user_id=user_id
+            )
+            db.add(new_note)
+            db.commit()
+            db.refresh(new_note)
+            note_id = new_note.id
+        
+        # Store embeddings for RAG (Background Task)
+        try:
+            from app.services.vector_service import VectorService
+            from fastapi.concurrency import run_in_threadpool
+            import asyncio
+            
+            vector_service = VectorService()
+            # Run in background to avoid blocking the stream completion
+            asyncio.create_task(run_in_threadpool(vector_service.store_note_chunks, new_note.id, content, transcript, user_id))
+        except Exception as vec_e:
+            logger.exception("Error scheduling embeddings", extra={"note_id": note_id})
+    except Exception as db_e:
+        logger.exception("Error saving notes to DB", extra={"video_id": video_id})
+        db.rollback()
+    
+    # Update token usage
+    output_tokens = len(content) // 4
+    total_tokens = input_tokens + output_tokens
+    try:
+        update_token_usage(user_id, total_tokens, db, reservation)
+    except Exception as token_e:
+        logger.exception("Error updating token usage", extra={"user_id": user_id})
+
+    return note_id
+
 @router.post("/generate")
 async def generate_notes(
     request: NoteRequest, 
+    http_request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    llm_service: LLMService = Depends(get_llm_service)
 ):
+    started = time.perf_counter()
+
     # 1. Extract Video ID
     video_id = YouTubeService.extract_video_id(request.url)
     if not video_id:
         raise HTTPException(status_code=400, detail="Invalid YouTube URL")
 
     # Check DB for existing notes for THIS user
-    existing_note = db.query(Notes).filter(
+    existing_note = db.query(Notes).options(undefer(Notes.notes)).filter(
         Notes.video_id == video_id,
         Notes.language == request.language,
         Notes.style == request.style,
@@ -75,29 +157,94 @@ async def generate_notes(
     ).first()
     
     if existing_note:
-        # Stream the existing content to match the generation behavior
-        async def stream_existing():
-            content = existing_note.notes
-            chunk_size = 1024
-            for i in range(0, len(content), chunk_size):
-                yield content[i:i + chunk_size]
-        
-        return StreamingResponse(stream_existing(), media_type="text/plain")
+        CACHE_HITS.labels("notes").inc()
+        set_attributes({"notes.cache": "hit", "note.id": existing_note.id})
+        # Already generated: send it as one sized response instead of a fake stream
+        return Response(
+            content=f"{existing_note.notes}\n\n<!-- NOTE_ID: {existing_note.id} -->",
+            media_type="text/plain",
+            headers=cache_headers(make_etag(existing_note.notes), existing_note.updated_at)
+        )
+
+    CACHE_MISSES.labels("notes").inc()
+    set_attributes({"notes.cache": "miss"})
 
     # 2. Check Token Limit
     check_token_limit(current_user.id, db)
 
-    # 3. Get Transcript
+    mode, transcript, input_tokens, open_stream = await prepare_note_stream(
+        db, llm_service, current_user.id, video_id, request.language, request.style
+    )
+
+    # 6. Generate Notes (Streaming) as a job, so a dropped connection doesn't abandon the generation
+    user_id = current_user.id
+
+    async def run(job: Job) -> int:
+        job_db = SessionLocal()
+        try:
+            # Reserved when the job starts, so a job cancelled while queued holds nothing
+            reservation = check_token_limit(user_id, job_db, input_tokens)
+            return await stream_and_save(
+                job_db, user_id, video_id, request.language, request.style,
+                mode, transcript, input_tokens, open_stream, started, job.append, job.progress, reservation
+            )
+        finally:
+            job_db.close()
+
+    row = submit_job(db, user_id, video_id, request.language, request.style, run)
+    return stream_response(http_request, GenerationJobService.get(row.id).stream, job_text, {"X-Job-ID": row.id})
+
+async def prepare_note_stream(
+    db: Session,
+    llm_service: LLMService,
+    user_id: int,
+    video_id: str,
+    language: str,
+    style: str
+):
+    """
+    Fetch and validate what the notes are generated from. Returns (mode,
+    transcript, input_tokens, open_stream), where open_stream(on_progress=...)
+    starts the LLM stream; raises HTTPException when the video can't be turned
+    into notes.
+    """
+    # 3. Derive from another language/style variant of this video if one exists
+    candidates = db.query(Notes).filter(
+        Notes.video_id == video_id,
+        Notes.user_id == user_id
+    ).order_by(Notes.created_at.desc()).all()
+    source_note = llm_service.select_variant_source(candidates, language, style)
+
+    if source_note:
+        CACHE_HITS.labels("variant_source").inc()
+        mode = "variant"
+        set_attributes({"notes.mode": mode, "notes.variant_source_id": source_note.id})
+        transcript = source_note.transcript
+        input_tokens = len(source_note.notes) // 4
+        open_stream = partial(
+            llm_service.derive_variant_stream,
+            source_note.notes,
+            source_language=source_note.language or "en",
+            source_style=source_note.style or "detailed",
+            language=language,
+            style=style
+        )
+        return mode, transcript, input_tokens, open_stream
+
+    CACHE_MISSES.labels("variant_source").inc()
+    mode = "full"
+    set_attributes({"notes.mode": mode})
+    # 4. Get Transcript
     try:
         # Pass language preference to YouTube service
-        transcript = YouTubeService.get_transcript(video_id, language=request.language)
+        transcript = YouTubeService.get_transcript(video_id, language=language)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to fetch transcript: {str(e)}")
     
     # Estimate input tokens (rough approximation)
     input_tokens = len(transcript) // 4
 
-    # 4. Validate Content (Check if academic)
+    # 5. Validate Content (Check if academic)
     try:
         is_academic = await llm_service.classify_content(transcript)
         if not is_academic:
@@ -111,121 +258,907 @@ async def generate_notes(
         if isinstance(e, HTTPException):
             raise e
         # Otherwise log and proceed (or fail)? Let's fail safe.
-        print(f"Classification error: {e}")
+        logger.warning("Classification error, continuing without it: %s", e, extra={"video_id": video_id})
         # Optional: raise HTTPException(status_code=500, detail="Error validating content")
-    
-    # 5. Generate Notes (Streaming)
+
+    open_stream = partial(
+        llm_service.generate_notes_stream,
+        transcript, 
+        language=language, 
+        style=style
+    )
+    return mode, transcript, input_tokens, open_stream
+
+async def stream_and_save(
+    db: Session,
+    user_id: int,
+    video_id: str,
+    language: str,
+    style: str,
+    mode: str,
+    transcript: str | None,
+    input_tokens: int,
+    open_stream,
+    started: float,
+    on_chunk=None,
+    on_progress=None,
+    reservation: Optional[Reservation] = None
+) -> int:
+    """
+    Run the note stream (into `on_chunk`, e.g. a job's output) and save the note,
+    settling `reservation` with the tokens used. Returns the note id.
+    """
+    content = ""
+    charged = False
+    try:
+        async for chunk in open_stream(on_progress=on_progress):
+            if not content:
+                GENERATION_TTFB_SECONDS.labels(mode).observe(time.perf_counter() - started)
+            content += chunk
+            if on_chunk:
+                on_chunk(chunk)
+
+        # After streaming is done, save to DB
+        if "NON_ACADEMIC_CONTENT" in content:
+            charged = True
+            if reservation is not None:
+                reservation.release(db)  # Rejected output isn't charged
+            raise HTTPException(status_code=400, detail="NON_ACADEMIC_CONTENT")
+        note_id = save_generated_note(
+            db,
+            user_id=user_id,
+            video_id=video_id,
+            content=content,
+            transcript=transcript,
+            language=language,
+            style=style,
+            input_tokens=input_tokens,
+            reservation=reservation
+        )
+        charged = True
+        if note_id is None:
+            raise RuntimeError("Failed to save the generated notes")
+        GENERATION_SECONDS.labels(mode).observe(time.perf_counter() - started)
+        return note_id
+    finally:
+        if not charged:
+            charge_partial(user_id, input_tokens, content, db, reservation)
+
+def check_job_capacity(user_id: int):
+    if GenerationJobService.active_count(user_id) >= settings.MAX_ACTIVE_JOBS_PER_USER:
+        raise HTTPException(
+            status_code=429,
+            detail=f"At most {settings.MAX_ACTIVE_JOBS_PER_USER} generations can run at once"
+        )
+
+def submit_job(db: Session, user_id: int, video_id: str, language: str, style: str, run) -> GenerationJob:
+    check_job_capacity(user_id)
+    try:
+        return GenerationJobService.submit(db, user_id, video_id, language, style, run)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+
+async def job_text(stream: ResumableStream):
+    """A job's events as plain text: the notes, then the note id marker or an error line."""
+    content = ""
+    error = None
+    async for _, event, data in stream.follow():
+        if event == "delta":
+            content += data
+            yield data
+        elif event == "note":
+            # Send the Note ID to the client
+            yield f"\n\n<!-- NOTE_ID: {json.loads(data)['note_id']} -->"
+        elif event == "error":
+            error = json.loads(data)["detail"]
+        elif event == "done":
+            status = json.loads(data)["status"]
+            if status != "completed" and "NON_ACADEMIC_CONTENT" not in content:
+                yield f"\n\nError generating notes: {error or status}"
+
+async def chat_text(stream: ResumableStream):
+    """A chat answer's events as plain text, with an error line if it failed."""
+    async for _, event, data in stream.follow():
+        if event == "delta":
+            yield data
+        elif event == "error":
+            yield f"\n\nError: {json.loads(data)['detail']}"
+
+async def sse_events(stream: ResumableStream, after: int):
+    if after == 0:
+        yield format_event(json.dumps({"stream_id": stream.id}), event="stream", retry_ms=settings.SSE_RETRY_MS)
+    try:
+        async for item in stream.follow(after, heartbeat=settings.SSE_HEARTBEAT_SECONDS):
+            if item is None:
+                yield format_comment("keepalive")
+            else:
+                event_id, event, data = item
+                yield format_event(data, event=event, event_id=event_id)
+    except ReplayExpired as e:
+        # Fell behind the replay buffer while connected: end with an error the client can't resume past
+        yield format_event(json.dumps({"detail": str(e)}), event="error")
+
+def stream_response(request: Request, stream: ResumableStream, render_text, headers: Optional[dict] = None,
+                    media_type: str = "text/plain"):
+    """
+    Serve a resumable stream. Clients that accept text/event-stream get SSE
+    with event ids, resuming after Last-Event-ID; others get the `media_type`
+    body produced by `render_text(stream)`, from the start.
+    """
+    headers = {"X-Stream-ID": stream.id, **(headers or {})}
+    if not wants_sse(request):
+        if not stream.can_resume(0):
+            raise HTTPException(status_code=410, detail="The start of this stream is no longer buffered")
+        return StreamingResponse(render_text(stream), media_type=media_type, headers=headers)
+
+    after = last_event_id(request)
+    if stream.closed and after >= stream.last_id:
+        # Nothing left to send; 204 also tells EventSource to stop reconnecting
+        return Response(status_code=204, headers=headers)
+    if not stream.can_resume(after):
+        raise HTTPException(status_code=410, detail=f"Events after {after} are no longer buffered")
+    return StreamingResponse(
+        sse_events(stream, after), media_type=SSE_MEDIA_TYPE, headers={**SSE_HEADERS, **headers}
+    )
+
+def job_response(row: GenerationJob) -> GenerationJobResponse:
+    job = GenerationJobService.get(row.id)
+    return GenerationJobResponse(
+        job_id=row.id,
+        status=job.status if job else row.status,
+        video_id=row.video_id,
+        language=row.language,
+        style=row.style,
+        note_id=job.note_id if job and job.finished else row.note_id,
+        error=job.error if job and job.finished else row.error,
+        output_chars=job.output_chars if job else None,
+        created_at=row.created_at,
+        started_at=row.started_at,
+        finished_at=row.finished_at
+    )
+
+def get_job_row(db: Session, job_id: str, user_id: int) -> GenerationJob:
+    GenerationJobService.expire_stale(db, user_id)
+    row = db.query(GenerationJob).filter(GenerationJob.id == job_id, GenerationJob.user_id == user_id).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return row
+
+@router.post("/jobs", response_model=GenerationJobResponse, status_code=202)
+async def submit_generation_job(
+    request: NoteRequest,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Start generating notes in the background and return the job right away.
+
+    The job keeps running if the client goes away. Follow its output with
+    GET /jobs/{job_id}/stream or poll GET /jobs/{job_id}; the finished job
+    carries the saved note's id. Submitting a video variant that already has
+    notes, or a running job, returns that instead of starting another.
+    """
+    video_id = YouTubeService.extract_video_id(request.url)
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL")
+    user_id = current_user.id
+
+    # A job whose worker died must not be handed back as the running one
+    GenerationJobService.expire_stale(db, user_id)
+    active = db.query(GenerationJob).filter(
+        GenerationJob.user_id == user_id,
+        GenerationJob.video_id == video_id,
+        GenerationJob.status.in_(JOB_ACTIVE_STATUSES),
+        GenerationJob.language == request.language,
+        GenerationJob.style == request.style
+    ).order_by(GenerationJob.created_at.desc()).first()
+    if active:
+        response.status_code = 200
+        return job_response(active)
+
+    existing_note = db.query(Notes.id).filter(
+        Notes.video_id == video_id,
+        Notes.language == request.language,
+        Notes.style == request.style,
+        Notes.user_id == user_id
+    ).first()
+    if existing_note:
+        CACHE_HITS.labels("notes").inc()
+        response.status_code = 200
+        row = GenerationJob(
+            id=uuid.uuid4().hex, user_id=user_id, video_id=video_id, language=request.language,
+            style=request.style, status="completed", note_id=existing_note.id, finished_at=datetime.utcnow()
+        )
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+        return job_response(row)
+
+    CACHE_MISSES.labels("notes").inc()
+    check_token_limit(user_id, db)
+
+    async def run(job: Job) -> int:
+        started = time.perf_counter()
+        job_db = SessionLocal()
+        try:
+            llm_service = get_llm_service()
+            mode, transcript, input_tokens, open_stream = await prepare_note_stream(
+                job_db, llm_service, user_id, video_id, request.language, request.style
+            )
+            reservation = check_token_limit(user_id, job_db, input_tokens)
+            return await stream_and_save(
+                job_db, user_id, video_id, request.language, request.style,
+                mode, transcript, input_tokens, open_stream, started, job.append, job.progress, reservation
+            )
+        finally:
+            job_db.close()
+
+    row = submit_job(db, user_id, video_id, request.language, request.style, run)
+    return job_response(row)
+
+@router.get("/jobs/{job_id}", response_model=GenerationJobResponse)
+async def get_generation_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Status of a generation job."""
+    return job_response(get_job_row(db, job_id, current_user.id))
+
+@router.get("/jobs/{job_id}/stream")
+async def stream_generation_job(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Attach to a job's output: what was generated so far, then the live output,
+    in the same format as /generate (SSE resumes after Last-Event-ID).
+    Disconnecting doesn't stop the job.
+    """
+    row = get_job_row(db, job_id, current_user.id)
+    job = GenerationJobService.get(job_id)
+    stream = StreamRegistry.get(job_id, current_user.id)
+    if job is not None or stream is not None:
+        return stream_response(request, stream or job.stream, job_text, {"X-Job-ID": job_id})
+
+    if row.status in JOB_ACTIVE_STATUSES:
+        # Running in another worker process; its output isn't available here until it's saved
+        raise HTTPException(
+            status_code=409,
+            detail="Job is running in another worker; poll its status and fetch the note when it completes",
+            headers={"Retry-After": "2"}
+        )
+    if wants_sse(request):
+        # The events are gone; send the outcome so the client can load the note
+        outcome = [("note", {"note_id": row.note_id})] if row.note_id is not None else []
+        outcome += [("error", {"detail": row.error or row.status})] if row.status != "completed" else []
+        body = "".join(format_event(json.dumps(data), event=event) for event, data in outcome)
+        body += format_event(json.dumps({"status": row.status}), event="done")
+        return Response(content=body, media_type=SSE_MEDIA_TYPE, headers={**SSE_HEADERS, "X-Job-ID": job_id})
+    if row.status == "completed" and row.note_id is not None:
+        note = db.query(Notes).options(undefer(Notes.notes)).filter(
+            Notes.id == row.note_id, Notes.user_id == current_user.id
+        ).first()
+        if note:
+            return Response(
+                content=f"{note.notes}\n\n<!-- NOTE_ID: {note.id} -->",
+                media_type="text/plain",
+                headers={"X-Job-ID": job_id}
+            )
+    return Response(
+        content=f"Error generating notes: {row.error or row.status}",
+        media_type="text/plain",
+        headers={"X-Job-ID": job_id}
+    )
+
+@router.delete("/jobs/{job_id}", response_model=GenerationJobResponse)
+async def cancel_generation_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Cancel a queued or running job. Tokens already generated are still counted."""
+    row = get_job_row(db, job_id, current_user.id)
+    if row.status in JOB_ACTIVE_STATUSES and not await GenerationJobService.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job is running in another worker")
+    db.refresh(row)
+    return job_response(row)
+
+@router.post("/generate/batch")
+async def generate_notes_batch(
+    request: NoteBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """
+    Generate several (language, style) variants of one video in a single call.
+
+    The transcript is fetched and classified once and the map stage is shared
+    between variants of the same language. Variants are streamed back as
+    newline-delimited JSON events tagged with their target index.
+    """
+    import json
+
+    video_id = YouTubeService.extract_video_id(request.url)
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL")
+
+    # De-duplicate targets while keeping the client's order
+    targets = list(dict.fromkeys((t.language, t.style) for t in request.targets))
+    if not targets:
+        raise HTTPException(status_code=400, detail="At least one target is required")
+    if len(targets) > settings.MAX_BATCH_VARIANTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.MAX_BATCH_VARIANTS} variants can be generated per batch"
+        )
+
+    # Variants the user already has are replayed instead of regenerated
+    existing_notes = {}
+    for language, style in targets:
+        existing_note = db.query(Notes).options(undefer(Notes.notes)).filter(
+            Notes.video_id == video_id,
+            Notes.language == language,
+            Notes.style == style,
+            Notes.user_id == current_user.id
+        ).first()
+        if existing_note:
+            existing_notes[(language, style)] = existing_note
+    pending = [target for target in targets if target not in existing_notes]
+
+    transcript = None
+    reservation = None
+    if pending:
+        check_token_limit(current_user.id, db)
+
+        try:
+            transcript = YouTubeService.get_transcript(video_id, language=pending[0][0])
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Failed to fetch transcript: {str(e)}")
+
+        try:
+            is_academic = await llm_service.classify_content(transcript)
+            if not is_academic:
+                raise HTTPException(
+                    status_code=400, 
+                    detail="The video content does not appear to be academic or educational. Please try a different video."
+                )
+        except Exception as e:
+            if isinstance(e, HTTPException):
+                raise e
+            logger.warning("Classification error, continuing without it: %s", e, extra={"video_id": video_id})
+
+        reservation = check_token_limit(current_user.id, db, len(transcript) // 4)
+
+    def event(index: int, kind: str, **payload) -> str:
+        language, style = targets[index]
+        return json.dumps({"variant": index, "language": language, "style": style, "event": kind, **payload}) + "\n"
+
     async def generate_and_save():
-        full_content = ""
+        for index, target in enumerate(targets):
+            if target in existing_notes:
+                yield event(index, "delta", data=existing_notes[target].notes)
+                yield event(index, "done", note_id=existing_notes[target].id)
+
+        if not pending:
+            return
+
+        # The transcript is read once for the whole batch, so charge it once
+        input_tokens = len(transcript) // 4
+        contents = {target: "" for target in pending}
+        failed = set()
+
         try:
-            async for chunk in llm_service.generate_notes_stream(
-                transcript, 
-                language=request.language, 
-                style=request.style
-            ):
-                full_content += chunk
-                yield chunk
-            
-            # After streaming is done, save to DB
-            if "NON_ACADEMIC_CONTENT" not in full_content:
-                try:
-                    # Extract title from content (first line starting with #)
-                    import re
-                    title_match = re.search(r'^#\s+(.+)$', full_content, re.MULTILINE)
-                    ai_title = title_match.group(1).strip() if title_match else f"Notes for {video_id}"
-
-                    new_note = Notes(
-                        video_id=video_id, 
-                        title=ai_title, 
-                        notes=full_content,
-                        transcript=transcript,
-                        language=request.language,
-                        style=request.style,
-                        user_id=current_user.id
-                    )
-                    db.add(new_note)
-                    db.commit()
-                    db.refresh(new_note)
-                    
-                    # Store embeddings for RAG (Background Task)
-                    try:
-                        from app.services.vector_service import VectorService
-                        from fastapi.concurrency import run_in_threadpool
-                        import asyncio
-                        
-                        vector_service = VectorService()
-                        # Run in background to avoid blocking the stream completion
-                        # Run in background to avoid blocking the stream completion
-                        asyncio.create_task(run_in_threadpool(vector_service.store_note_chunks, new_note.id, full_content, transcript))
-                    except Exception as vec_e:
-                        print(f"Error scheduling embeddings: {vec_e}")
-                    
-                    # Send the Note ID to the client
-                    yield f"\n\n<!-- NOTE_ID: {new_note.id} -->"
-                except Exception as db_e:
-                    print(f"Error saving notes to DB: {db_e}")
-                    
-                    # Update token usage
-                    output_tokens = len(full_content) // 4
-                    total_tokens = input_tokens + output_tokens
-                    try:
-                        update_token_usage(current_user.id, total_tokens, db)
-                    except Exception as token_e:
-                        print(f"Error updating token usage: {token_e}")
-                    
+            # Closing the variant stream on a disconnect cancels its LLM calls right away
+            with budget_scope(settings.REQUEST_DEADLINE_SECONDS):
+                async with aclosing(llm_service.generate_variants_stream(transcript, pending)) as variants:
+                    async for pending_index, kind, payload in variants:
+                        target = pending[pending_index]
+                        index = targets.index(target)
+                        if kind == "delta":
+                            contents[target] += payload
+                            yield event(index, "delta", data=payload)
+                        elif kind == "error":
+                            failed.add(target)
+                            yield event(index, "error", detail=f"Error generating notes: {payload}")
+                        else:
+                            note_id = None
+                            if target not in failed and "NON_ACADEMIC_CONTENT" not in contents[target]:
+                                note_id = save_generated_note(
+                                    db,
+                                    user_id=current_user.id,
+                                    video_id=video_id,
+                                    content=contents[target],
+                                    transcript=transcript,
+                                    language=target[0],
+                                    style=target[1],
+                                    input_tokens=input_tokens,
+                                    reservation=reservation
+                                )
+                                input_tokens = 0
+                            yield event(index, "done", note_id=note_id)
+        except Exception as e:
+            yield json.dumps({"event": "error", "detail": f"Error generating notes: {str(e)}"}) + "\n"
+        finally:
+            # If no variant was saved, the transcript's tokens were held but never charged
+            reservation.release(db)
+
+    return StreamingResponse(generate_and_save(), media_type="application/x-ndjson")
+
+@router.post("/generate/bulk")
+async def generate_notes_bulk(
+    request: NoteBulkRequest,
+    http_request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """
+    Generate notes in one language and style for a whole playlist and/or a list of URLs.
+
+    Videos move through transcript fetch, classification and generation as a
+    pipeline with bounded parallelism per stage. Videos that already have
+    notes are not regenerated, other variants and stored transcripts are
+    reused, and once the daily token limit is reached the remaining videos are
+    skipped. A failed video doesn't stop the others. Progress is streamed as
+    "video" events (index, video_id, status, note_id, detail) plus "progress"
+    events during generation, then a "summary": SSE when requested, otherwise
+    newline-delimited JSON. The run continues if the client disconnects and
+    can be resumed with GET /streams/{stream_id}.
+    """
+    user_id = current_user.id
+    video_ids = []
+    if request.playlist:
+        playlist_id = YouTubeService.extract_playlist_id(request.playlist)
+        if not playlist_id:
+            raise HTTPException(status_code=400, detail="Invalid YouTube playlist URL or ID")
+        video_ids += await run_in_threadpool(YouTubeService.get_playlist_video_ids, playlist_id, settings.BULK_MAX_VIDEOS)
+    for url in request.urls:
+        video_id = YouTubeService.extract_video_id(url)
+        if not video_id:
+            raise HTTPException(status_code=400, detail=f"Invalid YouTube URL: {url}")
+        video_ids.append(video_id)
+    video_ids = list(dict.fromkeys(video_ids))
+    if not video_ids:
+        raise HTTPException(status_code=400, detail="A playlist or at least one URL is required")
+    if len(video_ids) > settings.BULK_MAX_VIDEOS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.BULK_MAX_VIDEOS} videos can be generated at once")
+
+    check_token_limit(user_id, db)
+    if BulkRegistry.active_count(user_id) >= settings.MAX_ACTIVE_BULK_PER_USER:
+        raise HTTPException(status_code=429, detail="A bulk generation is already running")
+
+    language, style = request.language, request.style
+
+    def check_quota(tokens: int = 0) -> Reservation:
+        quota_db = SessionLocal()
+        try:
+            reservation = reserve_tokens(user_id, tokens, quota_db)
+        finally:
+            quota_db.close()
+        if reservation is None:
+            raise SkipItem(f"Daily token limit ({settings.DAILY_TOKEN_LIMIT}) reached")
+        return reservation
+
+    async def fetch(item: PipelineItem):
+        item_db = SessionLocal()
+        try:
+            candidates = item_db.query(Notes).filter(
+                Notes.video_id == item.video_id,
+                Notes.user_id == user_id
+            ).order_by(Notes.created_at.desc()).all()
+            existing = next((note for note in candidates if note.language == language and note.style == style), None)
+            if existing:
+                CACHE_HITS.labels("notes").inc()
+                item.complete(existing.id, "Notes already exist")
+                return
+            CACHE_MISSES.labels("notes").inc()
+            source = llm_service.select_variant_source(candidates, language, style)
+            if source:
+                item.data["source"] = (source.notes, source.language or "en", source.style or "detailed")
+                item.data["transcript"] = source.transcript
+                return
+            # Another variant's stored transcript saves the download
+            item.data["transcript"] = next(
+                (note.transcript for note in candidates if note.transcript_record is not None), None
+            )
+        finally:
+            item_db.close()
+        if item.data["transcript"] is not None:
+            CACHE_HITS.labels("transcript").inc()
+        else:
+            CACHE_MISSES.labels("transcript").inc()
+            item.data["transcript"] = await run_in_threadpool(YouTubeService.get_transcript, item.video_id, language)
+
+    async def classify(item: PipelineItem):
+        if "source" in item.data:
+            return  # Derived from notes that were already classified
+        check_quota()
+        try:
+            is_academic = await llm_service.classify_content(item.data["transcript"])
         except Exception as e:
-            yield f"\n\nError generating notes: {str(e)}"
+            logger.warning("Classification error, continuing without it: %s", e, extra={"video_id": item.video_id})
+            return
+        if not is_academic:
+            raise HTTPException(status_code=400, detail="The video content does not appear to be academic or educational")
+
+    async def generate(item: PipelineItem):
+        started = time.perf_counter()
+        transcript = item.data["transcript"]
+        if "source" in item.data:
+            source_notes, source_language, source_style = item.data["source"]
+            mode, input_tokens = "variant", len(source_notes) // 4
+            open_stream = partial(
+                llm_service.derive_variant_stream, source_notes,
+                source_language=source_language, source_style=source_style, language=language, style=style
+            )
+        else:
+            mode, input_tokens = "full", len(transcript) // 4
+            open_stream = partial(llm_service.generate_notes_stream, transcript, language=language, style=style)
+        # Parallel generations each hold their input, so together they stop at the limit
+        reservation = check_quota(input_tokens)
+
+        item_db = SessionLocal()
+        try:
+            with budget_scope(settings.GENERATION_JOB_TIMEOUT):
+                note_id = await stream_and_save(
+                    item_db, user_id, item.video_id, language, style, mode, transcript, input_tokens,
+                    open_stream, started, on_progress=lambda info: stream.publish("progress", {"index": item.index, **info}),
+                    reservation=reservation
+                )
+        except HTTPException as e:
+            if e.detail == "NON_ACADEMIC_CONTENT":
+                raise HTTPException(status_code=400, detail="The video content does not appear to be academic or educational")
+            raise
+        finally:
+            item_db.close()
+        item.complete(note_id)
+
+    items = [PipelineItem(index, video_id) for index, video_id in enumerate(video_ids)]
+
+    def publish(item: PipelineItem):
+        stream.publish("video", {
+            "index": item.index, "video_id": item.video_id, "status": item.status,
+            "note_id": item.note_id, "detail": item.detail
+        })
+
+    pipeline = BulkPipeline([
+        Stage("fetching", settings.BULK_FETCH_CONCURRENCY, fetch),
+        Stage("classifying", settings.BULK_CLASSIFY_CONCURRENCY, classify),
+        Stage("generating", settings.BULK_GENERATE_CONCURRENCY, generate),
+    ], on_update=publish)
 
-    return StreamingResponse(generate_and_save(), media_type="text/plain")
+    async def produce(stream: ResumableStream):
+        try:
+            await pipeline.run(items)
+        finally:
+            BulkRegistry.leave(user_id)
+        counts = {status: sum(1 for item in items if item.status == status) for status in ("completed", "failed", "skipped")}
+        stream.publish("summary", {
+            "total": len(items), **counts, "note_ids": [item.note_id for item in items if item.note_id is not None]
+        })
+
+    BulkRegistry.enter(user_id)
+    stream = StreamRegistry.run(user_id, produce)
+    return stream_response(http_request, stream, bulk_ndjson, media_type="application/x-ndjson")
+
+async def bulk_ndjson(stream: ResumableStream):
+    """A bulk run's events as newline-delimited JSON."""
+    async for _, event, data in stream.follow():
+        if event != "done":
+            yield json.dumps({"event": event, **json.loads(data)}) + "\n"
 
 @router.get("/", response_model=List[NoteSummary])
 async def get_user_notes(
-    skip: int = 0, 
-    limit: int = 100, 
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=100),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """List all notes for the current user with optimized fetching."""
-    from sqlalchemy import func
+    """
+    List notes for the current user, newest first, using keyset pagination.
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next page.
+    """
+    from sqlalchemy import func, or_, and_
     
-    notes = db.query(
+    query = db.query(
         Notes.id,
         Notes.title,
         Notes.video_id,
         Notes.created_at,
         Notes.language,
         Notes.style,
-        func.substr(Notes.notes, 1, 200).label('notes_snippet')
+        Notes.updated_at,
+        func.coalesce(Notes.notes_snippet, "").label('notes_snippet')
     ).filter(
         Notes.user_id == current_user.id
-    ).order_by(Notes.created_at.desc()).offset(skip).limit(limit).all()
-    
+    )
+
+    if cursor:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        created_at, note_id = position
+        query = query.filter(or_(
+            Notes.created_at < created_at,
+            and_(Notes.created_at == created_at, Notes.id < note_id)
+        ))
+
+    # Served by ix_notes_user_created (user_id, created_at DESC, id DESC)
+    notes = query.order_by(Notes.created_at.desc(), Notes.id.desc()).limit(limit).all()
+
+    headers = {}
+    if len(notes) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(notes[-1].created_at, notes[-1].id)
+
+    # The page changes whenever one of its notes is added, removed or updated
+    headers.update(cache_headers(make_etag(
+        cursor or "", str(limit), *(f"{note.id}:{note.updated_at}" for note in notes)
+    )))
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
     return notes
 
+@router.get("/search", response_model=List[NoteSearchResult])
+async def search_notes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=50),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Full-text search over the current user's notes, ranked with highlighted snippets."""
+    return SearchService.search_notes(db, current_user.id, q, limit=limit)
+
+@router.get("/semantic-search", response_model=List[NoteSemanticResult])
+async def semantic_search_notes(
+    q: str = Query(..., min_length=1, max_length=500),
+    k: int = Query(10, ge=1, le=50),
+    per_note: int = Query(3, ge=1, le=10),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Semantic search across all of the user's notes and transcripts, grouped per note."""
+    from app.services.vector_service import VectorService
+    from fastapi.concurrency import run_in_threadpool
+
+    vector_service = VectorService()
+    groups = await run_in_threadpool(vector_service.search_user_chunks, current_user.id, q, k, per_note)
+
+    note_ids = [group["note_id"] for group in groups]
+    titles = dict(db.query(Notes.id, Notes.title).filter(
+        Notes.id.in_(note_ids),
+        Notes.user_id == current_user.id
+    ).all()) if note_ids else {}
+
+    return [{**group, "title": titles[group["note_id"]]} for group in groups if group["note_id"] in titles]
+
+@router.post("/library/chat")
+async def chat_with_library(
+    chat_request: ChatRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    llm_service: LLMService = Depends(get_llm_service)
+):
+    """Chat with the user's whole library, pulling context from several notes."""
+    input_tokens = len(chat_request.message) // 4
+    reservation = check_token_limit(current_user.id, db, input_tokens)
+
+    user_id = current_user.id
+    note_titles = dict(db.query(Notes.id, Notes.title).filter(Notes.user_id == user_id).all())
+
+    # The answer is generated and charged even if the client disconnects; it can resume with Last-Event-ID
+    async def generate_and_save(stream: ResumableStream):
+        full_response = ""
+        try:
+            with budget_scope(settings.REQUEST_DEADLINE_SECONDS):
+                async for chunk in llm_service.chat_with_library(user_id, note_titles, chat_request.message):
+                    full_response += chunk
+                    stream.publish("delta", chunk)
+        except BaseException:
+            charge_db = SessionLocal()
+            try:
+                charge_partial(user_id, input_tokens, full_response, charge_db, reservation)
+            finally:
+                charge_db.close()
+            raise
+
+        output_tokens = len(full_response) // 4
+        chat_db = SessionLocal()
+        try:
+            update_token_usage(user_id, input_tokens + output_tokens, chat_db, reservation)
+        finally:
+            chat_db.close()
+
+    return stream_response(request, StreamRegistry.run(user_id, generate_and_save), chat_text)
+
+@router.get("/streams/{stream_id}")
+async def resume_stream(
+    stream_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Reconnect to a generation or chat stream (its id is in the X-Stream-ID
+    header and the first "stream" event) as SSE, continuing after the
+    Last-Event-ID header or `last_event_id` query parameter.
+    """
+    stream = StreamRegistry.get(stream_id, current_user.id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    if not wants_sse(request):
+        raise HTTPException(status_code=406, detail=f"Streams are resumed as {SSE_MEDIA_TYPE}")
+    return stream_response(request, stream, chat_text)
+
+@router.get("/export/all")
+async def export_all_notes(
+    export_format: Literal["pdf", "html", "md", "docx"] = Query("md", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Export every note of the current user as a streamed ZIP archive."""
+    rows = db.query(Notes.id, Notes.title).filter(
+        Notes.user_id == current_user.id
+    ).order_by(Notes.created_at.desc()).all()
+
+    async def archive():
+        # The body is streamed after the request's session may have been closed, so it has its own
+        export_db = SessionLocal()
+        try:
+            def notes_loader(note_id: int):
+                # Load each note body only when its entry is about to be rendered
+                return lambda: export_db.query(Notes.notes).filter(Notes.id == note_id).scalar() or ""
+
+            entries = [
+                (ExportService.export_filename(row.title, row.id, export_format), notes_loader(row.id))
+                for row in rows
+            ]
+            async with aclosing(ExportService.stream_zip(entries, export_format)) as chunks:
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            export_db.close()
+
+    return StreamingResponse(
+        archive(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=notesbuddy_{export_format}.zip"}
+    )
+
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(
     note_id: int, 
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get a specific note by ID."""
-    note = db.query(Notes).filter(Notes.id == note_id, Notes.user_id == current_user.id).first()
+    # Validate against the cheap version columns before loading the body and transcript
+    version = db.query(Notes.id, Notes.updated_at).filter(
+        Notes.id == note_id,
+        Notes.user_id == current_user.id
+    ).first()
+    if not version:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    headers = cache_headers(make_etag(str(version.id), str(version.updated_at)), version.updated_at)
+    if is_not_modified(request, headers["ETag"], version.updated_at):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    note = db.query(Notes).options(
+        undefer(Notes.notes),
+        joinedload(Notes.transcript_record)
+    ).filter(Notes.id == note_id, Notes.user_id == current_user.id).first()
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note
+
+@router.patch("/{note_id}", response_model=NoteResponse)
+async def update_note(
+    note_id: int,
+    update: NoteUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Edit a note's title and/or body. Only the chunks that changed are re-embedded."""
+    if update.title is not None and not update.title.strip():
+        raise HTTPException(status_code=400, detail="Title cannot be empty")
+
+    note = db.query(Notes).options(
+        undefer(Notes.notes),
+        joinedload(Notes.transcript_record)
+    ).filter(Notes.id == note_id, Notes.user_id == current_user.id).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
+
+    body_changed = update.notes is not None and update.notes != note.notes
+    if update.title is not None:
+        note.title = update.title.strip()
+    if body_changed:
+        note.notes = update.notes
+    db.commit()
+    db.refresh(note)
+
+    if body_changed:
+        try:
+            from app.services.vector_service import rebuild_note_index
+
+            # The transcript goes along too: its stored chunks are unchanged and cost no embeddings,
+            # and a note indexed without them (older layout, model unavailable) gets them now
+            asyncio.create_task(run_in_threadpool(rebuild_note_index, note.id, current_user.id))
+        except Exception:
+            logger.exception("Error scheduling embeddings", extra={"note_id": note.id})
     return note
 
+@router.get("/{note_id}/export")
+async def export_note(
+    note_id: int,
+    request: Request,
+    export_format: Literal["pdf", "html", "md", "docx"] = Query("pdf", alias="format"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Export a stored note without the client uploading its content."""
+    import asyncio
+
+    note = db.query(Notes.id, Notes.title, Notes.notes, Notes.updated_at).filter(
+        Notes.id == note_id,
+        Notes.user_id == current_user.id
+    ).first()
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+
+    # The rendering is a pure function of the notes, so the ETag is known before rendering
+    headers = cache_headers(make_etag(note.notes, export_format), note.updated_at)
+    if is_not_modified(request, headers["ETag"], note.updated_at):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        content = await ExportService.render(note.notes, export_format)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Export timed out")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
+
+    filename = ExportService.export_filename(note.title, note.id, export_format)
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return Response(content=content, media_type=EXPORT_FORMATS[export_format][0], headers=headers)
+
 @router.get("/{note_id}/chat/history")
 async def get_chat_history(
     note_id: int,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get chat history for a specific note."""
     from app.models.chat_model import ChatMessage
+    from sqlalchemy import func
     
-    note = db.query(Notes).filter(Notes.id == note_id, Notes.user_id == current_user.id).first()
+    note = db.query(Notes.id).filter(Notes.id == note_id, Notes.user_id == current_user.id).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
+
+    # History is append-only, so (count, last id) identifies its current state
+    message_count, last_message_id = db.query(func.count(ChatMessage.id), func.max(ChatMessage.id)).filter(
+        ChatMessage.note_id == note_id,
+        ChatMessage.user_id == current_user.id
+    ).one()
+    headers = cache_headers(make_etag(str(note_id), str(message_count), str(last_message_id)))
+    if is_not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     
     messages = db.query(ChatMessage).filter(
         ChatMessage.note_id == note_id,
@@ -238,72 +1171,75 @@ async def get_chat_history(
 async def chat_with_note(
     note_id: int,
     chat_request: ChatRequest,
+    request: Request,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    llm_service: LLMService = Depends(get_llm_service)
 ):
     """Chat with a specific note."""
     from app.models.chat_model import ChatMessage
-    from app.models.token_usage_model import TokenUsage
-    from datetime import date
-    from app.core.config import settings
     
-    note = db.query(Notes).filter(Notes.id == note_id, Notes.user_id == current_user.id).first()
+    note = db.query(Notes).options(undefer(Notes.notes)).filter(
+        Notes.id == note_id, Notes.user_id == current_user.id
+    ).first()
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     
-    # Check daily token limit
-    check_token_limit(current_user.id, db)
-    
-    # Estimate input tokens (rough: ~4 chars = 1 token)
+    # Estimate input tokens (rough: ~4 chars = 1 token) and hold them against the daily limit
     input_tokens = len(chat_request.message) // 4
+    reservation = check_token_limit(current_user.id, db, input_tokens)
+    
+    user_id = current_user.id
+    note_content = note.notes
     
     # Save user message
     user_message = ChatMessage(
         note_id=note_id,
-        user_id=current_user.id,
+        user_id=user_id,
         role="user",
         content=chat_request.message
     )
     db.add(user_message)
     db.commit()
     
-    # Stream response and collect full content
-    async def generate_and_save():
-        # nonlocal usage  # No longer needed
-        full_response = ""
-        # Get previous chat history
-        previous_messages = db.query(ChatMessage).filter(
-            ChatMessage.note_id == note_id,
-            ChatMessage.user_id == current_user.id
-        ).order_by(ChatMessage.created_at).all()
-        
-        # Convert to list of dicts for service
-        history_list = [{"role": msg.role, "content": msg.content} for msg in previous_messages]
-
+    # Stream the response and save it. This runs detached from the request with its own
+    # session, so the answer is saved and charged even if the client disconnects.
+    async def generate_and_save(stream: ResumableStream):
+        chat_db = SessionLocal()
         try:
-            async for chunk in llm_service.chat_with_note(note.id, note.notes, chat_request.message, history_list):
-                full_response += chunk
-                yield chunk
+            full_response = ""
+            # Get previous chat history
+            previous_messages = chat_db.query(ChatMessage).filter(
+                ChatMessage.note_id == note_id,
+                ChatMessage.user_id == user_id
+            ).order_by(ChatMessage.created_at).all()
+            
+            # Convert to list of dicts for service
+            history_list = [{"role": msg.role, "content": msg.content} for msg in previous_messages]
+
+            with budget_scope(settings.REQUEST_DEADLINE_SECONDS):
+                async for chunk in llm_service.chat_with_note(note_id, note_content, chat_request.message, history_list, user_id=user_id):
+                    full_response += chunk
+                    stream.publish("delta", chunk)
             
             # Save assistant message
             assistant_message = ChatMessage(
                 note_id=note_id,
-                user_id=current_user.id,
+                user_id=user_id,
                 role="assistant",
                 content=full_response
             )
-            db.add(assistant_message)
+            chat_db.add(assistant_message)
             
-            # Update token usage
+            # Update token usage (commits the message too)
             output_tokens = len(full_response) // 4
-            total_tokens = input_tokens + output_tokens
-            
-            update_token_usage(current_user.id, total_tokens, db)
-        except Exception as e:
-            db.rollback()
-            yield f"\n\nError: {str(e)}"
+            update_token_usage(user_id, input_tokens + output_tokens, chat_db, reservation)
+            stream.publish("message", {"message_id": assistant_message.id})
+        except BaseException:
+            chat_db.rollback()
+            charge_partial(user_id, input_tokens, full_response, chat_db, reservation)
+            raise
+        finally:
+            chat_db.close()
     
-    return StreamingResponse(
-        generate_and_save(),
-        media_type="text/plain"
-    )
+    return stream_response(request, StreamRegistry.run(user_id, generate_and_save), chat_text)
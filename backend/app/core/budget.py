@@ -0,0 +1,158 @@
+"""
+Per-request budgets: a deadline, and an account of the LLM tokens spent.
+
+A unit of work (a generation job, a chat answer, a batch) opens a
+budget_scope(). The budget travels in a context variable to everything the
+work awaits, including the tasks it spawns, so LLMService can bound each wait
+for a slot and each model call by the time that is left instead of running
+to completion for output nobody will read.
+
+LLM calls charge their (estimated) tokens to the current budget. Tokens of
+calls that failed or were cut off are counted as wasted right away; the rest
+are counted as delivered when the scope completes, or as wasted if it fails,
+times out or is cancelled. Calls outside any scope count as delivered when
+they succeed.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Optional
+from app.core.metrics import DEADLINES_EXCEEDED, LLM_TOKENS
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's time budget ran out."""
+
+
+class Budget:
+    def __init__(self, deadline: Optional[float]):
+        self.deadline = deadline  # time.monotonic() value, None for no deadline
+        self.tokens: dict[str, int] = {}
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def charge(self, stage: str, tokens: int) -> None:
+        self.tokens[stage] = self.tokens.get(stage, 0) + tokens
+
+    def settle(self, delivered: bool) -> None:
+        outcome = "delivered" if delivered else "wasted"
+        for stage, tokens in self.tokens.items():
+            LLM_TOKENS.labels(stage, outcome).inc(tokens)
+        self.tokens.clear()
+
+
+_budget: ContextVar[Optional[Budget]] = ContextVar("budget", default=None)
+
+
+@contextmanager
+def budget_scope(seconds: Optional[float] = None):
+    """
+    Run the enclosed work under a budget that expires in `seconds` (or at the
+    enclosing budget's deadline, if that is sooner).
+    """
+    parent = _budget.get()
+    deadline = None if seconds is None else time.monotonic() + seconds
+    if parent is not None and parent.deadline is not None:
+        deadline = parent.deadline if deadline is None else min(deadline, parent.deadline)
+    budget = Budget(deadline)
+    # set() rather than reset(token): async generators may be finalised in another context
+    _budget.set(budget)
+    try:
+        yield budget
+    except BaseException:
+        budget.settle(delivered=False)
+        raise
+    else:
+        budget.settle(delivered=True)
+    finally:
+        _budget.set(parent)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left in the current budget, None if there is no deadline."""
+    budget = _budget.get()
+    return budget.remaining() if budget is not None else None
+
+
+def charge(stage: str, tokens: int, ok: bool = True) -> None:
+    """Account for the tokens of an LLM call; `ok` is False if it failed or was cut off."""
+    if not tokens:
+        return
+    budget = _budget.get()
+    if not ok:
+        LLM_TOKENS.labels(stage, "wasted").inc(tokens)
+    elif budget is not None:
+        budget.charge(stage, tokens)
+    else:
+        LLM_TOKENS.labels(stage, "delivered").inc(tokens)
+
+
+def _expired(stage: str) -> DeadlineExceeded:
+    DEADLINES_EXCEEDED.labels(stage).inc()
+    return DeadlineExceeded(f"Deadline exceeded during {stage}")
+
+
+@asynccontextmanager
+async def enforce(stage: str):
+    """Cancel the enclosed awaits when the deadline passes, raising DeadlineExceeded."""
+    left = remaining()
+    if left is None:
+        yield
+        return
+    if left <= 0:
+        raise _expired(stage)
+    timeout = asyncio.timeout(left)
+    try:
+        async with timeout:
+            yield
+    except TimeoutError:
+        if timeout.expired():
+            raise _expired(stage) from None
+        raise
+
+
+async def within(awaitable: Awaitable, stage: str):
+    """Await `awaitable` within the deadline."""
+    left = remaining()
+    if left is not None and left <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise _expired(stage)
+    async with enforce(stage):
+        return await awaitable
+
+
+async def iterate_within(stream, stage: str) -> AsyncIterator:
+    """
+    Iterate an async stream, bounding each step by the deadline. The timeout
+    only covers the awaits, never the consumer's code between items.
+    """
+    iterator = aiter(stream)
+    try:
+        while True:
+            async with enforce(stage):
+                try:
+                    item = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+async def gather_or_cancel(*awaitables: Awaitable) -> list:
+    """
+    Like asyncio.gather, but the first failure cancels the remaining tasks
+    (and waits for them to stop) instead of leaving them running.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,224 @@
+import asyncio
+import zlib
+from typing import Optional
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self, level: int):
+        # Brotli quality runs 0-11; streaming favours a fast setting
+        self._compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=min(level, 11))
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick br or gzip from an Accept-Encoding header, honouring q=0."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.strip().lower()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+class CompressionMiddleware:
+    """
+    gzip/brotli response compression that is safe for streaming responses.
+
+    Bodies sent in one message are compressed only above `minimum_size`.
+    Streamed bodies are compressed incrementally: the first message is flushed
+    immediately so time-to-first-byte does not regress, later token batches are
+    flushed once `flush_size` bytes are pending or `flush_interval` seconds pass.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 1024,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        flush_size: int = 1024,
+        flush_interval: float = 0.05
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("method") == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        try:
+            await self.app(scope, receive, responder.send)
+        finally:
+            responder.cancel_timer()
+
+    def make_encoder(self, encoding: str):
+        if encoding == "br":
+            return _BrotliEncoder(self.brotli_quality)
+        return _GzipEncoder(self.gzip_level)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start_message: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+        self.pending = 0
+        self.first_flushed = False
+        self.lock = asyncio.Lock()
+        self.timer: Optional[asyncio.Task] = None
+
+    def cancel_timer(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                message["status"] < 200
+                or message["status"] in (204, 304)
+                or "content-encoding" in headers
+                or not content_type.startswith(COMPRESSIBLE_TYPES)
+            )
+            if self.passthrough:
+                await self.downstream(message)
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.downstream(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            if not more_body:
+                # Whole body in one message: compress only if it is worth it
+                await self._send_single(body)
+                return
+            self.encoder = self.middleware.make_encoder(self.encoding)
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            del headers["content-length"]
+            self._mark_encoded(headers)
+            await self.downstream(self.start_message)
+
+        async with self.lock:
+            data = self.encoder.compress(body)
+            self.pending += len(body)
+            if not more_body:
+                self.cancel_timer()
+                await self.downstream({"type": "http.response.body", "body": data + self.encoder.finish(), "more_body": False})
+                return
+            if not self.first_flushed or self.pending >= self.middleware.flush_size:
+                data += self.encoder.flush()
+                self.pending = 0
+                self.first_flushed = True
+                self.cancel_timer()
+            elif self.timer is None:
+                self.timer = asyncio.create_task(self._flush_later())
+            if data:
+                await self.downstream({"type": "http.response.body", "body": data, "more_body": True})
+
+    async def _send_single(self, body: bytes) -> None:
+        if len(body) < self.middleware.minimum_size:
+            await self.downstream(self.start_message)
+            await self.downstream({"type": "http.response.body", "body": body, "more_body": False})
+            return
+
+        encoder = self.middleware.make_encoder(self.encoding)
+        compressed = encoder.compress(body) + encoder.finish()
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Length"] = str(len(compressed))
+        self._mark_encoded(headers)
+        await self.downstream(self.start_message)
+        await self.downstream({"type": "http.response.body", "body": compressed, "more_body": False})
+
+    def _mark_encoded(self, headers: MutableHeaders) -> None:
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # A strong validator must change with the encoding
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = f"W/{etag}"
+
+    async def _flush_later(self) -> None:
+        """Flush a small token batch that has been pending for flush_interval."""
+        await asyncio.sleep(self.middleware.flush_interval)
+        async with self.lock:
+            self.timer = None
+            if self.pending:
+                self.pending = 0
+                data = self.encoder.flush()
+                if data:
+                    await self.downstream({"type": "http.response.body", "body": data, "more_body": True})
@@ -29,8 +29,69 @@ class Settings(BaseSettings):
     DAILY_TOKEN_LIMIT: int = 5000  # 5k tokens per user per day (~4k words)
     MAX_TOKENS_PER_CHAT: int = 2000  # 2k tokens per chat session
     
+    # Startup
+    WARMUP_ON_STARTUP: bool = True  # Load the LLM chains, embedding model and export workers in the background
+    
     # Request Management
     MAX_CONCURRENT_REQUESTS: int = 5  # Max concurrent AI requests
+    MAX_BATCH_VARIANTS: int = 4  # Max (language, style) targets per batch generation
+    REQUEST_DEADLINE_SECONDS: float = 300.0  # Time budget for a chat answer or batch generation (jobs: GENERATION_JOB_TIMEOUT)
+    
+    # Bulk (playlist) generation: videos move through fetch -> classify -> generate with bounded parallelism
+    BULK_MAX_VIDEOS: int = 50  # Per request; longer playlists are truncated
+    BULK_FETCH_CONCURRENCY: int = 4  # Transcript downloads at once per bulk request
+    BULK_CLASSIFY_CONCURRENCY: int = 2
+    BULK_GENERATE_CONCURRENCY: int = 2
+    MAX_ACTIVE_BULK_PER_USER: int = 1
+    
+    # Generation Jobs
+    GENERATION_JOB_WORKERS: int = 4  # Jobs generating at once per process (LLM calls are still capped above)
+    GENERATION_JOB_QUEUE_SIZE: int = 100  # Submissions beyond this are rejected with 503
+    GENERATION_JOB_TIMEOUT: float = 900.0  # Seconds before a running job is abandoned
+    GENERATION_JOB_RETENTION_SECONDS: float = 300.0  # Finished jobs' output stays attachable this long
+    MAX_ACTIVE_JOBS_PER_USER: int = 3
+    
+    # Resumable Streams (SSE)
+    SSE_REPLAY_BUFFER_EVENTS: int = 10000  # Events kept per stream for Last-Event-ID resumes
+    SSE_STREAM_RETENTION_SECONDS: float = 300.0  # Finished streams stay resumable this long
+    SSE_HEARTBEAT_SECONDS: float = 15.0  # Comment sent on idle streams so proxies keep them open
+    SSE_RETRY_MS: int = 2000  # Reconnect delay suggested to EventSource clients
+    
+    # Cluster-wide limits (see app/core/limits.py)
+    LIMITER_BACKEND: str = "local"  # "local" (per process), "redis" or "postgres" (advisory locks)
+    QUOTA_BACKEND: str = "database"  # "database" (token_usage table) or "redis"
+    REDIS_URL: Optional[str] = None  # e.g. redis://localhost:6379/0
+    LIMITER_LEASE_SECONDS: float = 30.0  # A Redis slot held by a dead worker is freed after this
+    
+    # Vector store (RAG)
+    CHROMA_PERSIST_DIRECTORY: Optional[str] = None  # On-disk Chroma data; defaults to backend/chroma_db
+    VECTOR_REBUILD_WORKERS: int = 2  # Background threads re-embedding notes whose index is missing
+    RAG_CONTEXT_TOKENS: int = 350  # Budget for retrieved excerpts in a note chat prompt
+    RAG_CANDIDATES: int = 12  # Chunks retrieved before packing to the budget
+    RAG_MMR_LAMBDA: float = 0.7  # 1 ranks purely by relevance, lower values favour diverse excerpts
+    RAG_DUPLICATE_SIMILARITY: float = 0.85  # Excerpts at least this similar to a picked one are dropped
+    
+    # Exports
+    EXPORT_RENDER_WORKERS: int = 2  # Process pool size / max concurrent PDF renders
+    EXPORT_RENDER_TIMEOUT: float = 60.0  # Seconds before a single render is abandoned
+    EXPORT_PDF_CACHE_MAX_BYTES: int = 200 * 1024 * 1024  # On-disk PDF cache budget
+    
+    # Response Compression
+    COMPRESSION_MIN_SIZE: int = 1024  # Don't compress smaller non-streamed bodies
+    COMPRESSION_FLUSH_BYTES: int = 1024  # Flush streamed output once this much is pending
+    COMPRESSION_FLUSH_INTERVAL: float = 0.05  # ...or once it has been pending this long (seconds)
+    
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "json"  # "json" (one object per line) or "text"
+    LOG_QUEUE_SIZE: int = 10000  # Records beyond this are dropped rather than blocking
+    LOG_SAMPLE_RATES: dict[str, float] = {}  # e.g. {"DEBUG": 0.05}: keep 5% of requests' debug lines
+    
+    # Tracing (OpenTelemetry)
+    TRACING_ENABLED: bool = False
+    TRACING_OTLP_ENDPOINT: Optional[str] = None  # e.g. http://localhost:4317; spans go to TRACING_FILE when unset
+    TRACING_FILE: str = "traces.jsonl"  # OTLP/JSON lines
+    TRACING_SAMPLE_RATIO: float = 1.0
     
     # CORS
     BACKEND_CORS_ORIGINS: list[str] = ["http://localhost:5173", "http://127.0.0.1:5173"]
@@ -39,6 +100,9 @@ class Settings(BaseSettings):
     ENVIRONMENT: str = "development"
     DEBUG: bool = True
 
+    # YouTube
+    YOUTUBE_API_KEY: Optional[str] = None  # Data API key for reading playlists; without it the playlist page is parsed
+    
     # OpenRouter
     OPENROUTER_API_KEY: Optional[str] = os.getenv("OPENROUTER_API_KEY")
     OPENROUTER_MODEL: str = os.getenv("OPENROUTER_MODEL", "meta-llama/llama-3.3-70b-instruct:free")
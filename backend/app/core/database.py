@@ -1,14 +1,20 @@
-from sqlalchemy import create_engine, inspect
+from sqlalchemy import create_engine, inspect, event
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
+from app.core.metrics import DB_QUERY_SECONDS
+from app.core.tracing import start_span
+from app.core.logger import get_logger
 import os
+import time
+
+logger = get_logger(__name__)
 
 SQLALCHEMY_DATABASE_URL = settings.DATABASE_URL or "sqlite:///./notebuddy.db"
 
 if SQLALCHEMY_DATABASE_URL != "sqlite:///./notebuddy.db":
-    print(f"Using PostgreSQL connection with SSL")
+    logger.info("Using PostgreSQL connection with SSL")
 else:
-    print(f"Using SQLite fallback")
+    logger.info("Using SQLite fallback")
 
 # SQLAlchemy engine creation
 if "sqlite" in SQLALCHEMY_DATABASE_URL:
@@ -25,6 +31,32 @@ engine = create_engine(
     max_overflow=10      # Allow 10 extra connections
 )
 
+# Time every statement for the notesbuddy_db_query_seconds histogram (and trace it when enabled)
+@event.listens_for(engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+    conn.info.setdefault("query_span", []).append(start_span("db.query", {
+        "db.system": conn.dialect.name,
+        "db.statement": statement[:1000],
+        "db.executemany": executemany,
+    }))
+
+@event.listens_for(engine, "after_cursor_execute")
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    DB_QUERY_SECONDS.observe(time.perf_counter() - conn.info["query_start_time"].pop())
+    query_span = conn.info["query_span"].pop()
+    if cursor.rowcount is not None and cursor.rowcount >= 0:
+        query_span.set_attribute("db.rowcount", cursor.rowcount)
+    query_span.end()
+
+@event.listens_for(engine, "handle_error")
+def _discard_query_timer(context):
+    if context.connection is not None and context.connection.info.get("query_start_time"):
+        context.connection.info["query_start_time"].pop()
+        query_span = context.connection.info["query_span"].pop()
+        query_span.record_exception(context.original_exception)
+        query_span.end()
+
 # SessionLocal class creation
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -35,23 +67,28 @@ def create_tables():
     """Create all tables in the database if they don't exist."""
     try:
         # Import models here to ensure they are registered with Base.metadata
-        from app.models import user_pref_model, notes_model
+        from app.models import user_pref_model, notes_model, generation_job_model
         
         inspector = inspect(engine)
         existing_tables = inspector.get_table_names()
         
         # Check if our core tables exist (e.g., 'users')
         if "users" in existing_tables and "notes" in existing_tables:
-            print("Database tables already exist. Skipping creation.")
+            logger.info("Database tables already exist. Skipping creation.")
             return
 
-        print(f"Creating tables for database...")
+        logger.info("Creating tables for database...")
         Base.metadata.create_all(bind=engine)
-        print("Tables created successfully.")
+
+        from app.services.search_service import SearchService
+        with engine.begin() as connection:
+            SearchService.ensure_search_index(connection)
+        logger.info("Tables created successfully.")
     except Exception as e:
-        print(f"Warning: Database connection failed - {str(e)[:100]}")
-        print("Application will continue with limited functionality.")
-        print("Please update your .env file with Supabase POOLER connection details.")
+        logger.warning(
+            "Database connection failed - %s. Application will continue with limited functionality. "
+            "Please update your .env file with Supabase POOLER connection details.", str(e)[:100]
+        )
 
 
 def get_db():
@@ -0,0 +1,511 @@
+"""
+Concurrency limits and daily token quotas shared by every worker.
+
+`get_limiter().semaphore(pool, capacity)` returns something to use with
+`async with` (directly or through `metrics.acquire`). `get_quota()` tracks
+per-user daily token usage. `reserve_tokens()` holds a request's estimated
+input against the limit up front, with a conditional update, so concurrent
+requests can't all pass the check and then overshoot: the limit is exceeded
+by at most the request that reached it. The Reservation is settled with the
+actual usage when the work ends.
+
+LIMITER_BACKEND:
+  local     asyncio.Semaphore per process (default). Effective cluster-wide
+            capacity is capacity x number of workers.
+  redis     a sorted set of leased slots in REDIS_URL. A slot held by a worker
+            that dies is freed after LIMITER_LEASE_SECONDS.
+  postgres  session-level advisory locks, one per slot. Postgres frees the
+            locks of a dead worker when its connection drops.
+
+QUOTA_BACKEND:
+  database  the token_usage table, updated with an atomic upsert (default)
+  redis     one INCRBY counter per user and day in REDIS_URL
+
+If the configured backend can't be reached, the limiter falls back to the
+local semaphore and the quota check lets the request through, so an outage
+of the coordination store degrades limits rather than the service.
+"""
+import asyncio
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import date
+from typing import Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.metrics import LIMITER_FALLBACKS
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+KEY_PREFIX = "notesbuddy"
+
+# Backoff between attempts while every slot is taken
+POLL_MIN_SECONDS = 0.02
+POLL_MAX_SECONDS = 0.5
+# After the shared store fails, use the local semaphore for this long before trying it again
+BACKEND_RETRY_SECONDS = 10
+
+
+class LocalLimiter:
+    """Per-process semaphores."""
+
+    name = "local"
+
+    def __init__(self):
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def semaphore(self, pool: str, capacity: int):
+        if pool not in self._semaphores:
+            self._semaphores[pool] = asyncio.Semaphore(capacity)
+        return self._semaphores[pool]
+
+
+class Slot:
+    """One acquired slot of a DistributedSemaphore; release() hands back exactly this one."""
+
+    def __init__(self, semaphore: "DistributedSemaphore", token):
+        self.semaphore = semaphore
+        self.token = token  # None for a slot of the local fallback semaphore
+        self.task = asyncio.current_task()
+        self.released = False
+
+    async def release(self) -> None:
+        if self.released:
+            return
+        self.released = True
+        await self.semaphore._release_slot(self)
+
+
+class DistributedSemaphore:
+    """
+    Base for semaphores whose slots live in a shared store.
+
+    Subclasses implement `_try_acquire() -> token | None` and `_release(token)`.
+    `__aenter__` returns a Slot holding its own token, to be released with
+    `slot.release()` from any task (metrics.acquire does this). Plain
+    `async with` works too when the block exits in the task that entered it.
+    When the store is unreachable a per-process semaphore stands in.
+    """
+
+    backend = "distributed"
+
+    def __init__(self, pool: str, capacity: int):
+        self.pool = pool
+        self.capacity = capacity
+        self._fallback = asyncio.Semaphore(capacity)
+        self._slots: set[Slot] = set()
+        self._backend_down_until = 0.0
+
+    async def __aenter__(self) -> Slot:
+        token = None
+        if time.monotonic() >= self._backend_down_until:
+            try:
+                token = await self._wait_for_slot()
+            except Exception as e:
+                self._backend_down_until = time.monotonic() + BACKEND_RETRY_SECONDS
+                logger.warning("Limiter backend %s unavailable, using the local semaphore: %s", self.backend, e)
+        if token is None:
+            LIMITER_FALLBACKS.labels(self.backend).inc()
+            await self._fallback.acquire()
+        slot = Slot(self, token)
+        self._slots.add(slot)
+        return slot
+
+    async def __aexit__(self, exc_type, exc, tb):
+        task = asyncio.current_task()
+        # Without the Slot in hand, only a slot this task entered can be the right one
+        slot = next((slot for slot in reversed(list(self._slots)) if slot.task is task), None)
+        if slot is None:
+            raise RuntimeError(f"No {self.pool} slot held by this task; release the Slot returned on entry")
+        await slot.release()
+
+    async def _release_slot(self, slot: Slot) -> None:
+        self._slots.discard(slot)
+        if slot.token is None:
+            self._fallback.release()
+            return
+        try:
+            await self._release(slot.token)
+        except Exception as e:
+            logger.warning("Failed to release %s slot, it expires on its own: %s", self.pool, e)
+
+    async def _wait_for_slot(self):
+        delay = POLL_MIN_SECONDS
+        while True:
+            token = await self._try_acquire()
+            if token is not None:
+                return token
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, POLL_MAX_SECONDS)
+
+    async def _try_acquire(self):
+        raise NotImplementedError
+
+    async def _release(self, token) -> None:
+        raise NotImplementedError
+
+
+# Drop expired leases, then take a slot if one is free. Scores are lease expiry times
+# from the Redis clock, so worker clock skew doesn't matter.
+_REDIS_ACQUIRE = """
+local now = redis.call('TIME')
+local now_ms = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now_ms)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now_ms + tonumber(ARGV[2]), ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Extend the leases of slots this worker still holds
+_REDIS_RENEW = """
+local now = redis.call('TIME')
+local expires = tonumber(now[1]) * 1000 + math.floor(tonumber(now[2]) / 1000) + tonumber(ARGV[1])
+for i = 2, #ARGV do
+    redis.call('ZADD', KEYS[1], 'XX', expires, ARGV[i])
+end
+redis.call('PEXPIRE', KEYS[1], ARGV[1])
+return 1
+"""
+
+
+class RedisSemaphore(DistributedSemaphore):
+    backend = "redis"
+
+    def __init__(self, client, pool: str, capacity: int):
+        super().__init__(pool, capacity)
+        self.client = client
+        self.key = f"{KEY_PREFIX}:semaphore:{pool}"
+        self.lease_ms = int(settings.LIMITER_LEASE_SECONDS * 1000)
+        self._renewer: asyncio.Task | None = None
+
+    async def _try_acquire(self):
+        token = uuid.uuid4().hex
+        # EVAL rather than EVALSHA so Redis-compatible servers without a script cache work too
+        if await self.client.eval(_REDIS_ACQUIRE, 1, self.key, self.capacity, self.lease_ms, token):
+            if self._renewer is None or self._renewer.done():
+                self._renewer = asyncio.create_task(self._renew_leases())
+            return token
+        return None
+
+    async def _release(self, token) -> None:
+        await self.client.zrem(self.key, token)
+
+    async def _renew_leases(self):
+        # Long streams outlive a lease; keep ours alive until nothing is held
+        while True:
+            await asyncio.sleep(settings.LIMITER_LEASE_SECONDS / 3)
+            tokens = [slot.token for slot in self._slots if slot.token is not None]
+            if not tokens:
+                return
+            try:
+                await self.client.eval(_REDIS_RENEW, 1, self.key, self.lease_ms, *tokens)
+            except Exception as e:
+                logger.warning("Failed to renew %s slot leases: %s", self.pool, e)
+
+
+class RedisLimiter(LocalLimiter):
+    name = "redis"
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+
+    def semaphore(self, pool: str, capacity: int):
+        if pool not in self._semaphores:
+            self._semaphores[pool] = RedisSemaphore(self.client, pool, capacity)
+        return self._semaphores[pool]
+
+
+class AdvisoryLockSemaphore(DistributedSemaphore):
+    """Slot i of a pool is the advisory lock (crc32(pool), i), held on a dedicated connection."""
+
+    backend = "postgres"
+
+    def __init__(self, engine, pool: str, capacity: int):
+        super().__init__(pool, capacity)
+        self.engine = engine
+        # Advisory lock keys are two signed int4s
+        self.lock_class = zlib.crc32(f"{KEY_PREFIX}:{pool}".encode()) - 2**31
+
+    async def _try_acquire(self):
+        from fastapi.concurrency import run_in_threadpool
+        return await run_in_threadpool(self._try_lock)
+
+    def _try_lock(self):
+        from sqlalchemy import text
+        connection = self.engine.connect()
+        try:
+            first = random.randrange(self.capacity)
+            for offset in range(self.capacity):
+                slot = (first + offset) % self.capacity
+                locked = connection.execute(
+                    text("SELECT pg_try_advisory_lock(:lock_class, :slot)"),
+                    {"lock_class": self.lock_class, "slot": slot}
+                ).scalar()
+                if locked:
+                    connection.commit()
+                    return connection, slot
+            connection.rollback()
+        except Exception:
+            connection.close()
+            raise
+        connection.close()
+        return None
+
+    async def _release(self, token) -> None:
+        from fastapi.concurrency import run_in_threadpool
+        await run_in_threadpool(self._unlock, *token)
+
+    def _unlock(self, connection, slot: int) -> None:
+        from sqlalchemy import text
+        try:
+            connection.execute(
+                text("SELECT pg_advisory_unlock(:lock_class, :slot)"),
+                {"lock_class": self.lock_class, "slot": slot}
+            )
+            connection.commit()
+        finally:
+            connection.close()
+
+
+class PostgresLimiter(LocalLimiter):
+    name = "postgres"
+
+    def __init__(self, engine):
+        super().__init__()
+        self.engine = engine
+
+    def semaphore(self, pool: str, capacity: int):
+        if pool not in self._semaphores:
+            self._semaphores[pool] = AdvisoryLockSemaphore(self.engine, pool, capacity)
+        return self._semaphores[pool]
+
+
+class DatabaseQuota:
+    """Daily usage in the token_usage table."""
+
+    name = "database"
+
+    def used(self, user_id: int, db: Session) -> int:
+        from app.models.token_usage_model import TokenUsage
+        usage = db.query(TokenUsage).filter(
+            TokenUsage.user_id == user_id,
+            TokenUsage.date == date.today()
+        ).first()
+        return usage.tokens_used if usage else 0
+
+    def reserve(self, user_id: int, tokens: int, limit: int, db: Session) -> bool:
+        """Add `tokens` to today's usage if it is still under `limit`, in one conditional update."""
+        from app.models.token_usage_model import TokenUsage
+        today = date.today()
+        try:
+            self._ensure_row(user_id, today, db)
+            # Concurrent reservations queue on the row lock and re-check the condition
+            reserved = db.query(TokenUsage).filter(
+                TokenUsage.user_id == user_id,
+                TokenUsage.date == today,
+                TokenUsage.tokens_used < limit
+            ).update({TokenUsage.tokens_used: TokenUsage.tokens_used + tokens}, synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        return reserved == 1
+
+    def _ensure_row(self, user_id: int, today: date, db: Session) -> None:
+        from app.models.token_usage_model import TokenUsage
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            db.execute(insert(TokenUsage).values(user_id=user_id, date=today, tokens_used=0).on_conflict_do_nothing(
+                index_elements=["user_id", "date"]
+            ))
+        elif not db.query(TokenUsage.id).filter(TokenUsage.user_id == user_id, TokenUsage.date == today).first():
+            db.add(TokenUsage(user_id=user_id, date=today, tokens_used=0))
+            db.flush()
+
+    def consume(self, user_id: int, tokens: int, db: Session) -> None:
+        from app.models.token_usage_model import TokenUsage
+        today = date.today()
+        dialect = db.get_bind().dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            # A single upsert, so concurrent requests (and workers) can't lose each other's updates
+            if dialect == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            statement = insert(TokenUsage).values(user_id=user_id, date=today, tokens_used=tokens)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=["user_id", "date"],
+                set_={"tokens_used": TokenUsage.tokens_used + statement.excluded.tokens_used}
+            ))
+        else:
+            usage = db.query(TokenUsage).filter(
+                TokenUsage.user_id == user_id,
+                TokenUsage.date == today
+            ).with_for_update().first()
+            if usage:
+                usage.tokens_used += tokens
+            else:
+                db.add(TokenUsage(user_id=user_id, date=today, tokens_used=tokens))
+        db.commit()
+
+
+class RedisQuota:
+    """Daily usage as Redis counters that expire two days later."""
+
+    name = "redis"
+
+    def __init__(self, client):
+        self.client = client
+
+    def _key(self, user_id: int) -> str:
+        return f"{KEY_PREFIX}:quota:{user_id}:{date.today().isoformat()}"
+
+    def used(self, user_id: int, db: Session = None) -> int:
+        return int(self.client.get(self._key(user_id)) or 0)
+
+    def reserve(self, user_id: int, tokens: int, limit: int, db: Session = None) -> bool:
+        """INCRBY, taken back if usage was already at `limit`; atomic, unlike a read then a write."""
+        key = self._key(user_id)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.incrby(key, tokens)
+        pipeline.expire(key, 2 * 24 * 3600)
+        used = pipeline.execute()[0]
+        if used - tokens >= limit:
+            self.client.decrby(key, tokens)
+            return False
+        return True
+
+    def consume(self, user_id: int, tokens: int, db: Session = None) -> None:
+        key = self._key(user_id)
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.incrby(key, tokens)
+        pipeline.expire(key, 2 * 24 * 3600)
+        pipeline.execute()
+        # Commit whatever else the request wrote, as the database quota does
+        if db is not None:
+            db.commit()
+
+
+_limiter = None
+_quota = None
+_lock = threading.Lock()
+
+
+def _redis_client(asyncio_client: bool):
+    if not settings.REDIS_URL:
+        raise RuntimeError("REDIS_URL is not set")
+    if asyncio_client:
+        import redis.asyncio as redis
+    else:
+        import redis
+    return redis.Redis.from_url(settings.REDIS_URL, socket_timeout=5, socket_connect_timeout=2)
+
+
+def get_limiter():
+    """The configured limiter (LIMITER_BACKEND), created on first use."""
+    global _limiter
+    if _limiter is None:
+        with _lock:
+            if _limiter is None:
+                _limiter = _create_limiter(settings.LIMITER_BACKEND)
+    return _limiter
+
+
+def _create_limiter(backend: str):
+    try:
+        if backend == "redis":
+            return RedisLimiter(_redis_client(asyncio_client=True))
+        if backend == "postgres":
+            from sqlalchemy import create_engine
+            from app.core.database import SQLALCHEMY_DATABASE_URL
+            if not SQLALCHEMY_DATABASE_URL.startswith("postgresql"):
+                raise RuntimeError("the database is not PostgreSQL")
+            # Every held slot pins a connection, so keep them out of the request pool
+            engine = create_engine(SQLALCHEMY_DATABASE_URL, pool_pre_ping=True, pool_size=2, max_overflow=64)
+            return PostgresLimiter(engine)
+    except Exception as e:
+        logger.warning("LIMITER_BACKEND=%s is unavailable, limits are per process: %s", backend, e)
+        return LocalLimiter()
+    if backend != "local":
+        logger.warning("Unknown LIMITER_BACKEND %r, limits are per process", backend)
+    return LocalLimiter()
+
+
+def get_quota():
+    """The configured daily token quota store (QUOTA_BACKEND), created on first use."""
+    global _quota
+    if _quota is None:
+        with _lock:
+            if _quota is None:
+                _quota = DatabaseQuota()
+                if settings.QUOTA_BACKEND == "redis":
+                    try:
+                        _quota = RedisQuota(_redis_client(asyncio_client=False))
+                    except Exception as e:
+                        logger.warning("QUOTA_BACKEND=redis is unavailable, using the database: %s", e)
+    return _quota
+
+
+def tokens_used(user_id: int, db: Session) -> int:
+    """Tokens the user has used today; 0 if the quota store can't be reached."""
+    quota = get_quota()
+    try:
+        return quota.used(user_id, db)
+    except Exception as e:
+        LIMITER_FALLBACKS.labels(f"quota_{quota.name}").inc()
+        logger.warning("Quota backend %s unavailable, not enforcing the daily limit: %s", quota.name, e)
+        return 0
+
+
+def record_tokens(user_id: int, tokens: int, db: Session) -> None:
+    get_quota().consume(user_id, tokens, db)
+
+
+class Reservation:
+    """Tokens held against today's quota by work in progress, until it reports what it used."""
+
+    def __init__(self, user_id: int, tokens: int):
+        self.user_id = user_id
+        self.tokens = tokens
+
+    def settle(self, tokens: int, db: Session) -> None:
+        """Record `tokens` as used, counting what is held towards them. Later calls record in full."""
+        held, self.tokens = self.tokens, 0
+        record_tokens(self.user_id, tokens - held, db)
+
+    def release(self, db: Session) -> None:
+        """Give back whatever is still held, for work that ended without using it."""
+        if self.tokens:
+            self.settle(0, db)
+
+
+def reserve_tokens(user_id: int, tokens: int, db: Session) -> Optional[Reservation]:
+    """
+    Hold `tokens` (a request's estimated input) against the daily limit, or None
+    if today's usage has already reached it. The estimate doesn't have to fit in
+    what is left, so a long input is still admitted, but once it is held the
+    requests after it see the limit reached. Without tokens it is only a check.
+    If the quota store can't be reached the limit isn't enforced, as in tokens_used.
+    """
+    if not tokens:
+        return Reservation(user_id, 0) if tokens_used(user_id, db) < settings.DAILY_TOKEN_LIMIT else None
+    quota = get_quota()
+    try:
+        if not quota.reserve(user_id, tokens, settings.DAILY_TOKEN_LIMIT, db):
+            return None
+    except Exception as e:
+        LIMITER_FALLBACKS.labels(f"quota_{quota.name}").inc()
+        logger.warning("Quota backend %s unavailable, not enforcing the daily limit: %s", quota.name, e)
+        return Reservation(user_id, 0)
+    return Reservation(user_id, tokens)
@@ -0,0 +1,141 @@
+import os
+import time
+from contextlib import asynccontextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from app.core.tracing import set_attributes
+
+# Buckets tuned for LLM pipeline stages (seconds to minutes)
+PIPELINE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+# Buckets for in-process work (sub-millisecond to seconds)
+FAST_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+TRANSCRIPT_FETCH_SECONDS = Histogram(
+    "notesbuddy_transcript_fetch_seconds", "Time to fetch a YouTube transcript", buckets=PIPELINE_BUCKETS
+)
+CLASSIFICATION_SECONDS = Histogram(
+    "notesbuddy_classification_seconds", "Time to classify a transcript as academic", buckets=PIPELINE_BUCKETS
+)
+MAP_CHUNK_SECONDS = Histogram(
+    "notesbuddy_map_chunk_seconds", "Time to generate notes for one transcript chunk", buckets=PIPELINE_BUCKETS
+)
+COMBINE_SECONDS = Histogram(
+    "notesbuddy_combine_seconds", "Time to stream the combined notes", buckets=PIPELINE_BUCKETS
+)
+GENERATION_TTFB_SECONDS = Histogram(
+    "notesbuddy_generation_ttfb_seconds", "Time from /generate request to the first streamed byte",
+    ["mode"], buckets=PIPELINE_BUCKETS
+)
+GENERATION_SECONDS = Histogram(
+    "notesbuddy_generation_seconds", "Total /generate time until the note is saved",
+    ["mode"], buckets=PIPELINE_BUCKETS
+)
+SEMAPHORE_WAIT_SECONDS = Histogram(
+    "notesbuddy_semaphore_wait_seconds", "Time spent waiting for a concurrency slot",
+    ["pool"], buckets=FAST_BUCKETS + (10, 30, 60)
+)
+EMBEDDING_ENCODE_SECONDS = Histogram(
+    "notesbuddy_embedding_encode_seconds", "Time to encode texts with the embedding model", buckets=FAST_BUCKETS
+)
+VECTOR_QUERY_SECONDS = Histogram(
+    "notesbuddy_vector_query_seconds", "Time for a Chroma query", buckets=FAST_BUCKETS
+)
+EXPORT_RENDER_SECONDS = Histogram(
+    "notesbuddy_export_render_seconds", "Time to render an export in the worker pool",
+    ["format"], buckets=FAST_BUCKETS + (10, 30, 60)
+)
+GENERATION_JOB_QUEUE_SECONDS = Histogram(
+    "notesbuddy_generation_job_queue_seconds", "Time a generation job waited for a worker",
+    buckets=FAST_BUCKETS + (10, 30, 60)
+)
+CHAT_CONTEXT_TOKENS = Histogram(
+    "notesbuddy_chat_context_tokens", "Estimated tokens of note context sent with a chat turn",
+    ["source"], buckets=(64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+)
+DB_QUERY_SECONDS = Histogram(
+    "notesbuddy_db_query_seconds", "Time for a single database statement", buckets=FAST_BUCKETS
+)
+
+CACHE_HITS = Counter("notesbuddy_cache_hits_total", "Requests served from a cache", ["cache"])
+CACHE_MISSES = Counter("notesbuddy_cache_misses_total", "Requests that missed a cache", ["cache"])
+LLM_ERRORS = Counter("notesbuddy_llm_errors_total", "Failed LLM calls", ["stage"])
+LLM_RATE_LIMITED = Counter("notesbuddy_llm_rate_limited_total", "LLM calls rejected with HTTP 429", ["stage"])
+LOGS_DROPPED = Counter("notesbuddy_logs_dropped_total", "Log records dropped because the log queue was full")
+GENERATION_JOBS = Counter(
+    "notesbuddy_generation_jobs_total", "Generation jobs by state transition (queued, completed, failed, cancelled)",
+    ["status"]
+)
+LLM_TOKENS = Counter(
+    "notesbuddy_llm_tokens_total",
+    "Estimated LLM tokens (input + output) by whether the result reached the user (delivered) or not (wasted)",
+    ["stage", "outcome"]
+)
+DEADLINES_EXCEEDED = Counter(
+    "notesbuddy_deadlines_exceeded_total", "Work abandoned because its request's deadline passed", ["stage"]
+)
+VECTOR_CHUNKS = Counter(
+    "notesbuddy_vector_chunks_total",
+    "Note and transcript chunks written to the vector store, by action (embedded, reused, deleted)",
+    ["source", "action"]
+)
+CHAT_CONTEXT = Counter(
+    "notesbuddy_chat_context_total",
+    "Note chat turns by where their context came from (rag, or full_note when the note has no index)",
+    ["source"]
+)
+VECTOR_INDEX_REBUILDS = Counter(
+    "notesbuddy_vector_index_rebuilds_total", "Missing note indexes rebuilt in the background", ["outcome"]
+)
+LIMITER_FALLBACKS = Counter(
+    "notesbuddy_limiter_fallbacks_total", "Limit checks that fell back to per-process limits", ["backend"]
+)
+
+
+@asynccontextmanager
+async def acquire(semaphore, pool: str):
+    """
+    `async with semaphore` that records how long the caller queued for a slot.
+    Waiting is bounded by the current request's deadline (see app/core/budget.py).
+    """
+    from app.core.budget import within
+
+    start = time.perf_counter()
+    # Distributed semaphores return their slot; releasing that handle rather than calling
+    # __aexit__ stays correct when the block is finalised in another task
+    slot = await within(semaphore.__aenter__(), f"{pool}_slot")
+    try:
+        waited = time.perf_counter() - start
+        SEMAPHORE_WAIT_SECONDS.labels(pool).observe(waited)
+        set_attributes({"semaphore.pool": pool, "semaphore.wait_seconds": waited})
+        yield
+    finally:
+        if hasattr(slot, "release"):
+            await slot.release()
+        else:
+            await semaphore.__aexit__(None, None, None)
+
+
+def record_llm_error(stage: str, error: Exception) -> None:
+    from app.core.budget import DeadlineExceeded
+
+    if isinstance(error, DeadlineExceeded):
+        return  # counted in DEADLINES_EXCEEDED
+    LLM_ERRORS.labels(stage).inc()
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429 or type(error).__name__ == "RateLimitError":
+        LLM_RATE_LIMITED.labels(stage).inc()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Serialise metrics, aggregating across workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
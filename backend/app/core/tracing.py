@@ -0,0 +1,176 @@
+"""
+Optional OpenTelemetry tracing.
+
+Instrumented code calls `span()` / `start_span()` / `set_attributes()`. Until
+`setup_tracing()` installs an SDK provider (TRACING_ENABLED=true) these return
+immediately, so the instrumentation is close to free when tracing is off.
+Spans are exported to an OTLP collector when TRACING_OTLP_ENDPOINT is set and
+otherwise appended to TRACING_FILE as OTLP/JSON lines.
+"""
+import base64
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from functools import wraps
+from app.core.config import settings
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+except ImportError:  # tracing is optional
+    trace = None
+    SpanExporter = object
+
+# Plain logging.getLogger: app.core.logger imports metrics, which imports this module
+logger = logging.getLogger(__name__)
+
+_tracer = None
+_provider = None
+
+
+class _NoopSpan:
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def add_event(self, name, attributes=None):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class OTLPFileSpanExporter(SpanExporter):
+    """Append spans to a file as OTLP/JSON, one ExportTraceServiceRequest per line."""
+
+    _ID_KEYS = ("traceId", "spanId", "parentSpanId")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from google.protobuf.json_format import MessageToDict
+        from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+
+        payload = MessageToDict(encode_spans(spans))
+        self._hex_ids(payload)
+        line = json.dumps(payload, separators=(",", ":"))
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning("Failed to write traces to %s: %s", self.path, e)
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+    @classmethod
+    def _hex_ids(cls, node):
+        # Protobuf JSON encodes bytes as base64, OTLP/JSON wants trace and span ids in hex
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key in cls._ID_KEYS and isinstance(value, str):
+                    node[key] = base64.b64decode(value).hex()
+                else:
+                    cls._hex_ids(value)
+        elif isinstance(node, list):
+            for item in node:
+                cls._hex_ids(item)
+
+
+def setup_tracing(app=None) -> None:
+    """Install the SDK tracer provider when tracing is enabled. Call before the app starts serving."""
+    global _tracer, _provider
+    if not settings.TRACING_ENABLED or _tracer is not None:
+        return
+    if trace is None:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed. Tracing is disabled.")
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    if settings.TRACING_OTLP_ENDPOINT:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=settings.TRACING_OTLP_ENDPOINT)
+    else:
+        exporter = OTLPFileSpanExporter(settings.TRACING_FILE)
+
+    _provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.PROJECT_NAME, "service.version": settings.VERSION}),
+        sampler=ParentBased(TraceIdRatioBased(settings.TRACING_SAMPLE_RATIO)),
+    )
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(_provider)
+    _tracer = trace.get_tracer("notesbuddy")
+
+    if app is not None:
+        # Request-level root spans (covering the whole streamed response) when available
+        try:
+            from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+            FastAPIInstrumentor.instrument_app(app, excluded_urls="metrics,health,ready")
+        except ImportError:
+            pass
+
+
+def shutdown_tracing() -> None:
+    """Flush buffered spans."""
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def tracing_enabled() -> bool:
+    return _tracer is not None
+
+
+def _clean(attributes):
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextmanager
+def span(name: str, attributes: dict = None):
+    """Run the block inside a child span of the current one."""
+    if _tracer is None:
+        yield NOOP_SPAN
+        return
+    with _tracer.start_as_current_span(name, attributes=_clean(attributes or {})) as current:
+        yield current
+
+
+def start_span(name: str, attributes: dict = None):
+    """Start a span without making it current; the caller must `end()` it."""
+    if _tracer is None:
+        return NOOP_SPAN
+    return _tracer.start_span(name, attributes=_clean(attributes or {}))
+
+
+def set_attributes(attributes: dict) -> None:
+    """Attach attributes to the current span, if any."""
+    if _tracer is None:
+        return
+    trace.get_current_span().set_attributes(_clean(attributes))
+
+
+def traced(name: str):
+    """Decorator form of `span()` for plain functions."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
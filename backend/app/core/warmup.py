@@ -0,0 +1,92 @@
+"""
+Background warmup of slow subsystems and the state behind GET /ready.
+
+The app starts serving (and /health answers) immediately; this task then
+creates the tables, builds the LLM chains, loads the embedding model, opens
+the vector store and starts the export workers. /ready only reports ready once
+the required subsystems are up; the optional ones degrade features (RAG chat,
+exports) rather than the whole service, so they are reported but not waited on.
+"""
+import inspect
+import time
+from fastapi.concurrency import run_in_threadpool
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+REQUIRED_SUBSYSTEMS = ("database", "llm")
+OPTIONAL_SUBSYSTEMS = ("embeddings", "vector_store", "export")
+
+subsystems = {name: {"state": "cold"} for name in REQUIRED_SUBSYSTEMS + OPTIONAL_SUBSYSTEMS}
+
+
+def _load_database():
+    from sqlalchemy import text
+    from app.core.database import create_tables, engine
+    create_tables()
+    # create_tables() logs and carries on when the database is unreachable; readiness must not
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+
+
+def _load_llm():
+    from app.services.llm_service import get_llm_service
+    get_llm_service()
+
+
+def _load_embeddings():
+    from app.services.vector_service import get_embedding_model
+    if get_embedding_model() is None:
+        raise RuntimeError("embedding model unavailable")
+
+
+def _load_vector_store():
+    from app.services.vector_service import get_chroma_client
+    get_chroma_client()
+
+
+async def _load_export():
+    from app.services.export_service import ExportService
+    await ExportService.warmup()
+
+
+LOADERS = {
+    "database": _load_database,
+    "llm": _load_llm,
+    "embeddings": _load_embeddings,
+    "vector_store": _load_vector_store,
+    "export": _load_export,
+}
+
+
+async def warm_subsystem(name: str) -> None:
+    loader = LOADERS[name]
+    subsystems[name] = {"state": "warming"}
+    start = time.perf_counter()
+    try:
+        if inspect.iscoroutinefunction(loader):
+            await loader()
+        else:
+            await run_in_threadpool(loader)
+    except Exception as e:
+        subsystems[name] = {"state": "failed", "error": str(e)[:200], "seconds": round(time.perf_counter() - start, 3)}
+        logger.warning("Warmup of %s failed: %s", name, e)
+        return
+    subsystems[name] = {"state": "ready", "seconds": round(time.perf_counter() - start, 3)}
+    logger.info("Warmed up %s", name, extra={"subsystem": name, "seconds": subsystems[name]["seconds"]})
+
+
+async def warmup(names=REQUIRED_SUBSYSTEMS + OPTIONAL_SUBSYSTEMS) -> None:
+    """Warm subsystems one at a time (required ones first) to keep CPU free for early requests."""
+    for name in names:
+        await warm_subsystem(name)
+
+
+def readiness() -> tuple[bool, dict]:
+    ready = all(subsystems[name]["state"] == "ready" for name in REQUIRED_SUBSYSTEMS)
+    return ready, {
+        "ready": ready,
+        "subsystems": {
+            name: {**state, "required": name in REQUIRED_SUBSYSTEMS} for name, state in subsystems.items()
+        },
+    }
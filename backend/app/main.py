@@ -1,9 +1,17 @@
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
-from app.core.database import create_tables
+from app.core.warmup import warmup, readiness, REQUIRED_SUBSYSTEMS
+from app.services.job_service import GenerationJobService
+from app.core.compression import CompressionMiddleware
+from app.core.tracing import setup_tracing, shutdown_tracing
+from app.core.logger import RequestLoggingMiddleware, get_logger
 from app.api.v1 import api_router
 
+logger = get_logger(__name__)
+
 # FastAPI application creation
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -12,11 +20,37 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json"
 )
 
-# Startup event to create tables only once
+# Tracing is a no-op unless TRACING_ENABLED is set
+setup_tracing(app)
+
+# Startup event: warm slow subsystems (tables, LLM chains, embedding model, export workers)
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables on startup."""
-    create_tables()
+    """Start serving immediately and warm up in the background; see /ready."""
+    GenerationJobService.start()
+    try:
+        from app.core.database import SessionLocal
+        db = SessionLocal()
+        try:
+            # Jobs orphaned by a worker that was killed, rather than shut down
+            GenerationJobService.expire_stale(db)
+        finally:
+            db.close()
+    except Exception as e:
+        logger.warning("Could not expire abandoned generation jobs: %s", e)
+    if settings.WARMUP_ON_STARTUP:
+        app.state.warmup_task = asyncio.create_task(warmup())
+    else:
+        # Only what every request needs; the rest loads lazily on first use
+        await warmup(REQUIRED_SUBSYSTEMS)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background worker pools and flush traces."""
+    from app.services.export_service import ExportService
+    await GenerationJobService.shutdown()
+    ExportService.shutdown()
+    shutdown_tracing()
 
 # Cors Configuration
 app.add_middleware(
@@ -25,8 +59,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID"],
+)
+
+# Response compression (gzip/brotli), safe for streamed notes and chat answers
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    flush_size=settings.COMPRESSION_FLUSH_BYTES,
+    flush_interval=settings.COMPRESSION_FLUSH_INTERVAL,
 )
 
+# Request ids and one structured access log line per request (outermost)
+app.add_middleware(RequestLoggingMiddleware)
+
 # Include API routes
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -39,7 +85,22 @@ async def root():
         "docs": f"{settings.API_V1_STR}/docs"
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    from fastapi import Response
+    from app.core.metrics import render_metrics
+
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "service": settings.PROJECT_NAME}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 503 until the required subsystems are warm, with per-subsystem state."""
+    ready, body = readiness()
+    return JSONResponse(body, status_code=200 if ready else 503)
@@ -0,0 +1,43 @@
+from pydantic import BaseModel
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index
+from datetime import datetime
+from app.core.database import Base
+
+JOB_ACTIVE_STATUSES = ("queued", "running")
+JOB_FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+class GenerationJob(Base):
+    """A note generation run, tracked independently of the request that started it."""
+    __tablename__ = "generation_jobs"
+
+    id = Column(String(32), primary_key=True)  # uuid4 hex
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    video_id = Column(String, nullable=False)
+    language = Column(String, nullable=False)
+    style = Column(String, nullable=False)
+    status = Column(String(20), nullable=False, default="queued")  # queued, running, completed, failed, cancelled
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="SET NULL"), nullable=True)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Finds a user's active job for the same video variant when it is submitted again
+    __table_args__ = (
+        Index('ix_generation_jobs_user_video', 'user_id', 'video_id', 'status'),
+    )
+
+
+class GenerationJobResponse(BaseModel):
+    job_id: str
+    status: str
+    video_id: str
+    language: str
+    style: str
+    note_id: int | None = None
+    error: str | None = None
+    output_chars: int | None = None  # Generated so far, while the job runs in this worker
+    created_at: datetime
+    started_at: datetime | None = None
+    finished_at: datetime | None = None
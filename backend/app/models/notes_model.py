@@ -1,7 +1,70 @@
 from pydantic import BaseModel, HttpUrl
 from app.core.database import Base
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, LargeBinary
+from sqlalchemy.orm import validates, deferred, relationship
 from datetime import datetime
+from app.utils.transcript import Transcript
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zlib fallback keeps transcripts readable without the optional codec
+    zstandard = None
+
+
+def compress_bytes(raw: bytes) -> tuple[str, bytes]:
+    """Compress bytes, returning (codec, payload)."""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def decompress_bytes(codec: str, payload: bytes) -> bytes:
+    """Inverse of compress_bytes."""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed transcripts")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def compress_text(text: str) -> tuple[str, bytes]:
+    """Compress text, returning (codec, payload)."""
+    return compress_bytes(text.encode("utf-8"))
+
+
+def decompress_text(codec: str, payload: bytes) -> str:
+    """Inverse of compress_text."""
+    return decompress_bytes(codec, payload).decode("utf-8")
+
+
+class NoteTranscript(Base):
+    """Compressed transcript, kept off the notes row so note queries stay small."""
+    __tablename__ = "note_transcripts"
+
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True)
+    codec = Column(String(10), nullable=False)
+    raw_length = Column(Integer, nullable=False)  # Characters before compression
+    data = Column(LargeBinary, nullable=False)
+    # Segment timing arrays (Transcript.segments_to_bytes), compressed with the same codec;
+    # NULL for transcripts stored before timings were kept
+    segments = Column(LargeBinary, nullable=True)
+
+    @classmethod
+    def from_text(cls, text: str) -> "NoteTranscript":
+        codec, payload = compress_text(text)
+        segments = None
+        if isinstance(text, Transcript) and text.has_segments:
+            segments = compress_bytes(text.segments_to_bytes())[1]  # Same codec as the text
+        return cls(codec=codec, raw_length=len(text), data=payload, segments=segments)
+
+    @property
+    def text(self) -> Transcript:
+        text = decompress_text(self.codec, self.data)
+        if self.segments is None:
+            return Transcript(text)
+        return Transcript.from_bytes(text, decompress_bytes(self.codec, self.segments))
+
 
 class Notes(Base):
     __tablename__ = "notes"
@@ -9,13 +72,42 @@ class Notes(Base):
     id = Column(Integer, primary_key=True, index=True)
     video_id = Column(String, nullable=False, index=True) # Removed unique=True to allow multiple notes per video (diff lang/style)
     title = Column(String, nullable=False)
-    notes = Column(String, nullable=False)
-    transcript = Column(String, nullable=True)
+    notes = deferred(Column(String, nullable=False))  # Loaded on first access or via undefer()
     language = Column(String, default="en")
     style = Column(String, default="detailed")
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)  # Keyset pagination key
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    notes_snippet = Column(String(200), nullable=True)  # Precomputed list preview
+
+    # Composite index backing keyset pagination of a user's notes
+    __table_args__ = (
+        Index('ix_notes_user_created', user_id, created_at.desc(), id.desc()),
+    )
+
+    # Transcript lives in note_transcripts and is only loaded when accessed
+    transcript_record = relationship(
+        NoteTranscript,
+        uselist=False,
+        lazy="select",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+    @property
+    def transcript(self) -> Transcript | None:
+        record = self.transcript_record
+        return record.text if record is not None else None
+
+    @transcript.setter
+    def transcript(self, value: str | None) -> None:
+        self.transcript_record = NoteTranscript.from_text(value) if value else None
+
+    @validates("notes")
+    def _sync_snippet(self, key, value):
+        """Keep the list preview in step with the notes body at write time."""
+        self.notes_snippet = (value or "")[:200]
+        return value
 
 class NoteCreate(BaseModel):
     video_id: str
@@ -38,6 +130,20 @@ class NoteRequest(BaseModel):
     language: str = "en"
     style: str = "detailed"
 
+class NoteTarget(BaseModel):
+    language: str = "en"
+    style: str = "detailed"
+
+class NoteBatchRequest(BaseModel):
+    url: str
+    targets: list[NoteTarget]
+
+class NoteBulkRequest(BaseModel):
+    playlist: str | None = None  # Playlist URL or ID
+    urls: list[str] = []
+    language: str = "en"
+    style: str = "detailed"
+
 class NoteResponse(BaseModel):
     id: int
     video_id: str
@@ -56,3 +162,26 @@ class NoteSummary(BaseModel):
     language: str
     style: str
     notes_snippet: str
+
+class NoteSearchResult(BaseModel):
+    id: int
+    title: str
+    video_id: str
+    created_at: datetime
+    language: str | None = None
+    style: str | None = None
+    rank: float
+    snippet: str
+
+class SemanticChunk(BaseModel):
+    text: str
+    source: str | None = None
+    score: float
+    start: float | None = None  # Seconds into the video, for transcript chunks with timings
+    end: float | None = None
+
+class NoteSemanticResult(BaseModel):
+    note_id: int
+    title: str
+    score: float
+    chunks: list[SemanticChunk]
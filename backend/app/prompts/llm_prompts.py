@@ -189,7 +189,7 @@ Neural networks form the backbone of modern AI systems and enable machines to le
 CHUNK_GENERATION_PROMPT = """
 You are processing ONE PART of a longer educational video transcript.
 
-This is chunk {chunk_index} out of {total_chunks}.
+This is chunk {chunk_index} out of {total_chunks}{time_range}.
 
 -------------------------
 TRANSCRIPT CHUNK:
@@ -307,3 +307,72 @@ RULES YOU MUST FOLLOW:
 ANSWER:
 """
 
+
+# Chat assistant prompt for questions spanning several of the student's notes
+CHAT_WITH_LIBRARY_PROMPT = """
+You are a highly intelligent and patient teaching assistant.
+
+You are helping a student find and understand material across their WHOLE library of study notes.
+Below are excerpts from several different notes, each labelled with the title of the notes it came from.
+
+-------------------------
+EXCERPTS FROM THE STUDENT'S NOTES:
+{context}
+
+-------------------------
+CHAT HISTORY:
+{chat_history}
+
+-------------------------
+STUDENT QUESTION:
+{user_message}
+
+-------------------------
+RULES YOU MUST FOLLOW:
+1. Your answer must be based on the provided excerpts.
+2. When you use an excerpt, name the notes it came from (e.g. "In *Introduction to Neural Networks* ...").
+3. If several notes cover the topic, explain how they relate or differ.
+4. If the excerpts do not answer the question, say so honestly instead of guessing.
+5. Your tone must be:
+   - Clear
+   - Supportive
+   - Educational
+
+-------------------------
+ANSWER:
+"""
+
+# Prompt for deriving a new language/style variant from already generated notes
+VARIANT_DERIVATION_PROMPT = """
+You are a senior academic editor.
+
+You have received a COMPLETE set of study notes that were already generated from a lecture.
+The notes are written in language "{source_language}" using the "{source_style}" style.
+
+-------------------------
+SOURCE NOTES:
+{source_notes}
+
+-------------------------
+YOUR TASK:
+Rewrite these notes so that they are in language "{language}" and follow the "{style}" style.
+
+MANDATORY RULES:
+1. **SOURCE IS THE ONLY TRUTH**: Use ONLY information present in the source notes. Do NOT add new topics, facts, formulas or code.
+2. **TRANSLATION**: If the target language differs from the source language, translate faithfully. Keep technical terms recognisable (add the original term in brackets where helpful).
+3. **RESTYLING**:
+   - "detailed": Keep every definition, example, formula and code block in full depth.
+   - "summary": Compress to the key ideas and core conclusions.
+   - "bullet points": Use clear hierarchical bullets; each point must be meaningful, not a single word.
+4. **MATH & CODE**: Preserve all LaTeX and code exactly as they appear. Do NOT translate code.
+5. **NO META-COMMENTARY**: Do NOT mention the source notes, the translation or the restyling. Write strictly about the subject matter.
+
+-------------------------
+FINAL STRUCTURE REQUIRED:
+
+# Title
+## Introduction
+## Detailed Discussion & Key Concepts
+## Examples & Applications
+## Conclusion
+"""
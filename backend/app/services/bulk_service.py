@@ -0,0 +1,118 @@
+"""
+Bulk (playlist) note generation as a staged pipeline.
+
+Every video moves through the stages in order, e.g. transcript fetch ->
+classification -> generation, and each stage has its own worker count, so
+transcripts are downloaded while earlier videos are still being generated
+without any stage exceeding its parallelism. The bounded queues between
+stages keep fetches from running far ahead of generation. A video that fails
+a stage is reported and dropped; the rest of the batch carries on.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class SkipItem(Exception):
+    """Raised by a stage to stop an item without failing it (e.g. over quota)."""
+
+
+@dataclass
+class PipelineItem:
+    index: int
+    video_id: str
+    status: str = "pending"  # a stage name while in progress, then completed, failed or skipped
+    note_id: Optional[int] = None
+    detail: Optional[str] = None
+    data: dict = field(default_factory=dict)  # Shared between stages (transcript, source note, ...)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "skipped")
+
+    def complete(self, note_id: int, detail: Optional[str] = None) -> None:
+        """Mark the item as done; later stages are skipped (e.g. an existing note was found)."""
+        self.status, self.note_id, self.detail = "completed", note_id, detail
+
+
+@dataclass
+class Stage:
+    name: str
+    concurrency: int
+    handle: Callable[[PipelineItem], Awaitable[None]]
+
+
+class BulkPipeline:
+    def __init__(self, stages: list[Stage], on_update: Callable[[PipelineItem], None]):
+        self.stages = stages
+        self.on_update = on_update
+
+    async def run(self, items: list[PipelineItem]) -> None:
+        """Run every item through the stages; returns when all have finished."""
+        queues = [asyncio.Queue(maxsize=max(1, stage.concurrency)) for stage in self.stages]
+        workers = [
+            asyncio.create_task(self._worker(index, queues))
+            for index, stage in enumerate(self.stages)
+            for _ in range(max(1, stage.concurrency))
+        ]
+        try:
+            for item in items:
+                await queues[0].put(item)
+            # Items only move forward, so once a queue drains everything behind it has been handed on
+            for queue in queues:
+                await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(self, index: int, queues: list[asyncio.Queue]) -> None:
+        stage = self.stages[index]
+        while True:
+            item = await queues[index].get()
+            try:
+                await self._process(stage, item)
+                if not item.finished:
+                    if index + 1 < len(self.stages):
+                        await queues[index + 1].put(item)
+                    else:
+                        item.status = "completed"
+                        self.on_update(item)
+            finally:
+                queues[index].task_done()
+
+    async def _process(self, stage: Stage, item: PipelineItem) -> None:
+        item.status = stage.name
+        self.on_update(item)
+        try:
+            await stage.handle(item)
+        except SkipItem as e:
+            item.status, item.detail = "skipped", str(e)
+        except Exception as e:
+            logger.warning("Bulk item failed in %s: %s", stage.name, e, extra={"video_id": item.video_id})
+            item.status, item.detail = "failed", getattr(e, "detail", None) or str(e)
+        if item.finished:
+            self.on_update(item)
+
+
+class BulkRegistry:
+    """Active bulk runs per user, to cap them. State is per process like the job pool."""
+
+    _active: dict[int, int] = {}
+
+    @classmethod
+    def active_count(cls, user_id: int) -> int:
+        return cls._active.get(user_id, 0)
+
+    @classmethod
+    def enter(cls, user_id: int) -> None:
+        cls._active[user_id] = cls._active.get(user_id, 0) + 1
+
+    @classmethod
+    def leave(cls, user_id: int) -> None:
+        cls._active[user_id] -= 1
+        if not cls._active[user_id]:
+            del cls._active[user_id]
@@ -0,0 +1,159 @@
+"""
+Token-budgeted RAG context for note chat.
+
+Retrieval over-fetches candidate chunks with their embeddings. Packing then:
+1. picks chunks by maximal marginal relevance (relevant to the question and
+   unlike what is already picked) until the token budget is full;
+2. skips near-duplicates, typically a notes chunk and the transcript chunk
+   it was written from, which would otherwise both be sent;
+3. merges chunks that are neighbours in the same source into one passage,
+   dropping the text they overlap on.
+"""
+from dataclasses import dataclass, field
+from typing import Optional
+import numpy as np
+from app.utils.transcript import format_timestamp
+
+
+def estimate_tokens(text: str) -> int:
+    """Same ~4 characters per token estimate as the rest of the LLM accounting."""
+    return len(text) // 4
+
+
+@dataclass
+class Passage:
+    source: Optional[str]
+    text: str
+    score: float
+    positions: list[int] = field(default_factory=list)
+    start: Optional[float] = None  # Video seconds, for transcript passages
+    end: Optional[float] = None
+
+
+def _normalized(vectors) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def select_mmr(
+    query_embedding,
+    candidates: list[dict],
+    budget_tokens: int,
+    mmr_lambda: float = 0.7,
+    duplicate_similarity: float = 0.9
+) -> list[dict]:
+    """
+    Candidates (dicts with "text" and "embedding") chosen by maximal marginal relevance
+    until `budget_tokens` is used. Each gets its query similarity as "relevance". The
+    most relevant candidate is always kept, cut to the budget if it alone exceeds it.
+    """
+    if not candidates:
+        return []
+    embeddings = _normalized([candidate["embedding"] for candidate in candidates])
+    relevance = embeddings @ _normalized(query_embedding)
+    similarity = embeddings @ embeddings.T
+
+    selected: list[int] = []
+    texts = {}
+    remaining = list(range(len(candidates)))
+    used = 0
+    while remaining:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = mmr_lambda * relevance[remaining] - (1 - mmr_lambda) * redundancy
+        best = int(np.argmax(scores))
+        index = remaining.pop(best)
+        if redundancy[best] >= duplicate_similarity:
+            continue  # Says what an already picked chunk says
+        cost = estimate_tokens(candidates[index]["text"])
+        if used + cost > budget_tokens:
+            if selected:
+                continue  # A smaller chunk may still fit
+            # Never send nothing: the best match goes in, cut to the budget
+            texts[index] = candidates[index]["text"][:max(budget_tokens, 1) * 4]
+            cost = estimate_tokens(texts[index])
+        selected.append(index)
+        used += cost
+
+    return [
+        {**candidates[index], "text": texts.get(index, candidates[index]["text"]), "relevance": float(relevance[index])}
+        for index in selected
+    ]
+
+
+def overlap_length(left: str, right: str, max_overlap: int = 200, min_overlap: int = 10) -> int:
+    """
+    Length of the longest suffix of `left` that is a prefix of `right` (the splitter's
+    chunk overlap); shorter matches than `min_overlap` are treated as coincidence.
+    """
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def merge_adjacent(chunks: list[dict]) -> list[Passage]:
+    """Join chunks that follow each other in the same source; best passages first."""
+    ordered = sorted(
+        chunks,
+        key=lambda chunk: (
+            str(chunk.get("note_id")), str(chunk.get("source")),
+            chunk.get("position") is None, chunk.get("position") or 0
+        )
+    )
+    passages: list[Passage] = []
+    previous = None
+    for chunk in ordered:
+        position = chunk.get("position")
+        score = chunk.get("relevance", chunk.get("score", 0.0))
+        follows = (
+            previous is not None and position is not None and previous.get("position") is not None
+            and position == previous["position"] + 1
+            and chunk.get("note_id") == previous.get("note_id") and chunk.get("source") == previous.get("source")
+        )
+        if follows:
+            passage = passages[-1]
+            overlap = overlap_length(passage.text, chunk["text"])
+            passage.text += chunk["text"][overlap:] if overlap else "\n" + chunk["text"]
+            passage.score = max(passage.score, score)
+            passage.positions.append(position)
+            if chunk.get("end") is not None:
+                passage.end = chunk["end"]
+        else:
+            passages.append(Passage(
+                source=chunk.get("source"),
+                text=chunk["text"],
+                score=score,
+                positions=[position] if position is not None else [],
+                start=chunk.get("start"),
+                end=chunk.get("end")
+            ))
+        previous = chunk
+    return sorted(passages, key=lambda passage: passage.score, reverse=True)
+
+
+def build_context(
+    query_embedding,
+    candidates: list[dict],
+    budget_tokens: int,
+    mmr_lambda: float = 0.7,
+    duplicate_similarity: float = 0.9
+) -> list[Passage]:
+    """Pack retrieved candidates into at most `budget_tokens` of distinct passages."""
+    return merge_adjacent(select_mmr(query_embedding, candidates, budget_tokens, mmr_lambda, duplicate_similarity))
+
+
+def format_context(passages: list[Passage]) -> str:
+    sections = []
+    for i, passage in enumerate(passages):
+        if passage.source == "transcript":
+            origin = "from the transcript"
+            if passage.start is not None:
+                origin += f", {format_timestamp(passage.start)}-{format_timestamp(passage.end or passage.start)}"
+        else:
+            origin = "from the notes"
+        sections.append(f"Relevant excerpt {i + 1} ({origin}):\n{passage.text}")
+    return "\n\n".join(sections)
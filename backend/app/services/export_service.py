@@ -0,0 +1,364 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import AsyncIterator, Callable, Optional
+from fastapi.concurrency import run_in_threadpool
+from app.core.config import settings
+from app.core.metrics import acquire, CACHE_HITS, CACHE_MISSES, EXPORT_RENDER_SECONDS
+from app.core.tracing import span, set_attributes
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# format -> (media type, file extension)
+EXPORT_FORMATS = {
+    "pdf": ("application/pdf", "pdf"),
+    "html": ("text/html; charset=utf-8", "html"),
+    "md": ("text/markdown; charset=utf-8", "md"),
+    "docx": ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", "docx"),
+}
+
+NOTES_HTML_TEMPLATE = """
+<html>
+<head>
+    <style>
+        body {{
+            font-family: Helvetica, sans-serif;
+            font-size: 12pt;
+            line-height: 1.5;
+            color: #333;
+        }}
+        h1 {{ color: #2563eb; font-size: 24pt; margin-bottom: 20px; border-bottom: 2px solid #2563eb; padding-bottom: 10px; }}
+        h2 {{ color: #1e40af; font-size: 18pt; margin-top: 20px; margin-bottom: 10px; }}
+        h3 {{ color: #1e3a8a; font-size: 14pt; margin-top: 15px; margin-bottom: 8px; }}
+        p {{ margin-bottom: 10px; text-align: justify; }}
+        ul {{ margin-bottom: 10px; }}
+        li {{ margin-bottom: 5px; }}
+        code {{ background-color: #f3f4f6; padding: 2px 4px; border-radius: 4px; font-family: Courier, monospace; }}
+        pre {{ background-color: #f3f4f6; padding: 10px; border-radius: 8px; overflow-x: auto; }}
+    </style>
+</head>
+<body>
+    {html_content}
+    <div style="margin-top: 50px; text-align: center; font-size: 10pt; color: #666;">
+        Generated by NotesBuddy AI
+    </div>
+</body>
+</html>
+"""
+
+
+def render_html(notes: str) -> str:
+    """Convert markdown notes into a styled standalone HTML document."""
+    import markdown2
+
+    return NOTES_HTML_TEMPLATE.format(html_content=markdown2.markdown(notes))
+
+
+def render_pdf_bytes(notes: str) -> bytes:
+    """Render markdown notes to PDF. CPU-bound, runs inside a worker process."""
+    from io import BytesIO
+    from xhtml2pdf import pisa
+
+    pdf_buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(render_html(notes), dest=pdf_buffer)
+    if pisa_status.err:
+        raise RuntimeError("PDF generation failed")
+    return pdf_buffer.getvalue()
+
+
+def warm_worker() -> None:
+    """Import the renderers so the first real export in this worker doesn't pay for it."""
+    import markdown2  # noqa: F401
+    import docx  # noqa: F401
+    from xhtml2pdf import pisa  # noqa: F401
+
+
+def render_html_bytes(notes: str) -> bytes:
+    return render_html(notes).encode("utf-8")
+
+
+def render_docx_bytes(notes: str) -> bytes:
+    """Render markdown notes to a Word document. CPU-bound, runs inside a worker process."""
+    from io import BytesIO
+    from docx import Document
+
+    document = Document()
+    in_code_block = False
+    for line in notes.splitlines():
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_code_block = not in_code_block
+            continue
+        if in_code_block:
+            document.add_paragraph(line, style="No Spacing")
+            continue
+        if not stripped:
+            continue
+
+        heading = re.match(r"^(#{1,6})\s+(.*)$", stripped)
+        bullet = re.match(r"^[-*+]\s+(.*)$", stripped)
+        numbered = re.match(r"^\d+[.)]\s+(.*)$", stripped)
+        if heading:
+            document.add_heading(heading.group(2), level=min(len(heading.group(1)) - 1, 4))
+            continue
+        if bullet:
+            paragraph, text = document.add_paragraph(style="List Bullet"), bullet.group(1)
+        elif numbered:
+            paragraph, text = document.add_paragraph(style="List Number"), numbered.group(1)
+        else:
+            paragraph, text = document.add_paragraph(), stripped
+
+        # Keep **bold** emphasis, drop the remaining markdown markers
+        for i, part in enumerate(text.split("**")):
+            if part:
+                paragraph.add_run(part).bold = i % 2 == 1
+
+    buffer = BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+class _ZipStream:
+    """Write-only file object that hands ZIP bytes to the response as they are produced."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ExportService:
+    """Off-loop document rendering with an on-disk, content-addressed PDF cache."""
+
+    cache_dir = os.path.join(os.path.dirname(__file__), "..", "..", "pdf_cache")
+
+    _executor: Optional[ProcessPoolExecutor] = None
+    _semaphore: Optional[asyncio.Semaphore] = None
+
+    @classmethod
+    def get_executor(cls) -> ProcessPoolExecutor:
+        """Lazily start the render process pool."""
+        if cls._executor is None:
+            # "spawn" keeps workers independent of the server's threads and DB connections
+            cls._executor = ProcessPoolExecutor(
+                max_workers=settings.EXPORT_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return cls._executor
+
+    @classmethod
+    def get_semaphore(cls) -> asyncio.Semaphore:
+        if cls._semaphore is None:
+            cls._semaphore = asyncio.Semaphore(settings.EXPORT_RENDER_WORKERS)
+        return cls._semaphore
+
+    @classmethod
+    async def warmup(cls) -> None:
+        """Start the worker processes and import the renderers in them ahead of the first export."""
+        loop = asyncio.get_running_loop()
+        executor = cls.get_executor()
+        await asyncio.gather(*(
+            loop.run_in_executor(executor, warm_worker) for _ in range(settings.EXPORT_RENDER_WORKERS)
+        ))
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """Stop the render process pool (called on application shutdown)."""
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False, cancel_futures=True)
+            cls._executor = None
+
+    @staticmethod
+    def content_hash(notes: str) -> str:
+        return hashlib.sha256(notes.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _terminate(cls, executor: ProcessPoolExecutor) -> None:
+        """Kill a pool whose render overran the timeout; the next render starts a fresh one."""
+        if cls._executor is executor:
+            cls._executor = None
+        logger.warning("Export render timed out, restarting the render workers")
+        # A running future can't be cancelled, so the process itself has to go
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    async def run_in_worker(cls, export_format: str, func, *args):
+        """Run a CPU-bound render function in the process pool with a cap and a timeout."""
+        with span("export.render", {"export.format": export_format}):
+            try:
+                return await cls._render_once(export_format, func, *args)
+            except BrokenProcessPool:
+                # Another render's timeout killed the pool under this one; it wasn't at fault
+                return await cls._render_once(export_format, func, *args)
+
+    @classmethod
+    async def _render_once(cls, export_format: str, func, *args):
+        async with acquire(cls.get_semaphore(), "export"):
+            loop = asyncio.get_running_loop()
+            executor = cls.get_executor()
+            deadline = loop.time() + settings.EXPORT_RENDER_TIMEOUT
+            future = loop.run_in_executor(executor, func, *args)
+            try:
+                with EXPORT_RENDER_SECONDS.labels(export_format).time():
+                    return await asyncio.wait_for(asyncio.shield(future), timeout=settings.EXPORT_RENDER_TIMEOUT)
+            finally:
+                if not future.done():
+                    # Timed out, or the caller went away: the worker is still busy, so keep its
+                    # slot until it is free, and kill it once it overruns the timeout
+                    await asyncio.wait([future], timeout=max(0.0, deadline - loop.time()))
+                    if not future.done():
+                        cls._terminate(executor)
+                        await asyncio.wait([future])
+                    if not future.cancelled():
+                        future.exception()  # Retrieved, so a killed render isn't logged as unhandled
+
+    @classmethod
+    async def render_pdf(cls, notes: str) -> bytes:
+        """Render notes to PDF, serving repeat exports of identical content from the cache."""
+        key = cls.content_hash(notes)
+        cached = await run_in_threadpool(cls._read_cache, key)
+        if cached is not None:
+            CACHE_HITS.labels("pdf").inc()
+            set_attributes({"export.pdf_cache": "hit"})
+            return cached
+        CACHE_MISSES.labels("pdf").inc()
+        set_attributes({"export.pdf_cache": "miss"})
+
+        pdf_bytes = await cls.run_in_worker("pdf", render_pdf_bytes, notes)
+
+        try:
+            await run_in_threadpool(cls._write_cache, key, pdf_bytes)
+        except OSError as e:
+            logger.warning("Error caching rendered PDF: %s", e)
+        return pdf_bytes
+
+    @classmethod
+    async def render(cls, notes: str, export_format: str) -> bytes:
+        """Render notes in one of EXPORT_FORMATS."""
+        if export_format == "pdf":
+            return await cls.render_pdf(notes)
+        if export_format == "html":
+            return await cls.run_in_worker("html", render_html_bytes, notes)
+        if export_format == "docx":
+            return await cls.run_in_worker("docx", render_docx_bytes, notes)
+        return notes.encode("utf-8")
+
+    @staticmethod
+    def export_filename(title: str, note_id: int, export_format: str) -> str:
+        """Build a filesystem/header-safe file name for an exported note."""
+        safe_title = re.sub(r"[^A-Za-z0-9 _-]+", "", title or "").strip()[:80] or "notes"
+        return f"{safe_title}_{note_id}.{EXPORT_FORMATS[export_format][1]}"
+
+    @classmethod
+    async def stream_zip(
+        cls,
+        entries: list[tuple[str, Callable[[], str]]],
+        export_format: str
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream a ZIP archive of rendered notes without buffering the whole archive.
+        `entries` are (file name, notes loader) pairs; a bounded window of entries is
+        rendered in parallel while finished entries are written out in order.
+        """
+        window = settings.EXPORT_RENDER_WORKERS * 2
+        # PDF and DOCX are already compressed containers
+        compression = zipfile.ZIP_STORED if export_format in ("pdf", "docx") else zipfile.ZIP_DEFLATED
+        remaining = iter(entries)
+        in_flight: deque = deque()
+
+        def schedule():
+            while len(in_flight) < window:
+                entry = next(remaining, None)
+                if entry is None:
+                    return
+                filename, load_notes = entry
+                in_flight.append((filename, asyncio.ensure_future(cls.render(load_notes(), export_format))))
+
+        stream = _ZipStream()
+        try:
+            schedule()
+            with zipfile.ZipFile(stream, "w", compression=compression) as archive:
+                while in_flight:
+                    filename, task = in_flight.popleft()
+                    try:
+                        content = await task
+                    except Exception as e:
+                        filename, content = f"{filename}.error.txt", f"Export failed: {e!r}".encode("utf-8")
+                    schedule()
+                    archive.writestr(filename, content)
+                    yield stream.drain()
+            # Central directory
+            yield stream.drain()
+        finally:
+            for _, task in in_flight:
+                task.cancel()
+
+    @classmethod
+    def _cache_path(cls, key: str) -> str:
+        return os.path.join(cls.cache_dir, f"{key}.pdf")
+
+    @classmethod
+    def _read_cache(cls, key: str) -> Optional[bytes]:
+        path = cls._cache_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Bump the modification time so eviction is least-recently-used
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    @classmethod
+    def _write_cache(cls, key: str, data: bytes) -> None:
+        os.makedirs(cls.cache_dir, exist_ok=True)
+        path = cls._cache_path(key)
+        # Unique per writer: threads and workers may cache the same key at once
+        with tempfile.NamedTemporaryFile(dir=cls.cache_dir, suffix=".tmp", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, path)
+        cls._evict_cache()
+
+    @classmethod
+    def _evict_cache(cls) -> None:
+        """Delete least-recently-used PDFs until the cache fits in its size budget."""
+        entries = []
+        total_size = 0
+        with os.scandir(cls.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith(".pdf"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= settings.EXPORT_PDF_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+                total_size -= size
+            except OSError:
+                pass
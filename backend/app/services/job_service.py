@@ -0,0 +1,241 @@
+"""
+Background note generation jobs.
+
+Jobs run on a bounded pool of worker tasks, independently of the request that
+submitted them, so a closed tab or a dropped connection no longer abandons a
+half-finished pipeline and the tokens already spent on it. A job publishes
+its progress and output as events on a resumable stream (see
+stream_service.py) whose id is the job id, so any number of clients can attach
+to it, replay what was generated so far and follow the live output. The
+generation_jobs row carries the status so it can be polled from any worker.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import func
+from app.core.budget import budget_scope
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.metrics import GENERATION_JOBS, GENERATION_JOB_QUEUE_SECONDS
+from app.models.generation_job_model import GenerationJob, JOB_ACTIVE_STATUSES
+from app.services.stream_service import StreamRegistry
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class JobQueueFull(Exception):
+    """Raised when no more jobs can be queued."""
+
+
+class Job:
+    """
+    In-memory state of a job running in this worker. Its stream carries
+    "status", "progress" and "delta" (output text) events, then "note" or
+    "error", then "done".
+    """
+
+    def __init__(self, job_id: str, user_id: int, run: Callable[["Job"], Awaitable[int]]):
+        self.id = job_id
+        self.user_id = user_id
+        self.run = run
+        self.status = "queued"
+        self.stream = StreamRegistry.create(user_id, stream_id=job_id)
+        self.output_chars = 0
+        self.note_id: Optional[int] = None
+        self.error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+        self.queued_at = time.perf_counter()
+        self._finished = asyncio.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status not in JOB_ACTIVE_STATUSES
+
+    def append(self, chunk: str) -> None:
+        self.output_chars += len(chunk)
+        self.stream.publish("delta", chunk)
+
+    def progress(self, info: dict) -> None:
+        self.stream.publish("progress", info)
+
+    def set_status(self, status: str) -> None:
+        self.status = status
+        self.stream.publish("status", {"status": status})
+
+    async def wait(self) -> None:
+        await self._finished.wait()
+
+
+class GenerationJobService:
+    """Job queue and worker pool. State is per process, like the export worker pool."""
+
+    _jobs: dict[str, Job] = {}
+    _queue: Optional[asyncio.Queue] = None
+    _workers: list[asyncio.Task] = []
+
+    @classmethod
+    def start(cls) -> None:
+        """Start the worker tasks (on application startup, or on the first submit)."""
+        if cls._workers:
+            return
+        cls._queue = asyncio.Queue(maxsize=settings.GENERATION_JOB_QUEUE_SIZE)
+        cls._workers = [asyncio.create_task(cls._worker()) for _ in range(settings.GENERATION_JOB_WORKERS)]
+
+    @classmethod
+    async def shutdown(cls) -> None:
+        """Stop the workers; jobs still queued or running are marked as interrupted."""
+        for worker in cls._workers:
+            worker.cancel()
+        await asyncio.gather(*cls._workers, return_exceptions=True)
+        cls._workers = []
+        for job in list(cls._jobs.values()):
+            if not job.finished:
+                cls._finish(job, "failed", error="Interrupted by server shutdown")
+
+    @classmethod
+    def expire_stale(cls, db, user_id: Optional[int] = None) -> int:
+        """
+        Fail queued/running rows older than GENERATION_JOB_TIMEOUT that no live job of this
+        process owns: their worker died (OOM, SIGKILL, crash) and will never finish them,
+        and left alone they would block resubmitting that video variant forever.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.GENERATION_JOB_TIMEOUT)
+        query = db.query(GenerationJob).filter(
+            GenerationJob.status.in_(JOB_ACTIVE_STATUSES),
+            func.coalesce(GenerationJob.started_at, GenerationJob.created_at) < cutoff
+        )
+        if user_id is not None:
+            query = query.filter(GenerationJob.user_id == user_id)
+        live = [job_id for job_id, job in cls._jobs.items() if not job.finished]
+        if live:
+            query = query.filter(GenerationJob.id.notin_(live))
+        expired = query.update(
+            {"status": "failed", "error": "Abandoned: the worker running it stopped", "finished_at": datetime.utcnow()},
+            synchronize_session=False
+        )
+        db.commit()
+        if expired:
+            GENERATION_JOBS.labels("failed").inc(expired)
+            logger.warning("Expired abandoned generation jobs", extra={"jobs": expired})
+        return expired
+
+    @classmethod
+    def get(cls, job_id: str) -> Optional[Job]:
+        return cls._jobs.get(job_id)
+
+    @classmethod
+    def active_count(cls, user_id: int) -> int:
+        return sum(1 for job in cls._jobs.values() if job.user_id == user_id and not job.finished)
+
+    @classmethod
+    def submit(cls, db, user_id: int, video_id: str, language: str, style: str,
+               run: Callable[[Job], Awaitable[int]]) -> GenerationJob:
+        """
+        Record and queue a job. `run(job)` performs the generation, appending
+        output to the job as it goes, and returns the saved note's id.
+        """
+        cls.start()
+        if cls._queue.full():
+            raise JobQueueFull("Too many generation jobs are queued, try again shortly")
+
+        row = GenerationJob(
+            id=uuid.uuid4().hex, user_id=user_id, video_id=video_id, language=language, style=style, status="queued"
+        )
+        db.add(row)
+        db.commit()
+        db.refresh(row)
+
+        job = Job(row.id, user_id, run)
+        job.set_status("queued")
+        cls._jobs[job.id] = job
+        cls._queue.put_nowait(job)
+        GENERATION_JOBS.labels("queued").inc()
+        return row
+
+    @classmethod
+    async def cancel(cls, job_id: str) -> bool:
+        """Cancel a job of this process and wait until it has stopped."""
+        job = cls._jobs.get(job_id)
+        if job is None:
+            return False
+        if not job.finished:
+            job.cancel_requested = True
+            if job.task is not None:
+                job.task.cancel()
+                await job.wait()
+            else:
+                # Still queued: the worker skips it
+                cls._finish(job, "cancelled")
+        return True
+
+    @classmethod
+    async def _worker(cls) -> None:
+        while True:
+            job = await cls._queue.get()
+            try:
+                if not job.finished:
+                    await cls._run(job)
+            except Exception:
+                logger.exception("Generation job worker error", extra={"job_id": job.id})
+            finally:
+                cls._queue.task_done()
+
+    @classmethod
+    async def _run(cls, job: Job) -> None:
+        GENERATION_JOB_QUEUE_SECONDS.observe(time.perf_counter() - job.queued_at)
+        job.set_status("running")
+        cls._update_row(job.id, status="running", started_at=datetime.utcnow())
+
+        job.task = asyncio.create_task(cls._execute(job))
+        try:
+            note_id = await asyncio.wait_for(job.task, timeout=settings.GENERATION_JOB_TIMEOUT)
+        except asyncio.CancelledError:
+            if not job.cancel_requested:
+                raise  # the worker itself is being cancelled (shutdown)
+            cls._finish(job, "cancelled")
+        except asyncio.TimeoutError:
+            cls._finish(job, "failed", error=f"Timed out after {settings.GENERATION_JOB_TIMEOUT:.0f}s")
+        except Exception as e:
+            cls._finish(job, "failed", error=getattr(e, "detail", None) or str(e))
+        else:
+            cls._finish(job, "completed", note_id=note_id)
+
+    @staticmethod
+    async def _execute(job: Job) -> int:
+        # The deadline propagates into the LLM calls, so they stop instead of outliving the job
+        with budget_scope(settings.GENERATION_JOB_TIMEOUT):
+            return await job.run(job)
+
+    @classmethod
+    def _finish(cls, job: Job, status: str, note_id: Optional[int] = None, error: Optional[str] = None) -> None:
+        job.status, job.note_id, job.error = status, note_id, error
+        cls._update_row(job.id, status=status, note_id=note_id, error=error, finished_at=datetime.utcnow())
+        GENERATION_JOBS.labels(status).inc()
+        if note_id is not None:
+            job.stream.publish("note", {"note_id": note_id})
+        if error is not None:
+            job.stream.publish("error", {"detail": error})
+        job.stream.publish("done", {"status": status})
+        StreamRegistry.finish(job.stream)
+        job._finished.set()
+        # Keep the job around briefly for late attaches; after that they are served from the note
+        asyncio.get_running_loop().call_later(
+            settings.GENERATION_JOB_RETENTION_SECONDS, cls._jobs.pop, job.id, None
+        )
+
+    @staticmethod
+    def _update_row(job_id: str, **fields) -> None:
+        db = SessionLocal()
+        try:
+            db.query(GenerationJob).filter(GenerationJob.id == job_id).update(fields)
+            db.commit()
+        except Exception:
+            logger.exception("Error updating generation job", extra={"job_id": job_id})
+            db.rollback()
+        finally:
+            db.close()
@@ -1,31 +1,54 @@
 import os
-from langchain_openai import ChatOpenAI
-from langchain_core.runnables import RunnableBranch, RunnablePassthrough, RunnableLambda
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import threading
+from typing import Optional
 from app.core.config import settings
+from app.core.limits import get_limiter
+from app.core.budget import charge, gather_or_cancel, iterate_within, within
+from app.core.metrics import (
+    acquire,
+    record_llm_error,
+    CHAT_CONTEXT,
+    CHAT_CONTEXT_TOKENS,
+    CLASSIFICATION_SECONDS,
+    MAP_CHUNK_SECONDS,
+    COMBINE_SECONDS,
+)
+from app.core.tracing import span
+from app.utils.transcript import Transcript, format_timestamp
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
 from app.prompts.llm_prompts import (
     CLASSIFICATION_PROMPT,
     NOTE_GENERATION_PROMPT,
     CHUNK_GENERATION_PROMPT,
     COMBINE_PROMPT,
-    CHAT_WITH_NOTES_PROMPT
+    CHAT_WITH_NOTES_PROMPT,
+    CHAT_WITH_LIBRARY_PROMPT,
+    VARIANT_DERIVATION_PROMPT
 )
 
 import asyncio
 
 class LLMService:
     def __init__(self):
+        # LangChain/OpenAI take about a second to import, so they load with the service, not the app
+        from langchain_openai import ChatOpenAI
+        from langchain_core.prompts import ChatPromptTemplate
+        from langchain_core.output_parsers import StrOutputParser
+
         # OpenRouter Configuration
         self.api_key = settings.OPENROUTER_API_KEY
         self.model = settings.OPENROUTER_MODEL
-        self.base_url = "https://openrouter.ai/api/v1"
+        self.base_url = settings.OPENROUTER_BASE_URL
         
         # Concurrency Control
-        self.semaphore = asyncio.Semaphore(settings.MAX_CONCURRENT_REQUESTS)
+        # Shared by all workers unless LIMITER_BACKEND is "local"
+        self.semaphore = get_limiter().semaphore("llm", settings.MAX_CONCURRENT_REQUESTS)
 
         if not self.api_key:
-            print("WARNING: OPENROUTER_API_KEY is missing. LLM service might fail.")
+            logger.warning("OPENROUTER_API_KEY is missing. LLM service might fail.")
         
         self.llm = ChatOpenAI(
             model=self.model,
@@ -52,138 +75,465 @@ class LLMService:
         combine_prompt = ChatPromptTemplate.from_template(COMBINE_PROMPT)
         self.combine_chain = combine_prompt | self.llm | StrOutputParser()
 
+        # 5. Variant Derivation Chain (restyle/translate existing notes)
+        variant_prompt = ChatPromptTemplate.from_template(VARIANT_DERIVATION_PROMPT)
+        self.variant_chain = variant_prompt | self.llm | StrOutputParser()
+
+        # 6. Chat Chains (single note / whole library)
+        chat_prompt = ChatPromptTemplate.from_template(CHAT_WITH_NOTES_PROMPT)
+        self.chat_chain = chat_prompt | self.llm | StrOutputParser()
+        library_chat_prompt = ChatPromptTemplate.from_template(CHAT_WITH_LIBRARY_PROMPT)
+        self.library_chat_chain = library_chat_prompt | self.llm | StrOutputParser()
+
     async def classify_content(self, transcript: str) -> bool:
         """
         Classify if the content is academic/educational.
         Returns True if academic, False otherwise.
         """
-        async with self.semaphore:
-            result = await self.classifier_chain.ainvoke({"transcript": transcript})
-            return "YES" in result.upper()
+        with span("llm.classify", {"llm.input_tokens": len(transcript) // 4}) as current:
+            async with acquire(self.semaphore, "llm"):
+                try:
+                    with CLASSIFICATION_SECONDS.time():
+                        result = await within(self.classifier_chain.ainvoke({"transcript": transcript}), "classify")
+                except Exception as e:
+                    record_llm_error("classify", e)
+                    raise
+            charge("classify", len(transcript) // 4 + len(result) // 4)
+            is_academic = "YES" in result.upper()
+            current.set_attribute("classify.academic", is_academic)
+            return is_academic
 
     def check_transcript_length(self, transcript: str) -> None:
         # Approx 4 chars per token. Limit to ~30k tokens for safety
         if len(transcript) > 120000:
             raise ValueError("Transcript is too long (approx > 30k tokens). Please use a shorter video.")
 
-    def chunk_transcript(self, transcript: str, chunk_size: int = 15000, overlap: int = 1000) -> list[str]:
-        """Split transcript into overlapping chunks."""
-        chunks = []
+    def chunk_spans(self, transcript: str, chunk_size: int = 15000, overlap: int = 1000) -> list[tuple[int, int]]:
+        """(start, end) character spans of overlapping transcript chunks."""
+        spans = []
         start = 0
         while start < len(transcript):
             end = start + chunk_size
-            chunks.append(transcript[start:end])
+            spans.append((start, min(end, len(transcript))))
             start = end - overlap
-        return chunks
+        return spans
 
-    async def process_chunk(self, chunk: str, index: int, total: int, language: str) -> str:
+    def chunk_transcript(self, transcript: str, chunk_size: int = 15000, overlap: int = 1000) -> list[str]:
+        """Split transcript into overlapping chunks."""
+        return [transcript[start:end] for start, end in self.chunk_spans(transcript, chunk_size, overlap)]
+
+    async def process_chunk(self, chunk: str, index: int, total: int, language: str,
+                            time_range: Optional[tuple[float, float]] = None) -> str:
         """Process a single chunk asynchronously."""
-        async with self.semaphore:
-            return await self.chunk_chain.ainvoke({
-                "transcript": chunk,
-                "chunk_index": index + 1,
-                "total_chunks": total,
-                "language": language
-            })
-
-    async def chat_with_note(self, note_id: int, note_content: str, user_message: str, chat_history: list = []):
+        with span("llm.map_chunk", {
+            "chunk.index": index,
+            "chunk.total": total,
+            "llm.input_tokens": len(chunk) // 4
+        }) as current:
+            async with acquire(self.semaphore, "llm"):
+                try:
+                    with MAP_CHUNK_SECONDS.time():
+                        result = await within(self.chunk_chain.ainvoke({
+                            "transcript": chunk,
+                            "chunk_index": index + 1,
+                            "total_chunks": total,
+                            "time_range": (
+                                f", covering {format_timestamp(time_range[0])}-{format_timestamp(time_range[1])} of the video"
+                                if time_range else ""
+                            ),
+                            "language": language
+                        }), "map_chunk")
+                except Exception as e:
+                    record_llm_error("map_chunk", e)
+                    raise
+            current.set_attribute("llm.output_tokens", len(result) // 4)
+            # Delivered only if the request that needed it completes
+            charge("map_chunk", len(chunk) // 4 + len(result) // 4)
+            return result
+
+    async def chat_with_note(
+        self,
+        note_id: int,
+        note_content: str,
+        user_message: str,
+        chat_history: list = [],
+        user_id: int = None
+    ):
         """Chat with a note using RAG to retrieve relevant context."""
-        async with self.semaphore:
+        with span("llm.chat_with_note", {"note.id": note_id, "chat.history_messages": len(chat_history)}) as current:
+            async with acquire(self.semaphore, "llm"):
+                from app.services.context_service import build_context, format_context
+                from app.services.vector_service import VectorService, schedule_index_rebuild
+                
+                vector_service = VectorService()
+                
+                # Over-fetch, then pack distinct excerpts into the context budget
+                query_embedding, candidates = vector_service.retrieve_candidates(
+                    note_id, user_message, n_results=settings.RAG_CANDIDATES, user_id=user_id
+                )
+                relevant_chunks = build_context(
+                    query_embedding, candidates, settings.RAG_CONTEXT_TOKENS,
+                    settings.RAG_MMR_LAMBDA, settings.RAG_DUPLICATE_SIMILARITY
+                )
+                
+                # Build context from relevant chunks; fall back only when retrieval found nothing
+                if candidates:
+                    context = format_context(relevant_chunks)
+                else:
+                    # Fallback to full note while the index is missing (not embedded yet, or lost);
+                    # it is rebuilt in the background so later turns use retrieval again
+                    context = note_content
+                    if vector_service.embedding_model is not None and user_id is not None:
+                        schedule_index_rebuild(note_id, user_id)
+                context_source = "rag" if candidates else "full_note"
+                CHAT_CONTEXT.labels(context_source).inc()
+                CHAT_CONTEXT_TOKENS.labels(context_source).observe(len(context) // 4)
+                current.set_attributes({
+                    "chat.context_source": context_source,
+                    "chat.retrieved_chunks": len(candidates),
+                    "chat.context_passages": len(relevant_chunks),
+                    "chat.context_tokens": len(context) // 4
+                })
+                
+                # Format chat history
+                formatted_history = ""
+                for msg in chat_history:
+                    role = "Student" if msg["role"] == "user" else "Assistant"
+                    formatted_history += f"{role}: {msg['content']}\n"
+                
+                if not formatted_history:
+                    formatted_history = "No previous history."
+
+                chain = self.chat_chain
+                
+                input_tokens = (len(context) + len(formatted_history) + len(user_message)) // 4
+                with span("llm.chat_stream", {"llm.input_tokens": input_tokens}) as stream_span:
+                    output_chars = 0
+                    completed = False
+                    try:
+                        async for chunk in iterate_within(chain.astream({
+                            "context": context, 
+                            "user_message": user_message,
+                            "chat_history": formatted_history
+                        }), "chat"):
+                            if not output_chars:
+                                stream_span.add_event("first_token")
+                            output_chars += len(chunk)
+                            yield chunk
+                        completed = True
+                    except Exception as e:
+                        record_llm_error("chat", e)
+                        raise
+                    finally:
+                        stream_span.set_attribute("llm.output_tokens", output_chars // 4)
+                        charge("chat", input_tokens + output_chars // 4, completed)
+
+    async def map_transcript(self, transcript: str, language: str, on_progress=None) -> str:
+        """
+        Run the map stage: generate notes for every chunk in parallel and join them.
+        Chunk notes only depend on the language, so the result can be shared by styles.
+        `on_progress`, if given, is called with {"stage": "map", "done", "total"}.
+        """
+        spans = self.chunk_spans(transcript)
+        total_chunks = len(spans)
+        logger.debug("Splitting transcript", extra={"transcript_chars": len(transcript), "chunks": total_chunks})
+        # Transcripts fetched with their timings tell each chunk which part of the video it covers
+        timed = isinstance(transcript, Transcript) and transcript.has_segments
+        
+        with span("llm.map", {"chunk.total": total_chunks, "notes.language": language, "transcript.timed": timed}):
+            # Process chunks in parallel
+            tasks = [
+                self.process_chunk(
+                    transcript[start:end], i, total_chunks, language,
+                    transcript.time_range(start, end) if timed else None
+                )
+                for i, (start, end) in enumerate(spans)
+            ]
+            if on_progress:
+                done = 0
+
+                async def tracked(task):
+                    nonlocal done
+                    result = await task
+                    done += 1
+                    on_progress({"stage": "map", "done": done, "total": total_chunks})
+                    return result
+
+                on_progress({"stage": "map", "done": 0, "total": total_chunks})
+                tasks = [tracked(task) for task in tasks]
+            # One failed chunk fails the request, so don't let its siblings run on
+            chunk_results = await gather_or_cancel(*tasks)
+        
+        # Combine results
+        return "\n\n".join(chunk_results)
+
+    async def chat_with_library(
+        self,
+        user_id: int,
+        note_titles: dict,
+        user_message: str,
+        chat_history: list = [],
+        n_notes: int = 4
+    ):
+        """Answer a question using context retrieved from several of the user's notes."""
+        async with acquire(self.semaphore, "llm"):
             from app.services.vector_service import VectorService
-            
+
             vector_service = VectorService()
-            
-            # Retrieve relevant chunks from the note
-            relevant_chunks = vector_service.retrieve_relevant_chunks(note_id, user_message, n_results=3)
-            
-            # Build context from relevant chunks
-            if relevant_chunks:
-                context = "\n\n".join([f"Relevant excerpt {i+1}:\n{chunk}" for i, (chunk, score) in enumerate(relevant_chunks)])
-            else:
-                # Fallback to full note if no chunks found (first time)
-                context = note_content
-            
-            # Format chat history
+
+            # One ANN query over the user's whole library, grouped per note
+            groups = [
+                group for group in vector_service.search_user_chunks(user_id, user_message, n_results=n_notes, per_note=2)
+                if group["note_id"] in note_titles
+            ]
+            if not groups:
+                yield "I couldn't find anything related to that question in your notes yet."
+                return
+
+            context = "\n\n".join(
+                f"From notes \"{note_titles[group['note_id']]}\":\n" + "\n...\n".join(
+                    # Transcript excerpts say where in the video they come from
+                    f"[{format_timestamp(chunk['start'])}] {chunk['text']}" if chunk.get("start") is not None else chunk["text"]
+                    for chunk in group["chunks"]
+                )
+                for group in groups
+            )
+
             formatted_history = ""
             for msg in chat_history:
                 role = "Student" if msg["role"] == "user" else "Assistant"
                 formatted_history += f"{role}: {msg['content']}\n"
-            
+
             if not formatted_history:
                 formatted_history = "No previous history."
 
-            prompt = ChatPromptTemplate.from_template(CHAT_WITH_NOTES_PROMPT)
-            
-            chain = prompt | self.llm | StrOutputParser()
-            
-            async for chunk in chain.astream({
-                "context": context, 
-                "user_message": user_message,
-                "chat_history": formatted_history
-            }):
-                yield chunk
-
-    async def generate_notes_stream(self, transcript: str, language: str = "en", style: str = "detailed"):
+            chain = self.library_chat_chain
+
+            input_tokens = (len(context) + len(formatted_history) + len(user_message)) // 4
+            output_chars = 0
+            completed = False
+            try:
+                async for chunk in iterate_within(chain.astream({
+                    "context": context,
+                    "user_message": user_message,
+                    "chat_history": formatted_history
+                }), "library_chat"):
+                    output_chars += len(chunk)
+                    yield chunk
+                completed = True
+            except Exception as e:
+                record_llm_error("library_chat", e)
+                raise
+            finally:
+                charge("library_chat", input_tokens + output_chars // 4, completed)
+
+    async def generate_notes_stream(self, transcript: str, language: str = "en", style: str = "detailed",
+                                    on_progress=None):
+        """Stream notes for a transcript; `on_progress` is told about each stage as it starts."""
         self.check_transcript_length(transcript)
         
-        # Determine if chunking is needed (e.g., > 15k chars)
-        if len(transcript) > 15000:
-            chunks = self.chunk_transcript(transcript)
-            total_chunks = len(chunks)
-            print(f"Transcript length: {len(transcript)}. Splitting into {total_chunks} chunks.")
-            
-            # Process chunks in parallel
-            tasks = [self.process_chunk(chunk, i, total_chunks, language) for i, chunk in enumerate(chunks)]
-            chunk_results = await asyncio.gather(*tasks)
-            
-            # Combine results
-            combined_text = "\n\n".join(chunk_results)
-            
-            async with self.semaphore:
-                async for chunk in self.combine_chain.astream({
-                    "combined_text": combined_text,
-                    "language": language,
-                    "style": style
-                }):
-                    yield chunk
-        else:
-            # 2. Generate Notes (Directly)
-            async with self.semaphore:
-                async for chunk in self.generator_chain.astream({
-                    "transcript": transcript,
+        with span("llm.generate_notes_stream", {
+            "notes.language": language,
+            "notes.style": style,
+            "notes.chunked": len(transcript) > 15000,
+            "llm.input_tokens": len(transcript) // 4
+        }):
+            # Determine if chunking is needed (e.g., > 15k chars)
+            if len(transcript) > 15000:
+                combined_text = await self.map_transcript(transcript, language, on_progress)
+                
+                with span("llm.combine", {"llm.input_tokens": len(combined_text) // 4}) as stream_span:
+                    output_chars = 0
+                    completed = False
+                    async with acquire(self.semaphore, "llm"):
+                        if on_progress:
+                            on_progress({"stage": "combine"})
+                        try:
+                            with COMBINE_SECONDS.time():
+                                async for chunk in iterate_within(self.combine_chain.astream({
+                                    "combined_text": combined_text,
+                                    "language": language,
+                                    "style": style
+                                }), "combine"):
+                                    if not output_chars:
+                                        stream_span.add_event("first_token")
+                                    output_chars += len(chunk)
+                                    yield chunk
+                            completed = True
+                        except Exception as e:
+                            record_llm_error("combine", e)
+                            raise
+                        finally:
+                            stream_span.set_attribute("llm.output_tokens", output_chars // 4)
+                            charge("combine", len(combined_text) // 4 + output_chars // 4, completed)
+            else:
+                # 2. Generate Notes (Directly)
+                with span("llm.generate", {"llm.input_tokens": len(transcript) // 4}) as stream_span:
+                    output_chars = 0
+                    completed = False
+                    async with acquire(self.semaphore, "llm"):
+                        if on_progress:
+                            on_progress({"stage": "generate"})
+                        try:
+                            async for chunk in iterate_within(self.generator_chain.astream({
+                                "transcript": transcript,
+                                "language": language,
+                                "style": style
+                            }), "generate"):
+                                if not output_chars:
+                                    stream_span.add_event("first_token")
+                                output_chars += len(chunk)
+                                yield chunk
+                            completed = True
+                        except Exception as e:
+                            record_llm_error("generate", e)
+                            raise
+                        finally:
+                            stream_span.set_attribute("llm.output_tokens", output_chars // 4)
+                            charge("generate", len(transcript) // 4 + output_chars // 4, completed)
+
+    async def generate_variants_stream(self, transcript: str, targets: list[tuple[str, str]]):
+        """
+        Generate several (language, style) variants of the same transcript concurrently.
+        The map stage runs once per distinct language and is shared by every style.
+        Yields (target_index, event, payload) tuples where event is "delta", "error" or "done".
+        """
+        self.check_transcript_length(transcript)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        map_tasks: dict[str, asyncio.Task] = {}
+
+        async def run_target(index: int, language: str, style: str):
+            try:
+                if len(transcript) > 15000:
+                    if language not in map_tasks:
+                        map_tasks[language] = asyncio.ensure_future(self.map_transcript(transcript, language))
+                    combined_text = await asyncio.shield(map_tasks[language])
+                    chain, inputs = self.combine_chain, {"combined_text": combined_text}
+                else:
+                    chain, inputs = self.generator_chain, {"transcript": transcript}
+
+                input_tokens = len(next(iter(inputs.values()))) // 4
+                output_chars = 0
+                completed = False
+                try:
+                    async with acquire(self.semaphore, "llm"):
+                        async for chunk in iterate_within(
+                            chain.astream({**inputs, "language": language, "style": style}), "batch_variant"
+                        ):
+                            output_chars += len(chunk)
+                            await queue.put((index, "delta", chunk))
+                    completed = True
+                finally:
+                    charge("batch_variant", input_tokens + output_chars // 4, completed)
+            except Exception as e:
+                record_llm_error("batch_variant", e)
+                await queue.put((index, "error", str(e)))
+            finally:
+                await queue.put((index, "done", None))
+
+        tasks = [asyncio.create_task(run_target(i, language, style)) for i, (language, style) in enumerate(targets)]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                item = await queue.get()
+                if item[1] == "done":
+                    remaining -= 1
+                yield item
+        finally:
+            pending = [*tasks, *map_tasks.values()]
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    def select_variant_source(self, candidates: list, language: str, style: str):
+        """
+        Pick the best existing note to derive a (language, style) variant from.
+        Returns None when no candidate is suitable and the full pipeline must run.
+        """
+        best = None
+        best_rank = None
+        for candidate in candidates:
+            if candidate.language == language and candidate.style == style:
+                continue
+            # Condensed notes cannot be expanded back without the transcript,
+            # so only "detailed" notes may be restyled. Same-style notes can
+            # always be translated.
+            if candidate.style != style and candidate.style != "detailed":
+                continue
+            # Prefer a pure translation, then a pure restyle, then both.
+            rank = (candidate.style != style, candidate.language != language)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+    async def derive_variant_stream(
+        self,
+        source_notes: str,
+        source_language: str,
+        source_style: str,
+        language: str = "en",
+        style: str = "detailed",
+        on_progress=None
+    ):
+        """Restyle and/or translate existing notes instead of re-reading the transcript."""
+        async with acquire(self.semaphore, "llm"):
+            if on_progress:
+                on_progress({"stage": "variant"})
+            output_chars = 0
+            completed = False
+            try:
+                async for chunk in iterate_within(self.variant_chain.astream({
+                    "source_notes": source_notes,
+                    "source_language": source_language,
+                    "source_style": source_style,
                     "language": language,
                     "style": style
-                }):
+                }), "variant"):
+                    output_chars += len(chunk)
                     yield chunk
+                completed = True
+            except Exception as e:
+                record_llm_error("variant", e)
+                raise
+            finally:
+                charge("variant", len(source_notes) // 4 + output_chars // 4, completed)
 
     async def generate_notes(self, transcript: str, language: str = "en", style: str = "detailed") -> str:
         self.check_transcript_length(transcript)
-        self.check_transcript_length(transcript)
         
         # Determine if chunking is needed (e.g., > 15k chars)
         if len(transcript) > 15000:
-            chunks = self.chunk_transcript(transcript)
-            total_chunks = len(chunks)
-            print(f"Transcript length: {len(transcript)}. Splitting into {total_chunks} chunks.")
+            combined_text = await self.map_transcript(transcript, language)
             
-            # Process chunks in parallel
-            tasks = [self.process_chunk(chunk, i, total_chunks, language) for i, chunk in enumerate(chunks)]
-            chunk_results = await asyncio.gather(*tasks)
-            
-            # Combine results
-            combined_text = "\n\n".join(chunk_results)
-            
-            async with self.semaphore:
-                return await self.combine_chain.ainvoke({
+            async with acquire(self.semaphore, "llm"):
+                result = await within(self.combine_chain.ainvoke({
                     "combined_text": combined_text,
                     "language": language,
                     "style": style
-                })
+                }), "combine")
+            charge("combine", len(combined_text) // 4 + len(result) // 4)
         else:
             # Process as a single unit
-            async with self.semaphore:
-                return await self.generator_chain.ainvoke({
+            async with acquire(self.semaphore, "llm"):
+                result = await within(self.generator_chain.ainvoke({
                     "transcript": transcript,
                     "language": language,
                     "style": style
-                })
+                }), "generate")
+            charge("generate", len(transcript) // 4 + len(result) // 4)
+        return result
+
+
+_llm_service = None
+_llm_service_lock = threading.Lock()
+
+
+def get_llm_service() -> LLMService:
+    """Process-wide LLMService, created on first use (or by the startup warmup)."""
+    global _llm_service
+    if _llm_service is None:
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = LLMService()
+    return _llm_service
@@ -0,0 +1,104 @@
+import re
+from typing import List
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+# Postgres: a generated tsvector column keeps the index in step with every insert/update.
+# 'simple' config because notes are generated in many languages.
+POSTGRES_SEARCH_DDL = [
+    """
+    ALTER TABLE notes ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(notes, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_notes_search_vector ON notes USING GIN (search_vector)",
+]
+
+# SQLite fallback: external-content FTS5 table maintained by triggers.
+SQLITE_SEARCH_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        title, notes, content='notes', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_ad AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, notes) VALUES ('delete', old.id, old.title, old.notes);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS notes_fts_au AFTER UPDATE OF title, notes ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, title, notes) VALUES ('delete', old.id, old.title, old.notes);
+        INSERT INTO notes_fts(rowid, title, notes) VALUES (new.id, new.title, new.notes);
+    END
+    """,
+    "INSERT INTO notes_fts(notes_fts) VALUES ('rebuild')",
+]
+
+POSTGRES_SEARCH_QUERY = text("""
+    SELECT ranked.id, ranked.title, ranked.video_id, ranked.created_at, ranked.language, ranked.style, ranked.rank,
+           ts_headline('simple', notes.notes, ranked.query,
+                       'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=30, MinWords=10') AS snippet
+    FROM (
+        SELECT n.id, n.title, n.video_id, n.created_at, n.language, n.style, q.query,
+               ts_rank_cd(n.search_vector, q.query) AS rank
+        FROM notes n, websearch_to_tsquery('simple', :query) AS q(query)
+        WHERE n.user_id = :user_id AND n.search_vector @@ q.query
+        ORDER BY rank DESC
+        LIMIT :limit
+    ) AS ranked
+    JOIN notes ON notes.id = ranked.id
+    ORDER BY ranked.rank DESC
+""")
+
+SQLITE_SEARCH_QUERY = text("""
+    SELECT n.id, n.title, n.video_id, n.created_at, n.language, n.style,
+           -bm25(notes_fts, 5.0, 1.0) AS rank,
+           snippet(notes_fts, 1, '<mark>', '</mark>', '...', 24) AS snippet
+    FROM notes_fts
+    JOIN notes n ON n.id = notes_fts.rowid
+    WHERE notes_fts MATCH :query AND n.user_id = :user_id
+    ORDER BY bm25(notes_fts, 5.0, 1.0)
+    LIMIT :limit
+""")
+
+
+class SearchService:
+    """Full-text search over a user's notes (Postgres tsvector/GIN or SQLite FTS5)."""
+
+    @staticmethod
+    def ensure_search_index(connection) -> None:
+        """Create the search index structures for the connected database, if missing."""
+        statements = POSTGRES_SEARCH_DDL if connection.dialect.name == "postgresql" else SQLITE_SEARCH_DDL
+        for statement in statements:
+            connection.execute(text(statement))
+
+    @staticmethod
+    def to_fts5_query(query: str) -> str:
+        """Turn free text into a safe FTS5 query: every term must match, the last one as a prefix."""
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return ""
+        quoted = [f'"{term}"' for term in terms]
+        quoted[-1] += "*"
+        return " ".join(quoted)
+
+    @staticmethod
+    def search_notes(db: Session, user_id: int, query: str, limit: int = 20) -> List[dict]:
+        """Return the user's notes ranked by relevance with highlighted snippets."""
+        if db.get_bind().dialect.name == "postgresql":
+            statement, search_query = POSTGRES_SEARCH_QUERY, query
+        else:
+            statement, search_query = SQLITE_SEARCH_QUERY, SearchService.to_fts5_query(query)
+            if not search_query:
+                return []
+
+        rows = db.execute(statement, {"query": search_query, "user_id": user_id, "limit": limit}).mappings().all()
+        return [dict(row) for row in rows]
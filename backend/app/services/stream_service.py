@@ -0,0 +1,126 @@
+"""
+Resumable response streams.
+
+A producer (a generation job or a chat answer) publishes numbered events to a
+ResumableStream while clients follow it. Event ids start at 1 and increase by
+one per event; the last SSE_REPLAY_BUFFER_EVENTS events are kept so a client
+that reconnects with Last-Event-ID continues from the exact next event instead
+of starting over. Producers run independently of the connections following
+them, and finished streams stay resumable for SSE_STREAM_RETENTION_SECONDS.
+"""
+import asyncio
+import json
+import uuid
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from app.core.config import settings
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ReplayExpired(Exception):
+    """The events after the requested id are no longer in the replay buffer."""
+
+
+class ResumableStream:
+    def __init__(self, stream_id: str, user_id: int, max_events: Optional[int] = None):
+        self.id = stream_id
+        self.user_id = user_id
+        self.events: deque = deque(maxlen=max_events or settings.SSE_REPLAY_BUFFER_EVENTS)
+        self.last_id = 0
+        self.closed = False
+        self.task: Optional[asyncio.Task] = None
+        self._update = asyncio.Event()
+
+    def publish(self, event: str, data) -> int:
+        """Append an event; dicts are sent as JSON, strings as they are. Returns its id."""
+        if self.closed:
+            raise RuntimeError(f"Stream {self.id} is closed")
+        self.last_id += 1
+        self.events.append((self.last_id, event, data if isinstance(data, str) else json.dumps(data)))
+        self._notify()
+        return self.last_id
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self._notify()
+
+    def _notify(self) -> None:
+        update, self._update = self._update, asyncio.Event()
+        update.set()
+
+    async def follow(self, after: int = 0, heartbeat: Optional[float] = None) -> AsyncIterator[Optional[tuple]]:
+        """
+        Yield (id, event, data) for every event after id `after`, live ones included,
+        until the stream closes. With `heartbeat`, yields None after that many idle
+        seconds. Raises ReplayExpired if events after `after` were already dropped.
+        """
+        next_id = after + 1
+        while True:
+            update = self._update
+            # Events may be appended (and old ones dropped) while the caller awaits, so index by id each time
+            while next_id <= self.last_id:
+                if next_id < self.events[0][0]:
+                    raise ReplayExpired(f"Events after {next_id - 1} are no longer buffered")
+                yield self.events[next_id - self.events[0][0]]
+                next_id += 1
+            if self.closed:
+                return
+            try:
+                await asyncio.wait_for(update.wait(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                yield None
+
+    def can_resume(self, after: int) -> bool:
+        return not self.events or after + 1 >= self.events[0][0]
+
+
+class StreamRegistry:
+    """Streams of this process by id. Like the job pool, state is per process."""
+
+    _streams: dict[str, ResumableStream] = {}
+
+    @classmethod
+    def create(cls, user_id: int, stream_id: Optional[str] = None) -> ResumableStream:
+        stream = ResumableStream(stream_id or uuid.uuid4().hex, user_id)
+        cls._streams[stream.id] = stream
+        return stream
+
+    @classmethod
+    def get(cls, stream_id: str, user_id: int) -> Optional[ResumableStream]:
+        stream = cls._streams.get(stream_id)
+        return stream if stream is not None and stream.user_id == user_id else None
+
+    @classmethod
+    def finish(cls, stream: ResumableStream) -> None:
+        """Close the stream and forget it once the retention period is over."""
+        stream.close()
+        asyncio.get_running_loop().call_later(
+            settings.SSE_STREAM_RETENTION_SECONDS, cls._streams.pop, stream.id, None
+        )
+
+    @classmethod
+    def run(cls, user_id: int, produce: Callable[[ResumableStream], Awaitable[None]]) -> ResumableStream:
+        """
+        Start `produce(stream)` in the background, detached from the request, and
+        return the stream. An exception ends the stream with an "error" event.
+        """
+        stream = cls.create(user_id)
+
+        async def runner():
+            try:
+                await produce(stream)
+            except Exception as e:
+                logger.exception("Stream producer failed", extra={"stream_id": stream.id})
+                if not stream.closed:
+                    stream.publish("error", {"detail": str(e)})
+            finally:
+                if not stream.closed:
+                    stream.publish("done", {})
+                cls.finish(stream)
+
+        stream.task = asyncio.create_task(runner())
+        return stream
@@ -1,32 +1,146 @@
 from typing import List, Tuple
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.config import Settings
+import hashlib
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from app.core.config import settings
+from app.core.metrics import EMBEDDING_ENCODE_SECONDS, VECTOR_CHUNKS, VECTOR_INDEX_REBUILDS, VECTOR_QUERY_SECONDS
+from app.core.tracing import span, set_attributes, traced
+from app.utils.transcript import Transcript
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
+
+# sentence-transformers (torch) and chromadb are slow to import and the model is slow
+# to load, so they are loaded once per process on first use or by the startup warmup.
+_embedding_model = None
+_embedding_model_failed_at = None
+_chroma_client = None
+_load_lock = threading.Lock()
+
+# After a failed load (e.g. no network for the model download), wait this long before retrying
+EMBEDDING_MODEL_RETRY_SECONDS = 60
+
+# Chunk updates for the same note are serialised (generation and edits run in worker threads);
+# striped so the lock table stays bounded
+_note_locks = [threading.RLock() for _ in range(64)]
+
+
+def note_lock(note_id: int) -> threading.RLock:
+    """Lock held while a note's chunks are rewritten."""
+    return _note_locks[note_id % len(_note_locks)]
+
+
+def get_embedding_model():
+    """The shared embedding model, or None if it could not be loaded."""
+    global _embedding_model, _embedding_model_failed_at
+    if _embedding_model is None:
+        with _load_lock:
+            recently_failed = _embedding_model_failed_at is not None and \
+                time.monotonic() - _embedding_model_failed_at < EMBEDDING_MODEL_RETRY_SECONDS
+            if _embedding_model is None and not recently_failed:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    # Set a shorter timeout or handle the connection error specifically if possible, 
+                    # but for now, a broad catch is safe to prevent app crash.
+                    _embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+                    _embedding_model_failed_at = None
+                except Exception as e:
+                    logger.warning("Failed to load embedding model (likely network issue), RAG features are disabled: %s", e)
+                    _embedding_model_failed_at = time.monotonic()
+    return _embedding_model
+
+
+def get_chroma_client():
+    """The shared ChromaDB client."""
+    global _chroma_client
+    if _chroma_client is None:
+        with _load_lock:
+            if _chroma_client is None:
+                import chromadb
+                from chromadb.config import Settings
+
+                chroma_path = settings.CHROMA_PERSIST_DIRECTORY or \
+                    os.path.join(os.path.dirname(__file__), "..", "..", "chroma_db")
+                os.makedirs(chroma_path, exist_ok=True)
+                
+                # PersistentClient writes through to disk; a plain Client with persist_directory
+                # keeps everything in memory and the index is gone after a restart
+                _chroma_client = chromadb.PersistentClient(
+                    path=chroma_path,
+                    settings=Settings(anonymized_telemetry=False)
+                )
+    return _chroma_client
+
+
+def rebuild_note_index(note_id: int, user_id: int) -> None:
+    """Embed a note from its database row (runs in a worker thread)."""
+    from sqlalchemy.orm import undefer
+    from app.core.database import SessionLocal
+    from app.models.notes_model import Notes
+
+    # Read under the note's lock, so overlapping edits can't leave an older body indexed
+    with note_lock(note_id):
+        db = SessionLocal()
+        try:
+            note = db.query(Notes).options(undefer(Notes.notes)).filter(Notes.id == note_id).first()
+            if note is None:
+                return
+            content = note.notes
+            transcript = note.transcript
+        finally:
+            db.close()
+        VectorService().store_note_chunks(note_id, content, transcript, user_id)
+
+
+_rebuild_executor = None
+_rebuilding: set[int] = set()
+
+
+def schedule_index_rebuild(note_id: int, user_id: int) -> bool:
+    """
+    Rebuild a note's missing index in the background. Returns False if a rebuild
+    of it is already pending, so repeated chats don't queue the same work.
+    """
+    global _rebuild_executor
+    with _load_lock:
+        if note_id in _rebuilding:
+            return False
+        _rebuilding.add(note_id)
+        if _rebuild_executor is None:
+            _rebuild_executor = ThreadPoolExecutor(
+                max_workers=settings.VECTOR_REBUILD_WORKERS, thread_name_prefix="index-rebuild"
+            )
+
+    def run():
+        try:
+            rebuild_note_index(note_id, user_id)
+            VECTOR_INDEX_REBUILDS.labels("completed").inc()
+        except Exception:
+            VECTOR_INDEX_REBUILDS.labels("failed").inc()
+            logger.exception("Index rebuild failed", extra={"note_id": note_id})
+        finally:
+            with _load_lock:
+                _rebuilding.discard(note_id)
+
+    logger.info("Rebuilding missing index", extra={"note_id": note_id})
+    _rebuild_executor.submit(run)
+    return True
+
 
 class VectorService:
     """Service for document chunking and vector storage using ChromaDB."""
     
     def __init__(self):
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
         # Initialize sentence transformer for embeddings
-        try:
-            # Set a shorter timeout or handle the connection error specifically if possible, 
-            # but for now, a broad catch is safe to prevent app crash.
-            self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        except Exception as e:
-            print(f"WARNING: Failed to load embedding model (likely network issue): {e}")
-            print("RAG features (Chat with Notes) will be disabled for this session.")
-            self.embedding_model = None
+        self.embedding_model = get_embedding_model()
         
         # Initialize ChromaDB client with persistent storage
-        chroma_path = os.path.join(os.path.dirname(__file__), "..", "..", "chroma_db")
-        os.makedirs(chroma_path, exist_ok=True)
-        
-        self.chroma_client = chromadb.Client(Settings(
-            persist_directory=chroma_path,
-            anonymized_telemetry=False
-        ))
+        self.chroma_client = get_chroma_client()
         
         # Initialize text splitter for document chunking
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -41,66 +155,140 @@ class VectorService:
         chunks = self.text_splitter.split_text(text)
         return chunks
     
+    def transcript_chunk_metadata(self, transcript: str, chunks: List[str], note_id: int) -> List[dict]:
+        """Chunk metadata, with the chunk's start/end in seconds when the transcript has timings."""
+        metadatas = [{"source": "transcript", "type": "raw", "note_id": note_id} for _ in chunks]
+        if not (isinstance(transcript, Transcript) and transcript.has_segments):
+            return metadatas
+        # Chunks come out in order, so each one is found after the start of the previous one
+        cursor = 0
+        for chunk, metadata in zip(chunks, metadatas):
+            position = transcript.find(chunk, cursor)
+            if position < 0:
+                continue
+            metadata["start"], metadata["end"] = transcript.time_range(position, position + len(chunk))
+            cursor = position + 1
+        return metadatas
+    
     def create_embeddings(self, texts: List[str]) -> List[List[float]]:
         """Create embeddings for a list of texts."""
         if not self.embedding_model:
             return []
-        embeddings = self.embedding_model.encode(texts, convert_to_numpy=True)
+        with span("embedding.encode", {"embedding.texts": len(texts)}), EMBEDDING_ENCODE_SECONDS.time():
+            embeddings = self.embedding_model.encode(texts, convert_to_numpy=True)
         return embeddings.tolist()
     
-    def store_note_chunks(self, note_id: int, note_content: str, transcript: str = None) -> None:
-        """Chunk a note (and optional transcript) and store it in ChromaDB with embeddings."""
+    def get_user_collection(self, user_id: int):
+        """Get (or create) the single collection holding every chunk of a user's notes."""
+        return self.chroma_client.get_or_create_collection(
+            name=f"user_{user_id}",
+            metadata={"user_id": user_id, "hnsw:space": "cosine"}
+        )
+
+    @traced("vector.store_note_chunks")
+    def store_note_chunks(self, note_id: int, note_content: str, transcript: str = None, user_id: int = None) -> None:
+        """
+        Chunk a note (and optional transcript) and bring its stored chunks in line with them.
+        Only new or changed chunks are embedded; without a transcript the stored transcript
+        chunks are left as they are, so editing the notes never re-embeds the transcript.
+        """
         if not self.embedding_model:
-            print("Skipping vector storage: Embedding model not loaded.")
+            logger.warning("Skipping vector storage: embedding model not loaded", extra={"note_id": note_id})
             return
 
-        # Create or get collection for this note
-        collection_name = f"note_{note_id}"
-        
-        # Delete existing collection if it exists
-        try:
-            self.chroma_client.delete_collection(name=collection_name)
-        except:
-            pass
-        
-        collection = self.chroma_client.create_collection(
-            name=collection_name,
-            metadata={"note_id": note_id}
-        )
-        
-        # 1. Process Note Content
-        note_chunks = self.chunk_document(note_content)
-        note_embeddings = self.create_embeddings(note_chunks)
+        if user_id is not None:
+            # All of a user's notes share one collection so library-wide search is a single ANN query
+            collection = self.get_user_collection(user_id)
+            id_prefix = f"{note_id}_"
+        else:
+            # Legacy layout: one collection per note
+            collection = self.chroma_client.get_or_create_collection(
+                name=f"note_{note_id}",
+                metadata={"note_id": note_id}
+            )
+            id_prefix = ""
         
-        # Store Note Chunks
-        if note_chunks:
-            collection.add(
-                embeddings=note_embeddings,
-                documents=note_chunks,
-                metadatas=[{"source": "note", "type": "summary"} for _ in note_chunks],
-                ids=[f"note_chunk_{i}" for i in range(len(note_chunks))]
+        set_attributes({"note.id": note_id, "vector.collection": collection.name})
+
+        with note_lock(note_id):
+            # 1. Process Note Content
+            note_chunks = self.chunk_document(note_content)
+            self._sync_chunks(
+                collection, note_id, "note", note_chunks,
+                [{"source": "note", "type": "summary", "note_id": note_id} for _ in note_chunks], id_prefix
             )
-            
-        # 2. Process Transcript (if provided)
-        if transcript:
-            transcript_chunks = self.chunk_document(transcript)
-            transcript_embeddings = self.create_embeddings(transcript_chunks)
-            
-            if transcript_chunks:
-                collection.add(
-                    embeddings=transcript_embeddings,
-                    documents=transcript_chunks,
-                    metadatas=[{"source": "transcript", "type": "raw"} for _ in transcript_chunks],
-                    ids=[f"transcript_chunk_{i}" for i in range(len(transcript_chunks))]
+
+            # 2. Process Transcript (if provided)
+            if transcript is not None:
+                transcript_chunks = self.chunk_document(transcript)
+                self._sync_chunks(
+                    collection, note_id, "transcript", transcript_chunks,
+                    self.transcript_chunk_metadata(transcript, transcript_chunks, note_id), id_prefix
                 )
+                set_attributes({"vector.transcript_chunks": len(transcript_chunks)})
+        set_attributes({"vector.note_chunks": len(note_chunks)})
+
+    def _sync_chunks(self, collection, note_id: int, source: str, chunks: List[str], metadatas: List[dict],
+                     id_prefix: str) -> None:
+        """Make the stored chunks of one source match `chunks`, embedding only the ones not stored yet."""
+        # Ids are derived from the chunk text, so an unchanged chunk keeps its id and embedding
+        ids = []
+        occurrences = {}
+        for position, (chunk, metadata) in enumerate(zip(chunks, metadatas)):
+            digest = hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:16]
+            repeat = occurrences.get(digest, 0)
+            occurrences[digest] = repeat + 1
+            ids.append(f"{id_prefix}{source}_{digest}" + (f"_{repeat}" if repeat else ""))
+            metadata["position"] = position  # Order within the source, for merging neighbours
+
+        existing = collection.get(where={"$and": [{"note_id": note_id}, {"source": source}]}, include=["metadatas"])
+        stored = dict(zip(existing["ids"], existing["metadatas"]))
+        wanted = dict(zip(ids, zip(chunks, metadatas)))
+
+        removed = [chunk_id for chunk_id in stored if chunk_id not in wanted]
+        added = [chunk_id for chunk_id in ids if chunk_id not in stored]
+        # Same text, new position (text was inserted or removed before it): metadata only
+        moved = [chunk_id for chunk_id in ids if chunk_id in stored and stored[chunk_id] != wanted[chunk_id][1]]
+
+        if removed:
+            collection.delete(ids=removed)
+        if added:
+            documents = [wanted[chunk_id][0] for chunk_id in added]
+            collection.add(
+                ids=added,
+                embeddings=self.create_embeddings(documents),
+                documents=documents,
+                metadatas=[wanted[chunk_id][1] for chunk_id in added]
+            )
+        if moved:
+            collection.update(ids=moved, metadatas=[wanted[chunk_id][1] for chunk_id in moved])
+
+        VECTOR_CHUNKS.labels(source, "embedded").inc(len(added))
+        VECTOR_CHUNKS.labels(source, "reused").inc(len(ids) - len(added))
+        VECTOR_CHUNKS.labels(source, "deleted").inc(len(removed))
+        set_attributes({f"vector.{source}_chunks_embedded": len(added), f"vector.{source}_chunks_deleted": len(removed)})
     
+    @traced("vector.retrieve")
     def retrieve_relevant_chunks(
         self, 
         note_id: int, 
         query: str, 
-        n_results: int = 3
+        n_results: int = 3,
+        user_id: int = None
     ) -> List[Tuple[str, float]]:
         """Retrieve the most relevant chunks for a query."""
+        # Create query embedding
+        if not self.embedding_model:
+            return []
+
+        if user_id is not None:
+            chunks_with_scores = [
+                (chunk["text"], chunk["score"])
+                for chunk in self._query_user_collection(user_id, query, n_results, where={"note_id": note_id})
+            ]
+            if chunks_with_scores:
+                return chunks_with_scores
+
         collection_name = f"note_{note_id}"
         
         try:
@@ -108,18 +296,15 @@ class VectorService:
         except:
             # Collection doesn't exist, return empty list
             return []
-        
-        # Create query embedding
-        if not self.embedding_model:
-            return []
             
         query_embedding = self.create_embeddings([query])[0]
         
         # Query the collection
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=min(n_results, collection.count())
-        )
+        with span("vector.query", {"vector.collection": collection_name, "vector.n_results": n_results}), VECTOR_QUERY_SECONDS.time():
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=min(n_results, collection.count())
+            )
         
         # Return chunks with their distances
         chunks_with_scores = []
@@ -128,9 +313,116 @@ class VectorService:
                 chunks_with_scores.append((doc, 1 - distance))  # Convert distance to similarity
         
         return chunks_with_scores
+
+    @traced("vector.search")
+    def search_user_chunks(
+        self,
+        user_id: int,
+        query: str,
+        n_results: int = 10,
+        per_note: int = 3
+    ) -> List[dict]:
+        """
+        Semantic search across all of a user's notes and transcripts with one ANN query.
+        Returns notes ordered by their best chunk, each with up to `per_note` chunks.
+        """
+        if not self.embedding_model:
+            return []
+
+        # Over-fetch so that grouping still leaves enough distinct notes
+        chunks = self._query_user_collection(user_id, query, n_results * per_note)
+
+        groups = {}
+        for chunk in chunks:
+            group = groups.setdefault(chunk["note_id"], {"note_id": chunk["note_id"], "score": chunk["score"], "chunks": []})
+            if len(group["chunks"]) < per_note:
+                group["chunks"].append({
+                    "text": chunk["text"], "source": chunk["source"], "score": chunk["score"],
+                    "start": chunk["start"], "end": chunk["end"]
+                })
+
+        # Chunks arrive sorted by similarity, so insertion order is best-score order
+        return list(groups.values())[:n_results]
+
+    def _query_user_collection(self, user_id: int, query: str, n_results: int, where: dict = None) -> List[dict]:
+        try:
+            collection = self.chroma_client.get_collection(name=f"user_{user_id}")
+        except:
+            return []
+        return self._query_chunks(collection, self.create_embeddings([query])[0], n_results, where)
+
+    def _query_chunks(self, collection, query_embedding, n_results: int, where: dict = None,
+                      include_embeddings: bool = False) -> List[dict]:
+        count = collection.count()
+        if count == 0:
+            return []
+
+        include = ["documents", "distances", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        with span("vector.query", {
+            "vector.collection": collection.name,
+            "vector.n_results": n_results,
+            "vector.filtered": where is not None
+        }), VECTOR_QUERY_SECONDS.time():
+            results = collection.query(
+                query_embeddings=[query_embedding],
+                n_results=min(n_results, count),
+                where=where,
+                include=include
+            )
+
+        chunks = []
+        if results['documents'] and len(results['documents']) > 0:
+            embeddings = results['embeddings'][0] if include_embeddings else [None] * len(results['documents'][0])
+            for doc, distance, metadata, embedding in zip(
+                results['documents'][0], results['distances'][0], results['metadatas'][0], embeddings
+            ):
+                chunk = {
+                    "text": doc,
+                    "score": 1 - distance,  # Cosine distance to similarity
+                    "note_id": metadata.get("note_id"),
+                    "source": metadata.get("source"),
+                    "start": metadata.get("start"),
+                    "end": metadata.get("end")
+                }
+                if include_embeddings:
+                    chunk["position"] = metadata.get("position")
+                    chunk["embedding"] = embedding
+                chunks.append(chunk)
+        return chunks
+
+    @traced("vector.retrieve_candidates")
+    def retrieve_candidates(self, note_id: int, query: str, n_results: int = 20,
+                            user_id: int = None) -> Tuple[list, List[dict]]:
+        """
+        The query embedding and a note's best-matching chunks, with their embeddings and
+        positions, for packing chat context (see app/services/context_service.py).
+        """
+        if not self.embedding_model:
+            return [], []
+
+        query_embedding = self.create_embeddings([query])[0]
+        sources = []
+        if user_id is not None:
+            sources.append((f"user_{user_id}", {"note_id": note_id}))
+        sources.append((f"note_{note_id}", None))  # Legacy layout
+        for collection_name, where in sources:
+            try:
+                collection = self.chroma_client.get_collection(name=collection_name)
+            except:
+                continue
+            chunks = self._query_chunks(collection, query_embedding, n_results, where, include_embeddings=True)
+            if chunks:
+                set_attributes({"vector.candidates": len(chunks)})
+                return query_embedding, chunks
+        return query_embedding, []
     
-    def delete_note_collection(self, note_id: int) -> None:
+    def delete_note_collection(self, note_id: int, user_id: int = None) -> None:
         """Delete the vector collection for a note."""
+        if user_id is not None:
+            try:
+                self.get_user_collection(user_id).delete(where={"note_id": note_id})
+            except:
+                pass
         collection_name = f"note_{note_id}"
         try:
             self.chroma_client.delete_collection(name=collection_name)
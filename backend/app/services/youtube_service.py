@@ -2,6 +2,14 @@ import re
 from typing import Optional
 from youtube_transcript_api import YouTubeTranscriptApi
 from fastapi import HTTPException
+from app.core.config import settings
+from app.core.metrics import TRANSCRIPT_FETCH_SECONDS
+from app.core.tracing import traced, set_attributes
+from app.utils.transcript import Transcript
+
+from app.core.logger import get_logger
+
+logger = get_logger(__name__)
 
 class YouTubeService:
     @staticmethod
@@ -21,13 +29,75 @@ class YouTubeService:
         return None
 
     @staticmethod
-    def get_transcript(video_id: str, language: str = "en") -> str:
+    def extract_playlist_id(value: str) -> Optional[str]:
+        """
+        Extracts the playlist ID from a playlist URL (...?list=PLAYLIST_ID),
+        or returns a bare playlist ID as it is.
+        """
+        match = re.search(r"[?&]list=([0-9A-Za-z_-]+)", value)
+        if match:
+            return match.group(1)
+        value = value.strip()
+        if re.fullmatch(r"(?:PL|UU|LL|FL|OL)[0-9A-Za-z_-]{10,}", value):
+            return value
+        return None
+
+    @staticmethod
+    @traced("youtube.get_playlist_video_ids")
+    def get_playlist_video_ids(playlist_id: str, limit: int = 50) -> list[str]:
+        """
+        Video IDs of a playlist, in playlist order. Uses the YouTube Data API
+        when YOUTUBE_API_KEY is set, otherwise reads them from the playlist page
+        (which lists the first ~100 videos).
+        """
+        import requests
+
+        try:
+            video_ids = []
+            if settings.YOUTUBE_API_KEY:
+                page_token = None
+                while len(video_ids) < limit:
+                    response = requests.get("https://www.googleapis.com/youtube/v3/playlistItems", params={
+                        "part": "contentDetails",
+                        "playlistId": playlist_id,
+                        "maxResults": 50,
+                        "pageToken": page_token,
+                        "key": settings.YOUTUBE_API_KEY
+                    }, timeout=10)
+                    response.raise_for_status()
+                    page = response.json()
+                    video_ids += [item["contentDetails"]["videoId"] for item in page.get("items", [])]
+                    page_token = page.get("nextPageToken")
+                    if not page_token:
+                        break
+            else:
+                response = requests.get(
+                    "https://www.youtube.com/playlist",
+                    params={"list": playlist_id},
+                    headers={"Accept-Language": "en-US,en;q=0.9"},
+                    timeout=10
+                )
+                response.raise_for_status()
+                video_ids = re.findall(r'"playlistVideoRenderer":\{"videoId":"([0-9A-Za-z_-]{11})"', response.text)
+            video_ids = list(dict.fromkeys(video_ids))[:limit]
+        except Exception as e:
+            logger.warning("Playlist fetch failed: %s", e, extra={"playlist_id": playlist_id})
+            raise HTTPException(status_code=400, detail=f"Could not retrieve playlist: {str(e)}")
+        if not video_ids:
+            raise HTTPException(status_code=400, detail="The playlist is empty, private or could not be read")
+        set_attributes({"youtube.playlist_id": playlist_id, "youtube.playlist_videos": len(video_ids)})
+        return video_ids
+
+    @staticmethod
+    @TRANSCRIPT_FETCH_SECONDS.time()
+    @traced("youtube.get_transcript")
+    def get_transcript(video_id: str, language: str = "en") -> Transcript:
         """
         Fetches the transcript for a given video ID.
-        Returns the transcript as a single string.
+        Returns the transcript as a single string that keeps each snippet's timing.
         """
         try:
-            print(f"DEBUG: Getting transcript for {video_id} in {language}")
+            logger.debug("Fetching transcript", extra={"video_id": video_id, "language": language})
             ytt_api = YouTubeTranscriptApi()
             transcript_list = ytt_api.list(video_id)
             
@@ -35,40 +105,45 @@ class YouTubeService:
             
             # 1. Try fetching transcript in requested language
             try:
-                print(f"DEBUG: Step 1 - Trying {language}")
+                logger.debug("Trying requested language", extra={"video_id": video_id, "language": language})
                 transcript = transcript_list.find_transcript([language])
-                print("DEBUG: Step 1 success")
+                logger.debug("Found transcript in requested language", extra={"video_id": video_id})
             except Exception as e:
-                print(f"DEBUG: Step 1 failed: {e}")
+                logger.debug("Requested language unavailable: %s", e, extra={"video_id": video_id})
                 # 2. If not found, try English
                 try:
-                    print("DEBUG: Step 2 - Trying English")
+                    logger.debug("Trying English", extra={"video_id": video_id})
                     transcript = transcript_list.find_transcript(['en', 'en-US'])
-                    print("DEBUG: Step 2 success")
+                    logger.debug("Found English transcript", extra={"video_id": video_id})
                 except Exception as e:
-                    print(f"DEBUG: Step 2 failed: {e}")
+                    logger.debug("English unavailable: %s", e, extra={"video_id": video_id})
                     # 3. If not found, just take the first available one
                     try:
-                        print("DEBUG: Step 3 - Trying any available")
+                        logger.debug("Trying any available transcript", extra={"video_id": video_id})
                         # iterate to get the first one
                         for t in transcript_list:
                             transcript = t
                             break
                         if transcript:
-                            print(f"DEBUG: Step 3 success: Found {transcript.language_code}")
+                            logger.debug("Found transcript", extra={"video_id": video_id, "language": transcript.language_code})
                     except Exception as e:
-                        print(f"DEBUG: Step 3 failed: {e}")
+                        logger.debug("No transcript available: %s", e, extra={"video_id": video_id})
                         raise Exception("No transcripts available for this video.")
             
             if not transcript:
                  raise Exception("No transcripts available for this video.")
 
             # Fetch the actual transcript data
-            # transcript.fetch() returns a list of FetchedTranscriptSnippet objects
-            fetched_transcript = transcript.fetch()
-            
-            transcript_text = " ".join([snippet.text for snippet in fetched_transcript])
+            # transcript.fetch() returns a list of FetchedTranscriptSnippet objects; only
+            # their text and timing arrays are kept
+            transcript_text = Transcript.from_snippets(transcript.fetch())
+            set_attributes({
+                "youtube.video_id": video_id,
+                "youtube.language": transcript.language_code,
+                "youtube.transcript_chars": len(transcript_text),
+                "youtube.transcript_segments": len(transcript_text.offsets)
+            })
             return transcript_text
         except Exception as e:
-            print(f"DEBUG: Outer exception: {e}")
+            logger.warning("Transcript fetch failed: %s", e, extra={"video_id": video_id})
             raise HTTPException(status_code=400, detail=f"Could not retrieve transcript: {str(e)}")
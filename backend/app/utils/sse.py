@@ -0,0 +1,46 @@
+from typing import Optional
+from fastapi import Request
+
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# Sent with SSE responses so proxies pass events through as they are written
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def wants_sse(request: Request) -> bool:
+    """True if the client asked for Server-Sent Events rather than the plain text stream."""
+    return SSE_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def last_event_id(request: Request) -> int:
+    """
+    The last event the client received: the Last-Event-ID header EventSource sends
+    when it reconnects, or a `last_event_id` query parameter. 0 means from the start.
+    """
+    value = request.headers.get("last-event-id") or request.query_params.get("last_event_id") or "0"
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+def format_event(data: str, event: Optional[str] = None, event_id: Optional[int] = None,
+                 retry_ms: Optional[int] = None) -> str:
+    """Encode one SSE event. Multi-line data is split over several data: fields."""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event:
+        lines.append(f"event: {event}")
+    if retry_ms is not None:
+        lines.append(f"retry: {retry_ms}")
+    lines.extend(f"data: {line}" for line in data.split("\n"))
+    return "\n".join(lines) + "\n\n"
+
+
+def format_comment(text: str = "") -> str:
+    """An SSE comment line; clients ignore it, proxies see traffic on an idle stream."""
+    return f": {text}\n\n"
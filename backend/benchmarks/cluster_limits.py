@@ -0,0 +1,164 @@
+"""
+Check: concurrency limits and token quotas hold across worker processes.
+
+Starts --workers processes configured like separate uvicorn workers. Each runs
+--tasks concurrent tasks that repeatedly take a slot from the "bench" pool
+(capacity --capacity) for --hold seconds, and records daily token usage for
+one user --consume times. The parent then reports the peak number of slots
+held at once across all processes and compares the recorded quota with the
+expected total.
+
+With --backend redis and no --redis-url a local Redis-compatible stand-in
+(fakeredis's TCP server, `pip install "fakeredis[lua]"`) is started. The
+database quota runs against a throwaway SQLite file unless the Postgres
+settings are in the environment.
+
+Exits 1 if the peak exceeds the capacity or usage updates were lost; with
+--backend local the peak is expected to be workers x capacity.
+
+Usage (from backend/):
+    python benchmarks/cluster_limits.py [--backend redis|postgres|local] [--quota redis|database]
+                                        [--workers 4] [--capacity 3] [--tasks 6] [--duration 3]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+USER_ID = 1
+
+
+def start_stand_in() -> str:
+    from fakeredis import TcpFakeServer
+
+    server = TcpFakeServer(("127.0.0.1", 0), server_type="redis")
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return f"redis://{host}:{port}/0"
+
+
+def worker(env: dict, args: argparse.Namespace, results) -> None:
+    os.environ.update(env)
+    sys.path.insert(0, BACKEND_DIR)
+    from app.core.database import SessionLocal
+    from app.core.limits import get_limiter, record_tokens
+
+    semaphore = get_limiter().semaphore("bench", args.capacity)
+    holds = []
+
+    async def hammer():
+        deadline = time.monotonic() + args.duration
+        while time.monotonic() < deadline:
+            async with semaphore:
+                start = time.time()
+                await asyncio.sleep(args.hold)
+                holds.append((start, time.time()))
+
+    async def main():
+        await asyncio.gather(*(hammer() for _ in range(args.tasks)))
+
+    asyncio.run(main())
+
+    db = SessionLocal()
+    for _ in range(args.consume):
+        record_tokens(USER_ID, args.tokens, db)
+    db.close()
+    results.put(holds)
+
+
+def peak_overlap(holds: list[tuple[float, float]]) -> int:
+    events = sorted([(start, 1) for start, _ in holds] + [(end, -1) for _, end in holds])
+    peak = current = 0
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", default="redis", choices=["redis", "postgres", "local"])
+    parser.add_argument("--quota", default=None, choices=["redis", "database"],
+                        help="defaults to redis with --backend redis, otherwise database")
+    parser.add_argument("--redis-url", help="use this server instead of the stand-in")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--capacity", type=int, default=3)
+    parser.add_argument("--tasks", type=int, default=6, help="concurrent tasks per worker")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--hold", type=float, default=0.05, help="seconds each task holds a slot")
+    parser.add_argument("--consume", type=int, default=50, help="usage updates per worker")
+    parser.add_argument("--tokens", type=int, default=7)
+    args = parser.parse_args()
+    quota_backend = args.quota or ("redis" if args.backend == "redis" else "database")
+
+    redis_url = args.redis_url
+    if not redis_url and "redis" in (args.backend, quota_backend):
+        redis_url = start_stand_in()
+
+    # Fresh SQLite database (unless Postgres is configured) and no .env from backend/
+    workdir = tempfile.mkdtemp(prefix="cluster-limits-")
+    os.chdir(workdir)
+    env = {
+        "LIMITER_BACKEND": args.backend,
+        "QUOTA_BACKEND": quota_backend,
+        "REDIS_URL": redis_url or "",
+        "LOG_LEVEL": "WARNING",
+    }
+    os.environ.update(env)
+    sys.path.insert(0, BACKEND_DIR)
+    from app.core.database import Base, SessionLocal, engine
+    from app.core.limits import get_quota
+    from app.models import user_pref_model, token_usage_model  # noqa: F401 (register the tables)
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    used_before = get_quota().used(USER_ID, db)
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(env, args, results)) for _ in range(args.workers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    holds = [hold for _ in processes for hold in results.get()]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - start
+
+    recorded = get_quota().used(USER_ID, db) - used_before
+    expected = args.workers * args.consume * args.tokens
+    peak = peak_overlap(holds)
+    allowed = args.capacity * (args.workers if args.backend == "local" else 1)
+
+    print(json.dumps({
+        "limiter_backend": args.backend,
+        "quota_backend": quota_backend,
+        "workers": args.workers,
+        "capacity": args.capacity,
+        "slots_taken": len(holds),
+        "slots_per_second": round(len(holds) / elapsed, 1),
+        "peak_concurrency": peak,
+        "allowed_concurrency": allowed,
+        "quota_recorded": recorded,
+        "quota_expected": expected,
+    }, indent=2))
+
+    failed = False
+    if peak > allowed:
+        print(f"\nFAIL: {peak} slots held at once, limit is {allowed}")
+        failed = True
+    if recorded != expected:
+        print(f"\nFAIL: recorded {recorded} tokens, expected {expected} (lost updates)")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
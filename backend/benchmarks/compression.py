@@ -0,0 +1,125 @@
+"""
+Benchmark: bytes-on-wire and latency of CompressionMiddleware.
+
+Drives a small ASGI app in-process (no network) that serves
+  - a streamed note, yielded in small token batches like the LLM stream, and
+  - a large JSON list similar to get_user_notes,
+with no compression, gzip and (if installed) brotli, and reports bytes sent,
+time to first byte and total time.
+
+Usage (from backend/):
+    python benchmarks/compression.py [--note-chars 40000] [--token-chars 16] [--token-delay 0.002]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse, StreamingResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from app.core.compression import CompressionMiddleware, brotli  # noqa: E402
+
+WORDS = (
+    "gradient descent neural network layer weight bias activation function loss "
+    "optimization learning rate backpropagation matrix vector derivative chain rule "
+    "## Key Concepts - **Definition**: $$ w = w - \\eta \\nabla L $$ example application"
+).split()
+
+
+def synthetic_text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def build_app(args) -> Starlette:
+    rng = random.Random(7)
+    note = synthetic_text(rng, args.note_chars)
+    listing = [
+        {"id": i, "title": f"Lecture {i}", "video_id": f"vid{i:08d}", "created_at": "2026-01-01T00:00:00",
+         "language": "en", "style": "detailed", "notes_snippet": synthetic_text(rng, 200)}
+        for i in range(100)
+    ]
+
+    async def stream_note(request):
+        async def tokens():
+            for i in range(0, len(note), args.token_chars):
+                await asyncio.sleep(args.token_delay)
+                yield note[i:i + args.token_chars]
+        return StreamingResponse(tokens(), media_type="text/plain")
+
+    async def list_notes(request):
+        return JSONResponse(listing)
+
+    return Starlette(routes=[Route("/stream", stream_note), Route("/list", list_notes)])
+
+
+async def request(app, path: str, accept_encoding: str) -> dict:
+    scope = {
+        "type": "http", "method": "GET", "path": path, "raw_path": path.encode(), "query_string": b"",
+        "headers": [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else [],
+        "http_version": "1.1", "scheme": "http", "server": ("bench", 80), "client": ("bench", 1), "root_path": "",
+    }
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)
+
+    result = {"bytes": 0, "messages": 0, "ttfb_ms": None}
+    start = time.perf_counter()
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            if result["ttfb_ms"] is None:
+                result["ttfb_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            result["bytes"] += len(message["body"])
+            result["messages"] += 1
+
+    await app(scope, receive, send)
+    result["total_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return result
+
+
+async def run(args) -> dict:
+    plain = build_app(args)
+    compressed = CompressionMiddleware(build_app(args))
+    encodings = ["", "gzip"] + (["br"] if brotli is not None else [])
+
+    # Warm up both stacks so the first measured request isn't penalised
+    await request(plain, "/list", "")
+    await request(compressed, "/list", "gzip")
+
+    results = {}
+    for path in ("/stream", "/list"):
+        for encoding in encodings:
+            app = compressed if encoding else plain
+            results[f"{path} {encoding or 'identity'}"] = await request(app, path, encoding)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--note-chars", type=int, default=40000)
+    parser.add_argument("--token-chars", type=int, default=16)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Micro-benchmarks for CPU-bound functions on the request path, with regression checks.
+
+Cases (each over fixed synthetic corpora of several sizes):
+  llm.chunk_transcript         LLMService.chunk_transcript
+  vector.chunk_document        VectorService.chunk_document
+  vector.create_embeddings     VectorService.create_embeddings (skipped without the model)
+  rag.build_context            MMR selection + merging of retrieved chunks for chat context
+  export.render_html           markdown2 + HTML template
+  export.render_pdf            markdown2 + xhtml2pdf (pisa)
+  auth.verify_password         bcrypt check
+  auth.jwt_decode              jose jwt.decode of an access token
+
+Each case is calibrated so one round takes at least --min-round-time, then
+timed for --rounds rounds with GC disabled. Every run also times a fixed
+pure-Python reference workload, and each case's fastest round is stored
+relative to the reference's ("relative"). That cancels out most of the
+difference in speed between machines, and fastest rounds barely move with
+other load on a shared host, where medians swing by tens of percent.
+--save writes the results as the baseline; --compare fails (exit code 1)
+when a case's relative figure is more than --threshold above the
+baseline's. Absolute timings are kept for reading only. Relative figures
+still shift between CPU architectures and Python versions, so re-record the
+baseline (--save) when either changes.
+
+Some cases are skipped where their dependency (e.g. the embedding model) is
+unavailable. --compare also fails when a case in REQUIRED_CASES is missing
+from the baseline, or a baseline case didn't run, so a gap can't pass as
+"no regressions": record and compare with the full requirements installed.
+
+Usage (from backend/):
+    python benchmarks/hot_paths.py [--filter chunk] [--compare] [--save] [--threshold 0.25]
+                                   [--baseline benchmarks/baselines/hot_paths.json] [--output results.json]
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# LLMService refuses to start without a key; no request is ever sent here
+os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+
+from app.core.auth import create_access_token, get_password_hash, verify_password  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.services.context_service import build_context  # noqa: E402
+from app.services.export_service import render_html, render_pdf_bytes  # noqa: E402
+from app.services.llm_service import LLMService  # noqa: E402
+from jose import jwt  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "hot_paths.json")
+# Cases (all sizes) the regression gate must cover
+REQUIRED_CASES = ("vector.chunk_document", "vector.create_embeddings")
+
+TRANSCRIPT_SIZES = {"10k": 10_000, "60k": 60_000, "120k": 120_000}
+NOTE_SIZES = {"2k": 2_000, "10k": 10_000, "40k": 40_000}
+PDF_NOTE_SIZES = {"2k": 2_000, "10k": 10_000}
+
+WORDS = (
+    "gradient descent neural network layer weight bias activation function loss "
+    "optimization learning rate backpropagation matrix vector derivative chain rule "
+    "probability distribution sample variance mean estimator model training data "
+    "so basically we can see that here and then if you look at this one right"
+).split()
+
+
+def synthetic_text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def synthetic_notes(rng: random.Random, length: int) -> str:
+    """Markdown shaped like generated notes: headings, bullets, bold terms, a table and math."""
+    parts = ["# Lecture Notes\n"]
+    size = 0
+    section = 0
+    while size < length:
+        section += 1
+        block = (
+            f"\n## {section}. {synthetic_text(rng, 30).title()}\n\n"
+            f"{synthetic_text(rng, 300)}\n\n"
+            f"- **{rng.choice(WORDS)}**: {synthetic_text(rng, 80)}\n"
+            f"- **{rng.choice(WORDS)}**: {synthetic_text(rng, 80)}\n\n"
+            f"| Term | Meaning |\n|---|---|\n| {rng.choice(WORDS)} | {synthetic_text(rng, 40)} |\n\n"
+            f"$$ w_{{t+1}} = w_t - \\eta \\nabla L(w_t) $$\n"
+        )
+        parts.append(block)
+        size += len(block)
+    return "".join(parts)[:length]
+
+
+def reference_workload(rng: random.Random):
+    """Sorting, hashing and string building: a stand-in for the interpreter's speed."""
+    words = [synthetic_text(rng, 12) for _ in range(2000)]
+
+    def run():
+        ordered = sorted(words)
+        counts = {}
+        for word in ordered:
+            counts[word[:3]] = counts.get(word[:3], 0) + len(word)
+        return "|".join(f"{key}={value}" for key, value in counts.items())
+    return run
+
+
+def build_cases(rng: random.Random) -> dict:
+    """Return {case name: zero-argument callable}."""
+    cases = {}
+
+    llm_service = LLMService()
+    for label, size in TRANSCRIPT_SIZES.items():
+        transcript = synthetic_text(rng, size)
+        cases[f"llm.chunk_transcript[{label}]"] = lambda t=transcript: llm_service.chunk_transcript(t)
+
+    try:
+        from app.services.vector_service import VectorService
+        vector_service = VectorService()
+    except ImportError as e:
+        print(f"Skipping vector cases: {e}", file=sys.stderr)
+        vector_service = None
+
+    notes_by_size = {label: synthetic_notes(rng, size) for label, size in NOTE_SIZES.items()}
+    if vector_service is not None:
+        for label, notes in notes_by_size.items():
+            cases[f"vector.chunk_document[{label}]"] = lambda n=notes: vector_service.chunk_document(n)
+        if vector_service.embedding_model is not None:
+            chunks = vector_service.chunk_document(notes_by_size["40k"])
+            cases["vector.create_embeddings[query]"] = lambda: vector_service.create_embeddings(["what is the chain rule?"])
+            cases["vector.create_embeddings[32 chunks]"] = lambda c=chunks[:32]: vector_service.create_embeddings(c)
+        else:
+            print("Skipping embedding cases: embedding model not loaded", file=sys.stderr)
+
+    chunks = (vector_service.chunk_document(notes_by_size["40k"]) if vector_service is not None
+              else [synthetic_text(rng, 480) for _ in range(80)])
+    for count in (12, 40):
+        # Random embeddings of the model's width (384); packing cost doesn't depend on their values
+        candidates = [
+            {"text": chunk, "embedding": [rng.gauss(0, 1) for _ in range(384)], "note_id": 1,
+             "source": "note", "position": position}
+            for position, chunk in enumerate(chunks[:count])
+        ]
+        query = [rng.gauss(0, 1) for _ in range(384)]
+        cases[f"rag.build_context[{count} candidates]"] = \
+            lambda q=query, c=candidates: build_context(q, c, settings.RAG_CONTEXT_TOKENS)
+
+    for label, notes in notes_by_size.items():
+        cases[f"export.render_html[{label}]"] = lambda n=notes: render_html(n)
+    for label in PDF_NOTE_SIZES:
+        cases[f"export.render_pdf[{label}]"] = lambda n=notes_by_size[label]: render_pdf_bytes(n)
+
+    hashed = get_password_hash("correct horse battery staple")
+    cases["auth.verify_password"] = lambda: verify_password("correct horse battery staple", hashed)
+
+    token = create_access_token({"sub": "student@example.com"})
+    cases["auth.jwt_decode"] = lambda: jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    return cases
+
+
+def measure(func, rounds: int, min_round_time: float) -> dict:
+    func()  # warm up caches and lazy imports
+
+    # Calibrate: enough iterations per round that timer resolution doesn't matter
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        if time.perf_counter() - start >= min_round_time or iterations >= 1_000_000:
+            break
+        iterations *= 2
+
+    timings = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            timings.append((time.perf_counter() - start) / iterations)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    return {
+        "iterations": iterations,
+        "rounds": rounds,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.fmean(timings),
+        "stdev_s": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None or "relative" not in reference:
+            continue  # New case, or a baseline from before relative figures; re-record it
+        ratio = result["relative"] / reference["relative"]
+        result["baseline_relative"] = reference["relative"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {ratio:.2f}x baseline ({result['relative']:.3g} vs {reference['relative']:.3g} x reference)"
+            )
+    return regressions
+
+
+def missing_cases(results: dict, baseline: dict, name_filter: str) -> list[str]:
+    recorded = baseline.get("results", {})
+    missing = [
+        f"{case}: not in the baseline; record it (--save) where it can run"
+        for case in REQUIRED_CASES
+        if name_filter in case and not any(name.split("[")[0] == case for name in recorded)
+    ]
+    missing += [
+        f"{name}: in the baseline but not run here"
+        for name in recorded if name_filter in name and name not in results
+    ]
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this string")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--min-round-time", type=float, default=0.05, help="Seconds per calibrated round")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--compare", action="store_true", help="Fail if a case regressed past --threshold")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown of the median, e.g. 0.25 = 25%%")
+    parser.add_argument("--save", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--output", help="Also write the JSON results here")
+    args = parser.parse_args()
+
+    cases = {name: func for name, func in build_cases(random.Random(42)).items() if args.filter in name}
+    reference = reference_workload(random.Random(7))
+    # Timed before and after the cases, keeping the faster
+    reference_before = measure(reference, args.rounds, args.min_round_time)
+    results = {}
+    for name, func in cases.items():
+        results[name] = measure(func, args.rounds, args.min_round_time)
+        print(f"{name:<40}{results[name]['median_s'] * 1e6:>14.1f} us", file=sys.stderr)
+    reference_after = measure(reference, args.rounds, args.min_round_time)
+    reference_s = min(reference_before["min_s"], reference_after["min_s"])
+    for result in results.values():
+        result["relative"] = result["min_s"] / reference_s
+
+    report = {
+        "machine": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "reference_s": reference_s,
+        "results": results,
+    }
+
+    regressions = missing = []
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            raise SystemExit(f"No baseline at {args.baseline}; record one with --save")
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        missing = missing_cases(results, baseline, args.filter)
+        report["regressions"] = regressions
+        report["missing"] = missing
+
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        if os.path.exists(args.baseline) and args.filter:
+            # Partial run: keep the other cases' baselines
+            with open(args.baseline) as f:
+                previous = json.load(f)
+            report = {**report, "results": {**previous.get("results", {}), **results}}
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    if regressions:
+        print("Performance regressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+    if missing:
+        print("Cases not compared:\n  " + "\n  ".join(missing), file=sys.stderr)
+    if regressions or missing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Budget check: cold import time of the application module.
+
+Imports app.main in fresh interpreters (what a worker does before it can
+serve /health) and fails if the median wall time exceeds --budget-ms or if
+any of the heavy dependencies that are meant to load lazily (LLM client,
+embedding model, vector store, export renderers) got imported. With
+--importtime it also prints the slowest top-level imports from
+`python -X importtime` to show where the time goes.
+
+Exits 1 on a budget or lazy-import violation, so it can gate CI.
+
+Usage (from backend/):
+    python benchmarks/import_time.py [--runs 5] [--budget-ms 1500] [--importtime]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Must stay out of `import app.main`; they load on first use or in the startup warmup
+LAZY_MODULES = (
+    "langchain_openai",
+    "langchain_core",
+    "openai",
+    "sentence_transformers",
+    "torch",
+    "chromadb",
+    "langchain_text_splitters",
+    "xhtml2pdf",
+    "docx",
+)
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app.main
+elapsed = time.perf_counter() - start
+print(json.dumps({"ms": elapsed * 1000, "loaded": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def run_probe() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    # The last line is the probe's; anything before it is application logging
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int = 15) -> list[tuple[float, str]]:
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Only modules imported directly by app code or the top level
+        if len(name) - len(name.lstrip()) <= 3 or name.strip().startswith("app."):
+            rows.append((int(cumulative) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1500)
+    parser.add_argument("--importtime", action="store_true", help="print the slowest imports")
+    args = parser.parse_args()
+
+    results = [run_probe() for _ in range(args.runs)]
+    timings = sorted(result["ms"] for result in results)
+    loaded = sorted({module for result in results for module in result["loaded"]})
+    median = statistics.median(timings)
+
+    print(json.dumps({
+        "runs": args.runs,
+        "median_ms": round(median, 1),
+        "min_ms": round(timings[0], 1),
+        "max_ms": round(timings[-1], 1),
+        "budget_ms": args.budget_ms,
+        "eagerly_loaded": loaded,
+    }, indent=2))
+
+    if args.importtime:
+        print("\nslowest imports (cumulative ms):")
+        for ms, name in slowest_imports():
+            print(f"  {ms:8.1f}  {name}")
+
+    failed = False
+    if median > args.budget_ms:
+        print(f"\nFAIL: median import time {median:.0f} ms exceeds budget of {args.budget_ms:.0f} ms")
+        failed = True
+    if loaded:
+        print(f"\nFAIL: heavy modules imported at startup: {', '.join(loaded)}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
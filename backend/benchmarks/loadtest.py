@@ -0,0 +1,347 @@
+"""
+End-to-end load test: real backend, stub LLM, synthetic transcripts.
+
+Starts benchmarks/stub_llm.py and benchmarks/loadtest_app.py as subprocesses
+(the backend runs in a scratch directory on the SQLite fallback), registers a
+set of users, seeds a few notes per user and then drives a closed-loop mix of
+traffic from --users concurrent virtual users for --duration seconds:
+
+  generate   POST /notes/generate: a new video (full pipeline), a video the
+             user already has (cached replay) or another language of one
+             (variant derivation)
+  chat       POST /notes/{id}/chat
+  list       GET  /notes/
+  export     GET  /notes/{id}/export (pdf or md)
+
+Reports p50/p95/p99 latency, time to first byte, throughput and errors per
+operation, plus server event-loop lag and stub LLM counters, as JSON for
+regression tracking (--output, default stdout) with a short table on stderr.
+
+Usage (from backend/):
+    python benchmarks/loadtest.py [--users 10] [--duration 30] [--mix generate=2,chat=3,list=4,export=1]
+                                  [--tokens-per-second 200] [--rate-limit-ratio 0.05] [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from jose import jwt
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SECRET_KEY = "loadtest-secret"
+NOTE_ID_PATTERN = re.compile(r"<!-- NOTE_ID: (\d+) -->")
+LANGUAGES = ["en", "es", "fr", "de"]
+
+
+class VirtualUser:
+    def __init__(self, index: int, token: str, rng: random.Random):
+        self.index = index
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.rng = rng
+        self.videos = 0
+        self.notes: list[dict] = []
+
+    def new_video_id(self) -> str:
+        # 11 characters, as YouTubeService.extract_video_id expects
+        self.videos += 1
+        return f"lt{self.index:03d}{self.videos:06d}"
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pick(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))], 2)
+
+    return {
+        "p50": pick(50),
+        "p95": pick(95),
+        "p99": pick(99),
+        "max": round(values[-1], 2),
+        "mean": round(sum(values) / len(values), 2),
+    }
+
+
+async def timed_request(client: httpx.AsyncClient, method: str, url: str, **kwargs) -> dict:
+    """Issue one request, reading the body as a stream to capture time to first byte."""
+    start = time.perf_counter()
+    result = {"status": None, "ttfb_ms": None, "bytes": 0, "body": b""}
+    try:
+        async with client.stream(method, url, **kwargs) as response:
+            result["status"] = response.status_code
+            async for chunk in response.aiter_bytes():
+                if result["ttfb_ms"] is None:
+                    result["ttfb_ms"] = (time.perf_counter() - start) * 1000
+                result["body"] += chunk
+            # Bytes on the wire, i.e. after response compression
+            result["bytes"] = response.num_bytes_downloaded
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    if result["status"] and result["status"] >= 400:
+        result["detail"] = result["body"][:200].decode("utf-8", errors="replace")
+    result["latency_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+async def generate(client, user: VirtualUser, kind: str) -> tuple[str, dict]:
+    if kind == "cached" and user.notes:
+        note = user.rng.choice(user.notes)
+        video_id, language = note["video_id"], note["language"]
+    elif kind == "variant" and user.notes:
+        note = user.rng.choice(user.notes)
+        video_id = note["video_id"]
+        language = user.rng.choice([lang for lang in LANGUAGES if lang != note["language"]])
+    else:
+        kind, video_id, language = "full", user.new_video_id(), "en"
+
+    result = await timed_request(
+        client, "POST", "/api/v1/notes/generate",
+        json={"url": f"https://youtu.be/{video_id}", "language": language, "style": "detailed"},
+        headers=user.headers,
+    )
+    text = result["body"].decode("utf-8", errors="replace")
+    match = NOTE_ID_PATTERN.search(text)
+    if result["status"] == 200 and match:
+        note_id = int(match.group(1))
+        if kind != "cached" and all(note["id"] != note_id for note in user.notes):
+            user.notes.append({"id": note_id, "video_id": video_id, "language": language})
+    elif result["status"] == 200:
+        result["error"] = "no_note_id"
+        result["detail"] = text[-200:]
+    return f"generate_{kind}", result
+
+
+async def chat(client, user: VirtualUser) -> tuple[str, dict]:
+    note = user.rng.choice(user.notes)
+    return "chat", await timed_request(
+        client, "POST", f"/api/v1/notes/{note['id']}/chat",
+        json={"message": "Can you explain the chain rule step again?"},
+        headers=user.headers,
+    )
+
+
+async def list_notes(client, user: VirtualUser) -> tuple[str, dict]:
+    return "list", await timed_request(client, "GET", "/api/v1/notes/", params={"limit": 20}, headers=user.headers)
+
+
+async def export(client, user: VirtualUser) -> tuple[str, dict]:
+    note = user.rng.choice(user.notes)
+    export_format = user.rng.choice(["pdf", "md"])
+    return f"export_{export_format}", await timed_request(
+        client, "GET", f"/api/v1/notes/{note['id']}/export", params={"format": export_format}, headers=user.headers
+    )
+
+
+async def run_user(client, user: VirtualUser, mix: dict, deadline: float, results: dict):
+    operations, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        operation = user.rng.choices(operations, weights)[0]
+        if operation != "generate" and not user.notes:
+            operation = "generate"
+        if operation == "generate":
+            kind = user.rng.choices(["full", "cached", "variant"], [5, 3, 2])[0]
+            name, result = await generate(client, user, kind)
+        elif operation == "chat":
+            name, result = await chat(client, user)
+        elif operation == "list":
+            name, result = await list_notes(client, user)
+        else:
+            name, result = await export(client, user)
+        result.pop("body")
+        results.setdefault(name, []).append(result)
+
+
+def summarise(results: dict, elapsed: float) -> dict:
+    operations = {}
+    for name, entries in sorted(results.items()):
+        status_counts = {}
+        for entry in entries:
+            key = str(entry["status"] or entry.get("error"))
+            status_counts[key] = status_counts.get(key, 0) + 1
+        errors = [entry for entry in entries if entry.get("error") or not entry["status"] or entry["status"] >= 400]
+        operations[name] = {
+            "count": len(entries),
+            "errors": len(errors),
+            "throughput_rps": round(len(entries) / elapsed, 3),
+            "status_counts": status_counts,
+            "latency_ms": percentiles([entry["latency_ms"] for entry in entries]),
+            "ttfb_ms": percentiles([entry["ttfb_ms"] for entry in entries if entry["ttfb_ms"] is not None]),
+            "mean_bytes": round(sum(entry["bytes"] for entry in entries) / len(entries)),
+            "error_samples": sorted({entry["detail"] for entry in errors if entry.get("detail")})[:3],
+        }
+    total = sum(op["count"] for op in operations.values())
+    return {
+        "requests": total,
+        "errors": sum(op["errors"] for op in operations.values()),
+        "throughput_rps": round(total / elapsed, 3),
+        "operations": operations,
+    }
+
+
+def start_process(script: str, args: list[str], cwd: str, env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, os.path.join(BENCH_DIR, script), *args], cwd=cwd, env=env)
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 120.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"{url} exited with code {process.returncode} before becoming ready")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not become ready in {timeout}s")
+
+
+async def run(args) -> dict:
+    mix = {name: float(weight) for name, weight in (item.split("=") for item in args.mix.split(","))}
+    unknown = set(mix) - {"generate", "chat", "list", "export"}
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    env = {
+        **os.environ,
+        "OPENROUTER_API_KEY": "stub",
+        "OPENROUTER_BASE_URL": f"{stub_url}/v1",
+        "SECRET_KEY": SECRET_KEY,
+        "DAILY_TOKEN_LIMIT": str(10 ** 12),
+        "MAX_CONCURRENT_REQUESTS": str(args.max_concurrent_requests),
+        "PYTHONPATH": BACKEND_DIR,
+        # Blank Postgres settings force the SQLite fallback in the scratch directory
+        "user": "", "password": "", "host": "", "port": "", "dbname": "",
+    }
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="notesbuddy-loadtest-") as workdir:
+        try:
+            processes.append(start_process("stub_llm.py", [
+                "--port", str(args.stub_port),
+                "--tokens-per-second", str(args.tokens_per_second),
+                "--first-token-latency", str(args.first_token_latency),
+                "--output-tokens", str(args.output_tokens),
+                "--rate-limit-ratio", str(args.rate_limit_ratio),
+            ], workdir, env))
+            processes.append(start_process("loadtest_app.py", [
+                "--port", str(args.app_port),
+                "--transcript-chars", str(args.transcript_chars),
+                "--transcript-latency", str(args.transcript_latency),
+            ], workdir, env))
+            await wait_ready(f"{stub_url}/stats", processes[0])
+            await wait_ready(f"{app_url}/health", processes[1])
+
+            rng = random.Random(args.seed)
+            timeout = httpx.Timeout(args.request_timeout)
+            limits = httpx.Limits(max_connections=args.users * 2)
+            async with httpx.AsyncClient(base_url=app_url, timeout=timeout, limits=limits) as client:
+                users = []
+                expires = datetime.now(timezone.utc) + timedelta(hours=6)
+                for index in range(args.users):
+                    email = f"loadtest{index}@notesbuddy.dev"
+                    response = await client.post("/api/v1/auth/register", json={
+                        "email": email, "username": f"loadtest{index}", "password": "LoadTest123!"
+                    })
+                    response.raise_for_status()
+                    token = jwt.encode({"sub": email, "exp": expires}, SECRET_KEY, algorithm="HS256")
+                    users.append(VirtualUser(index, token, random.Random(rng.random())))
+
+                # Seed every user with a few notes so chat and export have targets
+                seed_results: dict = {}
+                for _ in range(args.seed_notes):
+                    seeded = await asyncio.gather(*(generate(client, user, "full") for user in users))
+                    for name, result in seeded:
+                        seed_results.setdefault(name, []).append(result)
+                await client.get("/__loadtest/loop-lag", params={"reset": True})
+
+                results: dict = {}
+                started = time.perf_counter()
+                deadline = started + args.duration
+                await asyncio.gather(*(run_user(client, user, mix, deadline, results) for user in users))
+                elapsed = time.perf_counter() - started
+
+                loop_lag = (await client.get("/__loadtest/loop-lag")).json()
+            async with httpx.AsyncClient() as stub_client:
+                stub_stats = (await stub_client.get(f"{stub_url}/stats")).json()
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "duration_s": round(elapsed, 3),
+        **summarise(results, elapsed),
+        "seed_errors": sum(
+            1 for entries in seed_results.values() for entry in entries
+            if entry.get("error") or not entry["status"] or entry["status"] >= 400
+        ),
+        "event_loop_lag": loop_lag,
+        "stub_llm": stub_stats,
+    }
+
+
+def print_table(report: dict):
+    print(f"{'operation':<18}{'count':>7}{'err':>5}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}",
+          file=sys.stderr)
+    for name, op in report["operations"].items():
+        latency, ttfb = op["latency_ms"], op["ttfb_ms"]
+        print(f"{name:<18}{op['count']:>7}{op['errors']:>5}{op['throughput_rps']:>8}"
+              f"{latency.get('p50', '-'):>10}{latency.get('p95', '-'):>10}{latency.get('p99', '-'):>10}"
+              f"{ttfb.get('p50', '-'):>10}", file=sys.stderr)
+    lag = report["event_loop_lag"]
+    print(f"total {report['requests']} requests, {report['throughput_rps']} req/s, {report['errors']} errors; "
+          f"event-loop lag p99 {lag.get('p99_ms', '-')} ms, max {lag.get('max_ms', '-')} ms", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured phase length in seconds")
+    parser.add_argument("--mix", default="generate=2,chat=3,list=4,export=1", help="Relative operation weights")
+    parser.add_argument("--seed-notes", type=int, default=2, help="Notes generated per user before measuring")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--request-timeout", type=float, default=300.0)
+    parser.add_argument("--app-port", type=int, default=8900)
+    parser.add_argument("--stub-port", type=int, default=8901)
+    parser.add_argument("--max-concurrent-requests", type=int, default=5, help="Backend MAX_CONCURRENT_REQUESTS")
+    parser.add_argument("--transcript-chars", type=int, default=20000)
+    parser.add_argument("--transcript-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--output-tokens", type=int, default=400)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_table(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
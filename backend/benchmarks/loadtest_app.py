@@ -0,0 +1,118 @@
+"""
+Run the NotesBuddy backend for load tests.
+
+Starts the real FastAPI app under uvicorn with two substitutions:
+  - YouTubeService.get_transcript returns a deterministic synthetic transcript
+    per video id after a configurable (blocking, like the real client) delay;
+  - an event-loop lag sampler, read and reset through GET /__loadtest/loop-lag.
+
+Point OPENROUTER_BASE_URL at benchmarks/stub_llm.py to avoid real LLM calls.
+benchmarks/loadtest.py starts this script itself; run it directly only to poke
+at the instrumented server by hand.
+
+Usage (from a scratch directory, so the SQLite fallback database lands there):
+    OPENROUTER_BASE_URL=http://127.0.0.1:8901/v1 python /path/to/backend/benchmarks/loadtest_app.py [--port 8900]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+WORDS = (
+    "today we will derive the gradient of the loss with respect to each weight "
+    "using the chain rule and then apply it to train a small neural network"
+).split()
+
+
+def fake_transcript(video_id: str, length: int) -> str:
+    rng = random.Random(hashlib.sha256(video_id.encode()).digest())
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+class LoopLagSampler:
+    """Measures how late a periodic sleep wakes up, i.e. how long the loop was blocked."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+    def snapshot(self, reset: bool = False) -> dict:
+        samples = sorted(self.samples)
+        if reset:
+            self.samples = []
+        if not samples:
+            return {"samples": 0}
+
+        def percentile(p):
+            return round(samples[min(len(samples) - 1, int(p / 100 * len(samples)))] * 1000, 3)
+
+        return {
+            "samples": len(samples),
+            "mean_ms": round(sum(samples) / len(samples) * 1000, 3),
+            "p50_ms": percentile(50),
+            "p99_ms": percentile(99),
+            "max_ms": round(samples[-1] * 1000, 3),
+        }
+
+
+def build_app(args):
+    from app.main import app
+    from app.services.youtube_service import YouTubeService
+    # Register every model so create_tables() builds the whole schema in the scratch database
+    from app.models import chat_model, notes_model, token_usage_model, user_pref_model  # noqa: F401
+
+    def get_transcript(video_id: str, language: str = "en") -> str:
+        time.sleep(args.transcript_latency)
+        return fake_transcript(video_id, args.transcript_chars)
+
+    YouTubeService.get_transcript = staticmethod(get_transcript)
+
+    sampler = LoopLagSampler()
+
+    @app.on_event("startup")
+    async def start_sampler():
+        app.state.loop_lag_task = asyncio.create_task(sampler.run())
+
+    @app.get("/__loadtest/loop-lag", include_in_schema=False)
+    async def loop_lag(reset: bool = False):
+        return sampler.snapshot(reset=reset)
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--transcript-chars", type=int, default=20000)
+    parser.add_argument("--transcript-latency", type=float, default=0.2)
+    return parser.parse_args(argv)
+
+
+def main():
+    import uvicorn
+
+    args = parse_args()
+    uvicorn.run(build_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark: cost of logging on the calling thread, print() vs the queued logger.
+
+stdout is pointed at a pipe drained by a deliberately slow reader (a busy log
+collector), then each variant emits --messages lines and reports per-call
+latency on the emitting thread:
+  print             synchronous print(), as the code used to do
+  logger.info       app.core.logger JSON pipeline (queued, written by a thread)
+  logger.debug      below LOG_LEVEL, filtered before formatting
+  debug sampled     LOG_SAMPLE_RATES={"DEBUG": 0.01}, 1% of requests kept
+
+It also measures the per-request overhead of RequestLoggingMiddleware on a
+trivial in-process ASGI app.
+
+Usage (from backend/):
+    python benchmarks/logging_overhead.py [--messages 20000] [--requests 2000] [--reader-delay 0.001]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def slow_pipe(reader_delay: float):
+    """Return a line-buffered text stream whose reader drains 4 KiB per `reader_delay` seconds."""
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, "rb") as reader:
+            while reader.read1(4096):
+                time.sleep(reader_delay)
+
+    threading.Thread(target=drain, daemon=True).start()
+    return os.fdopen(write_fd, "w", buffering=1)
+
+
+def summarise(timings: list[float]) -> dict:
+    timings = sorted(timings)
+    return {
+        "mean_us": round(statistics.fmean(timings) * 1e6, 2),
+        "p50_us": round(timings[len(timings) // 2] * 1e6, 2),
+        "p99_us": round(timings[int(len(timings) * 0.99)] * 1e6, 2),
+        "max_us": round(timings[-1] * 1e6, 2),
+    }
+
+
+def time_calls(func, count: int) -> list[float]:
+    timings = []
+    for i in range(count):
+        start = time.perf_counter()
+        func(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def request_overhead(requests: int) -> dict:
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+    from app.core.logger import RequestLoggingMiddleware
+
+    async def ok(request):
+        return PlainTextResponse("ok")
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/", "raw_path": b"/", "query_string": b"", "headers": [],
+        "http_version": "1.1", "scheme": "http", "server": ("bench", 80), "client": ("bench", 1), "root_path": "",
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    results = {}
+    for name, app in (
+        ("without middleware", Starlette(routes=[Route("/", ok)])),
+        ("with RequestLoggingMiddleware", RequestLoggingMiddleware(Starlette(routes=[Route("/", ok)]))),
+    ):
+        for _ in range(100):
+            await app(dict(scope), receive, send)
+        start = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), receive, send)
+        results[name] = round((time.perf_counter() - start) / requests * 1e6, 2)
+    results["overhead_us_per_request"] = round(results["with RequestLoggingMiddleware"] - results["without middleware"], 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--reader-delay", type=float, default=0.001)
+    args = parser.parse_args()
+
+    real_stdout = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+    sys.stdout = slow_pipe(args.reader_delay)
+
+    from prometheus_client import REGISTRY
+    from app.core import logger as app_logger
+    from app.core.config import settings
+
+    settings.LOG_LEVEL = "INFO"
+    settings.LOG_SAMPLE_RATES = {}
+    log = app_logger.get_logger("app.bench")
+    line = "Splitting transcript into chunks for note generation"
+
+    results = {}
+    results["print"] = summarise(time_calls(lambda i: print(f"{line} {i}"), args.messages))
+    results["logger.info"] = summarise(time_calls(lambda i: log.info(line, extra={"chunk": i}), args.messages))
+    results["logger.debug (below level)"] = summarise(time_calls(lambda i: log.debug(line, extra={"chunk": i}), args.messages))
+
+    # Rebuild the pipeline with DEBUG enabled but sampled at 1% of requests
+    app_logger.shutdown_logging()
+    settings.LOG_LEVEL = "DEBUG"
+    settings.LOG_SAMPLE_RATES = {"DEBUG": 0.01}
+    log = app_logger.get_logger("app.bench")
+
+    def sampled(i):
+        token = app_logger.request_id_var.set(f"request-{i}")
+        log.debug(line, extra={"chunk": i})
+        app_logger.request_id_var.reset(token)
+
+    results["logger.debug (sampled 1%)"] = summarise(time_calls(sampled, args.messages))
+
+    results["request_middleware_us"] = asyncio.run(request_overhead(args.requests))
+    results["dropped_records"] = REGISTRY.get_sample_value("notesbuddy_logs_dropped_total")
+
+    real_stdout.write(json.dumps(results, indent=2) + "\n")
+    real_stdout.flush()
+    os._exit(0)  # don't wait for the slow reader to drain what's left
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Stub OpenAI-compatible chat completions server for load tests.
+
+Serves POST /v1/chat/completions (streaming and non-streaming) with synthetic
+markdown notes at a configurable token rate, so the backend can be exercised
+without spending OpenRouter credits. The classification prompt always gets
+"YES". A fraction of requests can be rejected with HTTP 429 to exercise the
+client's retry path. GET /stats returns request counters.
+
+Usage (from backend/):
+    python benchmarks/stub_llm.py [--port 8901] [--tokens-per-second 200] [--first-token-latency 0.3]
+                                  [--output-tokens 400] [--rate-limit-ratio 0.0]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+WORDS = (
+    "gradient descent neural network layer weight bias activation function loss "
+    "optimization learning rate backpropagation matrix vector derivative chain rule"
+).split()
+
+CLASSIFICATION_MARKER = 'ONLY answer with "YES" or "NO"'
+
+
+def synthetic_tokens(rng: random.Random, count: int) -> list[str]:
+    """Markdown-ish note split into ~4-character tokens like a real stream."""
+    tokens = ["# Stub", " Lecture", " Notes", "\n\n", "## Key", " Concepts", "\n\n"]
+    while len(tokens) < count:
+        if rng.random() < 0.08:
+            tokens.append("\n\n- ")
+        tokens.append(" " + rng.choice(WORDS))
+    return tokens[:count]
+
+
+def build_app(args) -> Starlette:
+    rng = random.Random(args.seed)
+    stats = {"requests": 0, "streamed": 0, "rate_limited": 0, "tokens": 0}
+
+    def chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+        payload = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+
+        if rng.random() < args.rate_limit_ratio:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded (stub)", "type": "rate_limit_error", "code": 429}},
+                status_code=429,
+                headers={"retry-after": "0"},
+            )
+
+        prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+        tokens = ["YES"] if CLASSIFICATION_MARKER in prompt else synthetic_tokens(rng, args.output_tokens)
+        stats["tokens"] += len(tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = body.get("model", "stub")
+        delay = 1.0 / args.tokens_per_second if args.tokens_per_second > 0 else 0.0
+
+        if not body.get("stream"):
+            await asyncio.sleep(args.first_token_latency + delay * len(tokens))
+            content = "".join(tokens)
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(tokens), "total_tokens": len(prompt) // 4 + len(tokens)},
+            })
+
+        stats["streamed"] += 1
+
+        async def stream():
+            await asyncio.sleep(args.first_token_latency)
+            yield chunk(completion_id, model, {"role": "assistant", "content": ""})
+            for token in tokens:
+                yield chunk(completion_id, model, {"content": token})
+                if delay:
+                    await asyncio.sleep(delay)
+            yield chunk(completion_id, model, {}, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", completions, methods=["POST"]),
+        Route("/stats", get_stats),
+    ])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--output-tokens", type=int, default=400)
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    return parser.parse_args(argv)
+
+
+def main():
+    import uvicorn
+
+    args = parse_args()
+    uvicorn.run(build_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark: caption snippet objects vs. the array-backed Transcript.
+
+Builds a synthetic caption track as youtube_transcript_api snippet objects
+(what transcript.fetch() returns) and as a Transcript (joined text plus
+start/duration/offset arrays), then reports the memory each holds, the
+stored size of the segment arrays, and the cost of building one and of
+mapping a chunk back to its time range.
+
+Usage (from backend/):
+    python benchmarks/transcript_segments.py [--segments 6000] [--repeat 20]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from youtube_transcript_api import FetchedTranscriptSnippet  # noqa: E402
+from app.models.notes_model import compress_bytes  # noqa: E402
+from app.utils.transcript import Transcript  # noqa: E402
+from benchmarks.transcript_storage import WORDS  # noqa: E402
+
+
+def synthetic_snippets(segments: int) -> list:
+    rng = random.Random(42)
+    snippets = []
+    start = 0.0
+    for _ in range(segments):
+        duration = round(rng.uniform(1.5, 6.0), 3)
+        text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+        snippets.append(FetchedTranscriptSnippet(text=text, start=round(start, 3), duration=duration))
+        start += duration
+    return snippets
+
+
+def allocated(build) -> tuple[object, int]:
+    """Build an object and return it with the bytes still allocated for it."""
+    tracemalloc.start()
+    value = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return value, size
+
+
+def median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segments", type=int, default=6000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # Deep copies, so each measurement only counts what its own structure allocates
+    source = synthetic_snippets(args.segments)
+    snippets, snippet_bytes = allocated(lambda: [
+        FetchedTranscriptSnippet(text="".join(s.text), start=s.start, duration=s.duration) for s in source
+    ])
+    transcript, transcript_bytes = allocated(lambda: Transcript.from_snippets(source))
+    text_bytes = sys.getsizeof(str(transcript))
+
+    payload = transcript.segments_to_bytes()
+    assert Transcript.from_bytes(str(transcript), payload).starts_ms == transcript.starts_ms
+
+    rng = random.Random(7)
+    spans = [(position, position + 500) for position in (rng.randrange(len(transcript)) for _ in range(1000))]
+
+    print(json.dumps({
+        "segments": args.segments,
+        "transcript_chars": len(transcript),
+        "memory_bytes": {
+            "snippet_objects": snippet_bytes,
+            "transcript_text_and_arrays": transcript_bytes,
+            "of_which_text": text_bytes,
+        },
+        "stored_segment_bytes": {"raw": len(payload), "compressed": len(compress_bytes(payload)[1])},
+        "build_ms": median_ms(lambda: Transcript.from_snippets(source), args.repeat),
+        "decode_ms": median_ms(lambda: Transcript.from_bytes(str(transcript), payload), args.repeat),
+        "time_range_x1000_ms": median_ms(lambda: [transcript.time_range(a, b) for a, b in spans], args.repeat),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark: inline transcript column vs. deferred, compressed transcript table.
+
+Builds two SQLite databases with the same synthetic notes, one with the old
+layout (notes.transcript inline) and one with the new layout (transcripts in
+note_transcripts, compressed with zstd/zlib), then reports the bytes loaded
+per `db.query(Notes)` row and the latency of the lookups used by /generate,
+get_note and the chat routes.
+
+Usage (from backend/):
+    python benchmarks/transcript_storage.py [--notes 500] [--transcript-chars 120000]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.models.notes_model import compress_text  # noqa: E402
+
+WORDS = (
+    "gradient descent neural network layer weight bias activation function loss "
+    "optimization learning rate backpropagation matrix vector derivative chain rule "
+    "probability distribution sample variance mean estimator model training data "
+    "so basically we can see that here and then if you look at this one right"
+).split()
+
+
+def synthetic_text(rng: random.Random, length: int) -> str:
+    words = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        words.append(word)
+        size += len(word) + 1
+    return " ".join(words)[:length]
+
+
+def build(path: str, layout: str, notes: int, transcript_chars: int) -> None:
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    transcript_column = ", transcript VARCHAR" if layout == "inline" else ""
+    conn.executescript(f"""
+        CREATE TABLE notes (
+            id INTEGER PRIMARY KEY, video_id VARCHAR NOT NULL, title VARCHAR NOT NULL,
+            notes VARCHAR NOT NULL{transcript_column}, language VARCHAR, style VARCHAR,
+            user_id INTEGER NOT NULL, created_at DATETIME, updated_at DATETIME
+        );
+        CREATE INDEX ix_notes_video_id ON notes (video_id);
+        CREATE INDEX ix_notes_user_id ON notes (user_id);
+        CREATE TABLE note_transcripts (
+            note_id INTEGER PRIMARY KEY, codec VARCHAR(10) NOT NULL,
+            raw_length INTEGER NOT NULL, data BLOB NOT NULL
+        );
+    """)
+    for i in range(notes):
+        transcript = synthetic_text(rng, transcript_chars)
+        body = synthetic_text(rng, transcript_chars // 8)
+        row = [f"video{i:06d}", f"Title {i}", body]
+        if layout == "inline":
+            row.append(transcript)
+        placeholders = ", ".join("?" for _ in row)
+        cursor = conn.execute(
+            f"INSERT INTO notes (video_id, title, notes{', transcript' if layout == 'inline' else ''}, "
+            f"language, style, user_id, created_at, updated_at) "
+            f"VALUES ({placeholders}, 'en', 'detailed', {i % 10}, datetime('now'), datetime('now'))",
+            row
+        )
+        if layout == "split":
+            codec, payload = compress_text(transcript)
+            conn.execute(
+                "INSERT INTO note_transcripts VALUES (?, ?, ?, ?)",
+                (cursor.lastrowid, codec, len(transcript), payload)
+            )
+    conn.commit()
+    conn.close()
+
+
+def timed(conn: sqlite3.Connection, sql: str, params_list: list, repeat: int = 3) -> float:
+    """Median per-query latency in milliseconds."""
+    samples = []
+    for _ in range(repeat):
+        for params in params_list:
+            start = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def measure(path: str, layout: str, notes: int) -> dict:
+    conn = sqlite3.connect(path)
+    ids = [(i,) for i in range(1, notes + 1, max(1, notes // 50))]
+    video_ids = [(f"video{i - 1:06d}", (i - 1) % 10) for (i,) in ids]
+
+    # Columns SQLAlchemy loads for db.query(Notes): the full row before, everything but
+    # the deferred notes body and the separate transcript after.
+    if layout == "inline":
+        row_columns = "id, video_id, title, notes, transcript, language, style, user_id, created_at, updated_at"
+        row_bytes_sql = "SELECT avg(length(notes) + length(transcript) + length(video_id) + length(title)) FROM notes"
+    else:
+        row_columns = "id, video_id, title, language, style, user_id, created_at, updated_at"
+        row_bytes_sql = "SELECT avg(length(video_id) + length(title)) FROM notes"
+
+    result = {
+        "layout": layout,
+        "db_file_bytes": os.path.getsize(path),
+        "avg_loaded_row_bytes": round(conn.execute(row_bytes_sql).fetchone()[0]),
+        "dedupe_lookup_ms": timed(
+            conn,
+            f"SELECT {row_columns} FROM notes WHERE video_id = ? AND user_id = ? AND language = 'en' AND style = 'detailed'",
+            video_ids
+        ),
+        "get_by_id_ms": timed(conn, f"SELECT {row_columns} FROM notes WHERE id = ?", ids),
+        "list_user_notes_ms": timed(conn, f"SELECT {row_columns} FROM notes WHERE user_id = ?", [(u,) for u in range(10)]),
+    }
+    if layout == "split":
+        result["avg_transcript_compressed_bytes"] = round(
+            conn.execute("SELECT avg(length(data)) FROM note_transcripts").fetchone()[0]
+        )
+    conn.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--transcript-chars", type=int, default=120000)
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in ("inline", "split"):
+            path = os.path.join(tmp, f"{layout}.db")
+            build(path, layout, args.notes, args.transcript_chars)
+            results.append(measure(path, layout, args.notes))
+
+    print(json.dumps({"notes": args.notes, "transcript_chars": args.transcript_chars, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# LLMService refuses to start without a key; no request is ever sent here
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
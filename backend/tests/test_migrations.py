@@ -0,0 +1,76 @@
+"""Migrations applied to a SQLite database created the way create_tables() creates it."""
+import os
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from app.core.database import Base
+from app.models import chat_model, generation_job_model, notes_model, token_usage_model, user_pref_model  # noqa: F401
+from app.services.search_service import SearchService
+
+BACKEND = os.path.join(os.path.dirname(__file__), "..")
+# The revision create_tables() matched before the first migration that rebuilds notes
+BASELINE_REVISION = "b6d1f0a2c847"
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    # env.py falls back to sqlite:///./notebuddy.db when no Postgres is configured
+    monkeypatch.chdir(tmp_path)
+    engine = create_engine(f"sqlite:///{tmp_path / 'notebuddy.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        SearchService.ensure_search_index(connection)
+    config = Config(os.path.join(BACKEND, "alembic.ini"))
+    command.stamp(config, BASELINE_REVISION)
+    yield engine, config
+    engine.dispose()
+
+
+def add_note(engine, note_id: int, title: str, body: str) -> None:
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO notes (id, video_id, title, notes, user_id, created_at) "
+            "VALUES (:id, 'video', :title, :notes, 1, CURRENT_TIMESTAMP)"
+        ), {"id": note_id, "title": title, "notes": body})
+
+
+def search(engine, query: str) -> list[int]:
+    with Session(engine) as db:
+        return [row["id"] for row in SearchService.search_notes(db, 1, query)]
+
+
+def test_search_index_follows_notes_after_upgrade(database):
+    engine, config = database
+    add_note(engine, 1, "Thermodynamics", "entropy always increases")
+
+    command.upgrade(config, "head")
+    add_note(engine, 2, "Linear algebra", "eigenvalues of a matrix")
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE notes SET notes = 'enthalpy and heat' WHERE id = 1"))
+
+    assert search(engine, "eigenvalues") == [2]
+    assert search(engine, "enthalpy") == [1]
+    assert search(engine, "entropy") == []
+
+
+def test_search_index_follows_notes_after_downgrade(database):
+    engine, config = database
+    command.upgrade(config, "head")
+    command.downgrade(config, BASELINE_REVISION)
+    add_note(engine, 1, "Linear algebra", "eigenvalues of a matrix")
+
+    assert search(engine, "eigenvalues") == [1]
+
+
+def test_keyset_index_keeps_its_order_after_upgrade(database):
+    engine, config = database
+    command.upgrade(config, "head")
+    with engine.connect() as connection:
+        sql = connection.execute(text(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND name = 'ix_notes_user_created'"
+        )).scalar_one()
+    assert "created_at DESC" in sql and "id DESC" in sql